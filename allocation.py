@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+
+def _per_country(value, index, default):
+    """
+    Broadcast a scalar, dict or Series bound to a float array aligned with index.
+    """
+    if value is None:
+        return np.full(len(index), default, dtype=np.float64)
+    if np.isscalar(value):
+        return np.full(len(index), value, dtype=np.float64)
+    return pd.Series(value, dtype=np.float64).reindex(index).fillna(default).to_numpy()
+
+
+def bounded_quotas(weights, total, lower, upper):
+    """
+    Split `total` in proportion to `weights` subject to per-entry bounds.
+
+    Finds the scale factor lam with sum(clip(lam * weights, lower, upper)) == total,
+    so every entry not held at a bound gets exactly the same share per unit of
+    weight. All breakpoints of that piecewise-linear sum are evaluated at once;
+    no iteration over entries is needed. Entries not held at a bound get
+    weights / weights.sum() * remaining, which is the plain proportional quota
+    when no bound is active.
+
+    Parameters:
+    - weights: Non-negative float array.
+    - total: Amount to split; must lie between lower.sum() and upper.sum().
+    - lower, upper: Float arrays of bounds (upper may be inf).
+    Returns:
+    - Float array of quotas summing to total.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+    if not len(weights):
+        return np.zeros(0)
+
+    positive = weights > 0
+    if upper[positive].sum() + lower[~positive].sum() < total:
+        # More than the weighted entries can hold: fill them and share the rest
+        # equally among the zero-weight ones.
+        quotas = np.where(positive, upper, lower)
+        rest = ~positive
+        quotas[rest] = bounded_quotas(np.ones(rest.sum()), total - upper[positive].sum(), lower[rest], upper[rest])
+        return quotas
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lower_at = np.where(positive, lower / weights, np.inf)
+        upper_at = np.where(positive, upper / weights, np.inf)
+    breakpoints = np.concatenate([lower_at[positive], upper_at[positive]])
+    breakpoints = np.unique(breakpoints[np.isfinite(breakpoints)])
+    breakpoints = np.concatenate([[0.0], breakpoints[breakpoints > 0]])
+    sums = np.clip(np.outer(breakpoints, weights), lower, upper).sum(axis=1)
+
+    # On the segment [breakpoints[k], breakpoints[k + 1]) holding the solution the
+    # same entries are between their bounds; the others sit at the bound they hit.
+    # Comparing against the breakpoints themselves keeps this exact in floating point.
+    k = max(np.searchsorted(sums, total, side="right") - 1, 0)
+    lam = breakpoints[k]
+    free = positive & (lower_at <= lam) & (upper_at > lam)
+
+    quotas = np.where(positive & (upper_at <= lam), upper, lower)
+    if free.any():
+        remaining = total - quotas[~free].sum()
+        quotas[free] = np.clip(weights[free] / weights[free].sum() * remaining, lower[free], upper[free])
+    return quotas
+
+
+def allocate(weights, total, minimum=0, maximum=None, capacity=None, fixed=None):
+    """
+    Apportion `total` hexes among countries by the largest-remainder (Hamilton) method.
+
+    The bounded proportional quotas are computed in one vectorized pass (see
+    bounded_quotas): countries whose share would fall below `minimum` are held at
+    it, countries whose share would exceed `maximum` or their `capacity` are held
+    there, and the surplus or shortfall is redistributed among the rest in
+    proportion to their weights. Quotas are then floored and the leftover seats
+    go to the largest remainders, ties to the country listed first. Without
+    active bounds this is exactly the classic Hamilton allocation.
+
+    Parameters:
+    - weights: pd.Series of non-negative weights indexed by country.
+    - total: Number of hexes to allocate.
+    - minimum: Minimum per country, a scalar or a Series/dict by country (default 0).
+               Reduced to a country's capacity or maximum where those are lower.
+    - maximum: Optional maximum per country, scalar or Series/dict.
+    - capacity: Optional number of cells available per country (Series/dict);
+                countries missing from it have none.
+    - fixed: Optional dict {country: count} of exact allocations, capped at capacity.
+    Returns:
+    - pd.Series of int64 counts indexed like weights. It sums to `total`, unless
+      the maximums and capacities cannot hold that many hexes, in which case
+      every country is filled to its upper bound.
+    Raises:
+    - ValueError for negative or missing weights, unknown fixed countries, fixed
+      counts above total, or minimums that cannot fit in total.
+    """
+    weights = pd.Series(weights, dtype=np.float64)
+    index = weights.index
+    values = weights.to_numpy()
+    if np.isnan(values).any() or (values < 0).any() or np.isinf(values).any():
+        raise ValueError("Weights must be finite and non-negative")
+
+    upper = _per_country(maximum, index, np.inf)
+    if capacity is not None:
+        upper = np.minimum(upper, _per_country(capacity, index, 0))
+    upper = np.floor(upper)
+    lower = np.minimum(np.ceil(_per_country(minimum, index, 0)), upper)
+
+    counts = np.zeros(len(index), dtype=np.int64)
+    free = np.ones(len(index), dtype=bool)
+    for country, count in (fixed or {}).items():
+        if country not in index:
+            raise ValueError(f"{country} not found in data")
+        position = index.get_loc(country)
+        counts[position] = min(int(count), upper[position])
+        free[position] = False
+
+    remaining = int(total) - int(counts.sum())
+    if remaining < 0:
+        raise ValueError(f"Fixed allocations ({int(counts.sum())}) exceed total_count ({total})")
+    if lower[free].sum() > remaining:
+        raise ValueError(f"Minimums need {int(lower[free].sum())} hexes but only {remaining} are left to allocate")
+
+    if upper[free].sum() <= remaining:
+        counts[free] = upper[free]
+        return pd.Series(counts, index=index)
+
+    quotas = bounded_quotas(values[free], remaining, lower[free], upper[free])
+    base = np.minimum(np.floor(quotas), upper[free])
+    seats = remaining - int(base.sum())
+    if seats > 0:
+        remainders = np.where(base < upper[free], quotas - base, -np.inf)
+        base[np.argsort(-remainders, kind="stable")[:seats]] += 1
+    counts[free] = base
+    return pd.Series(counts, index=index)
@@ -0,0 +1,224 @@
+import csv
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import h3raster
+import queries
+from columnstore import ColumnStore
+from params import parse_select
+
+OUTPUT_FORMATS = ("csv", "parquet")
+SUMMARY_FILE = "summary.csv"
+
+
+def _read_scenario_file(path):
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        with open(path, newline="") as f:
+            rows = [{k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip() != ""}
+                    for row in csv.DictReader(f)]
+        for row in rows:
+            if "countries" in row:
+                row["countries"] = [c for c in re.split(r"[;\s]+", row["countries"]) if c]
+        return rows
+    if suffix in (".yaml", ".yml"):
+        if importlib.util.find_spec("yaml") is None:
+            raise ValueError("Reading YAML scenario files needs PyYAML; use JSON or CSV instead")
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f)
+    if suffix == ".json":
+        with open(path) as f:
+            return json.load(f)
+    raise ValueError(f"Unsupported scenario file '{path}', expected .json, .csv, .yaml or .yml")
+
+
+def load_scenarios(path, defaults=None):
+    """
+    Read a file of selection scenarios.
+
+    A JSON or YAML file holds either a list of scenarios or an object with any of
+    'defaults' (parameters shared by every scenario), 'scenarios' (a list) and
+    'grid' (parameter -> list of values; every combination becomes a scenario).
+    A CSV file has one scenario per row, named by its header; empty cells are
+    left unset and 'countries' is separated by spaces or semicolons. Each
+    scenario takes the parameters of get_top_centroids_by_strategy plus an
+    optional 'name'.
+
+    Parameters:
+    - path: Scenario file (.json, .csv, .yaml or .yml).
+    - defaults: Parameters applied under each file's own values, e.g. from the command line.
+    Returns:
+    - List of (name, params) tuples with params validated like a /select request.
+    Raises:
+    - ValueError for unknown or invalid parameters and duplicate names.
+    """
+    content = _read_scenario_file(path)
+    if isinstance(content, list):
+        content = {"scenarios": content}
+    if not isinstance(content, dict):
+        raise ValueError(f"{path} must hold a list of scenarios or an object")
+    unknown = set(content) - {"defaults", "scenarios", "grid"}
+    if unknown:
+        raise ValueError(f"Unknown keys in {path}: {sorted(unknown)}")
+
+    base = {**(defaults or {}), **(content.get("defaults") or {})}
+    entries = list(content.get("scenarios") or [])
+    grid = content.get("grid") or {}
+    if grid:
+        names = list(grid)
+        for values in itertools.product(*(v if isinstance(v, list) else [v] for v in grid.values())):
+            entries.append(dict(zip(names, values)))
+    if not entries:
+        entries = [{}]
+
+    scenarios, seen = [], set()
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Scenario {i} must be an object")
+        entry = {**base, **entry}
+        name = str(entry.pop("name", f"scenario_{i:03d}"))
+        if not re.fullmatch(r"[\w.-]+", name):
+            raise ValueError(f"Scenario name '{name}' may only use letters, digits, '_', '-' and '.'")
+        if name in seen:
+            raise ValueError(f"Duplicate scenario name '{name}'")
+        seen.add(name)
+        try:
+            params = parse_select({k: v for k, v in entry.items() if v is not None})
+        except ValueError as e:
+            raise ValueError(f"Scenario '{name}': {e}")
+        scenarios.append((name, params))
+    return scenarios
+
+
+_worker_stores = {}
+
+
+def _load_stores(resolutions, backend, db_path):
+    # A resolution that cannot be loaded fails only the scenarios that use it.
+    stores = {}
+    for resolution in sorted(set(resolutions)):
+        try:
+            if backend == "snapshot":
+                stores[resolution] = queries.load_snapshot(resolution)
+            else:
+                stores[resolution] = ColumnStore.from_sqlite(db_path, resolution)
+        except ValueError as e:
+            stores[resolution] = e
+    return stores
+
+
+def _init_batch_worker(resolutions, backend, db_path):
+    # Forked workers inherit the parent's stores; only spawned ones load their own.
+    global _worker_stores
+    if not _worker_stores:
+        _worker_stores = _load_stores(resolutions, backend, db_path)
+    # Forked workers also inherit the parent's global random state; give each its own.
+    np.random.seed()
+
+
+def _write_output(df, output_dir, name, fmt):
+    if fmt == "parquet":
+        path = Path(output_dir) / name
+        df.to_parquet(path, partition_cols=["country"], index=False)
+    else:
+        path = Path(output_dir) / f"{name}.csv"
+        df.to_csv(path, index=False)
+    return path
+
+
+def _run_scenario(name, params, output_dir, fmt, png=False):
+    start = time.perf_counter()
+    row = {"name": name, **{k: json.dumps(v) if isinstance(v, list) else v for k, v in params.items()}}
+    try:
+        store = _worker_stores[params["resolution"]]
+        if isinstance(store, Exception):
+            raise store
+        _, allocation, df = queries.get_top_centroids_by_strategy(**params, store=store)
+        path = _write_output(df, output_dir, name, fmt)
+        if png:
+            h3raster.plot_cells_png(df["h3"].tolist(), Path(output_dir) / f"{name}.png", df["population"].to_numpy(),
+                                    title=name)
+    except Exception as e:
+        return {**row, "error": str(e), "seconds": round(time.perf_counter() - start, 3)}
+    return {
+        **row,
+        "cells": len(df),
+        "population": float(df["population"].sum()),
+        "allocated_countries": int((pd.Series(allocation) > 0).sum()),
+        "output": str(path),
+        "error": None,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def run_scenarios(scenarios, output_dir, workers=None, backend="sqlite", fmt="csv", db_path=None, png=False):
+    """
+    Run many selections against one loaded copy of each resolution.
+
+    Every resolution the scenarios use is loaded once into a ColumnStore (from
+    SQLite, or memory-mapped from its snapshot with backend='snapshot'). With
+    more than one worker the scenarios run in a process pool; where the 'fork'
+    start method exists the workers share the parent's stores copy-on-write
+    instead of loading their own. Each scenario writes its cells to the output
+    directory, and a summary of all of them goes to summary.csv there.
+
+    Parameters:
+    - scenarios: List of (name, params) tuples, as returned by load_scenarios().
+    - output_dir: Directory for the outputs; created if missing.
+    - workers: Worker processes (default: the number of CPUs); 1 runs in-process.
+    - backend: 'sqlite' or 'snapshot'.
+    - fmt: 'csv' for one <name>.csv per scenario, or 'parquet' for one <name>/
+           dataset partitioned by country (needs pyarrow).
+    - db_path: Population database, defaults to queries.DB_PATH.
+    - png: Also render each scenario's cells to <name>.png (h3raster.plot_cells_png),
+           in the workers and without a display.
+    Returns:
+    - DataFrame with one summary row per scenario, in scenario order. Failed
+      scenarios have their error in the 'error' column.
+    """
+    global _worker_stores
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{fmt}', expected one of {OUTPUT_FORMATS}")
+    if fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("Parquet output needs pyarrow; use fmt='csv' instead")
+    if backend not in queries.BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {queries.BACKENDS}")
+    db_path = queries.DB_PATH if db_path is None else str(db_path)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(scenarios)) or 1
+
+    resolutions = [params["resolution"] for _, params in scenarios]
+    forking = "fork" in multiprocessing.get_all_start_methods()
+    if workers == 1 or forking:
+        _worker_stores = _load_stores(resolutions, backend, db_path)
+    try:
+        if workers == 1:
+            rows = [_run_scenario(name, params, output_dir, fmt, png) for name, params in scenarios]
+        else:
+            context = multiprocessing.get_context("fork" if forking else None)
+            initargs = (resolutions, backend, db_path)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_batch_worker,
+                                     initargs=initargs) as executor:
+                futures = [
+                    executor.submit(_run_scenario, name, params, output_dir, fmt, png) for name, params in scenarios
+                ]
+                rows = [future.result() for future in futures]
+    finally:
+        _worker_stores = {}
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(output_dir / SUMMARY_FILE, index=False)
+    return summary
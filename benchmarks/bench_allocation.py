@@ -0,0 +1,68 @@
+"""
+Time allocation.allocate() against the one-hex-at-a-time idxmax loop it replaced,
+for many countries and a large total, with and without bounds.
+
+Usage:
+    python benchmarks/bench_allocation.py [--countries 250] [--total 1000000]
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from allocation import allocate
+
+
+def legacy_allocate(weights, total, min_per_country=0):
+    allocation = (weights / weights.sum() * total).apply(math.floor)
+    allocation = allocation.apply(lambda x: max(min_per_country, x))
+    while allocation.sum() < total:
+        extra_country = ((weights / weights.sum() * total) - allocation).idxmax()
+        allocation.loc[extra_country] += 1
+    return allocation
+
+
+def timed(label, fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<40} {best * 1000:10.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--countries", type=int, default=250)
+    parser.add_argument("--total", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    index = [f"C{i:03d}" for i in range(args.countries)]
+    population = pd.Series(rng.lognormal(15, 2, args.countries).round(), index=index)
+    # Cell counts loosely follow population, so the largest countries bind.
+    capacity = pd.Series((population / population.sum() * args.total * rng.uniform(0.3, 3, args.countries)).round(),
+                         index=index).astype(np.int64)
+
+    print(f"{args.countries} countries, {args.total:,} hexes")
+    legacy = timed("legacy idxmax loop", lambda: legacy_allocate(population, args.total), repeat=1)
+    plain = timed("allocate()", lambda: allocate(population, args.total))
+    assert (legacy.to_numpy() == plain.to_numpy()).all(), "unbounded allocation differs from the legacy loop"
+
+    timed("allocate(sqrt weights)", lambda: allocate(np.sqrt(population), args.total))
+    bounded = timed("allocate(min, max, capacity, fixed)", lambda: allocate(
+        population, args.total, minimum=10, maximum=args.total // 20, capacity=capacity, fixed={index[0]: 1000}))
+    binding = int((bounded == np.minimum(capacity, args.total // 20)).sum())
+    print(f"  bounded allocation sums to {int(bounded.sum()):,}; {binding} countries at their upper bound")
+
+
+if __name__ == "__main__":
+    main()
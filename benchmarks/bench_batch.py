@@ -0,0 +1,56 @@
+"""
+Time a parameter sweep run as separate get_top_centroids_by_strategy() calls against
+SQLite versus batch.run_scenarios() on one loaded store per resolution.
+
+Usage:
+    python benchmarks/bench_batch.py [--db PATH] [--resolution 8] [--counts 1000 5000] [--workers 2]
+"""
+
+import argparse
+import itertools
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import queries
+from batch import run_scenarios
+
+METHODS = ("population", "uniform", "sqrt", "log")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--resolution", type=int, default=8)
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--urban-fractions", type=float, nargs="+", default=[1.0, 0.8, 0.5])
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    if args.db:
+        queries.DB_PATH = args.db
+
+    scenarios = [
+        (f"s{i:03d}", {"total_count": count, "resolution": args.resolution, "method": method,
+                       "urban_fraction": fraction, "seed": i})
+        for i, (method, count, fraction) in enumerate(itertools.product(METHODS, args.counts, args.urban_fractions))
+    ]
+    print(f"{len(scenarios)} scenarios at r{args.resolution}")
+
+    start = time.perf_counter()
+    for _, params in scenarios:
+        queries.get_top_centroids_by_strategy(**params)
+    print(f"  separate SQLite calls       {time.perf_counter() - start:8.2f} s")
+
+    for workers in sorted({1, args.workers}):
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            summary = run_scenarios(scenarios, output_dir, workers=workers)
+            elapsed = time.perf_counter() - start
+        failed = summary["error"].notna().sum()
+        print(f"  run_scenarios(workers={workers})  {elapsed:8.2f} s ({failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark bulk H3 centroid computation against the per-cell pandas path
+populate_db used before cells_to_latlngs.
+
+Usage:
+    python benchmarks/bench_centroids.py [--count 10000000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import h3
+import numpy as np
+import pandas as pd
+from h3.api import numpy_int as h3_int
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import h3raster
+
+
+def make_cells(count, resolution=8):
+    """Return at least `count` distinct uint64 cells by uncompacting res-2 cells around Europe."""
+    cells = []
+    total = 0
+    ring = 0
+    origin = h3_int.latlng_to_cell(48.0, 10.0, 2)
+    while total < count:
+        for parent in h3_int.grid_ring(origin, ring):
+            children = h3_int.cell_to_children(parent, resolution)
+            cells.append(children)
+            total += len(children)
+            if total >= count:
+                break
+        ring += 1
+    return np.concatenate(cells)[:count].astype(np.uint64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    cells = make_cells(args.count)
+    strings = pd.Series(h3raster.cells_to_str(cells))
+    print(f"{len(cells):,} r8 cells")
+
+    start = time.perf_counter()
+    legacy = strings.map(lambda c: h3.cell_to_latlng(c))
+    legacy_lat, legacy_lng = zip(*legacy)
+    legacy_s = time.perf_counter() - start
+    print(f"per-cell Series.map:         {legacy_s:8.2f} s")
+
+    start = time.perf_counter()
+    lats, lngs = h3raster.cells_to_latlngs(cells)
+    bulk_s = time.perf_counter() - start
+    print(f"cells_to_latlngs (uint64):   {bulk_s:8.2f} s  ({legacy_s / bulk_s:.1f}x)")
+
+    start = time.perf_counter()
+    h3raster.cells_to_latlngs(strings.to_numpy())
+    str_s = time.perf_counter() - start
+    print(f"cells_to_latlngs (str):      {str_s:8.2f} s  ({legacy_s / str_s:.1f}x)")
+
+    assert np.allclose(lats, legacy_lat) and np.allclose(lngs, legacy_lng)
+
+
+if __name__ == "__main__":
+    main()
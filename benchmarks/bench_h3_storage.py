@@ -0,0 +1,95 @@
+"""
+Compare TEXT and INTEGER (WITHOUT ROWID) h3 storage for a synthetic r8 table:
+database size, the query_sqlite scan, and keyed lookups.
+
+Usage:
+    python benchmarks/bench_h3_storage.py [--count 5000000]
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import h3raster
+import populate_db
+from bench_centroids import make_cells
+
+COUNTRIES = ['GBR', 'ITA', 'DEU', 'ESP', 'USA', 'DNK', 'FRA', 'PRT', 'AUS', 'AUT',
+             'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'EST', 'FIN', 'GRC', 'HUN', 'IRL',
+             'LVA', 'LTU', 'LUX', 'MLT', 'NLD', 'POL', 'ROU', 'SVK', 'SVN', 'SWE']
+
+
+def make_frame(count, seed=0):
+    rng = np.random.default_rng(seed)
+    cells = make_cells(count)
+    lats, lngs = h3raster.cells_to_latlngs(cells)
+    return pd.DataFrame({
+        "h3": h3raster.cells_to_str(cells),
+        "population": rng.lognormal(3, 2, count).round(),
+        "country": rng.choice(COUNTRIES + [None], count),
+        "lat": lats,
+        "lng": lngs,
+    })
+
+
+def timed(label, fn, repeat=3):
+    best = min(_time(fn) for _ in range(repeat))
+    print(f"  {label:<32} {best * 1000:10.1f} ms")
+
+
+def _time(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=5_000_000)
+    args = parser.parse_args()
+
+    df = make_frame(args.count)
+    probe = df["h3"].sample(10_000, random_state=0).tolist()
+    scan = f"SELECT country, population, h3 FROM {{table}} WHERE country IN ({', '.join('?' * len(COUNTRIES))}) ORDER BY population DESC"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_db = Path(tmp) / "text.db"
+        conn = sqlite3.connect(text_db)
+        df.to_sql("hex_pops_r8", conn, index=False, chunksize=5000, method="multi")
+        conn.execute("CREATE INDEX idx_hex_pops_r8_h3 ON hex_pops_r8(h3)")
+        conn.commit()
+
+        int_db = Path(tmp) / "int.db"
+        int_conn = sqlite3.connect(int_db)
+        populate_db.write_hex_table(int_conn, "hex_pops_r8", df, integer_h3=True)
+
+        print(f"{args.count:,} r8 rows")
+        print(f"  TEXT db size:    {text_db.stat().st_size / 2**20:8.1f} MiB (with h3 index)")
+        print(f"  INTEGER db size: {int_db.stat().st_size / 2**20:8.1f} MiB")
+
+        probe_int = h3raster.cells_to_int(probe).view(np.int64).tolist()
+        placeholders = ", ".join("?" * len(probe))
+
+        print("TEXT")
+        timed("query_sqlite scan", lambda: pd.read_sql_query(scan.format(table="hex_pops_r8"), conn, params=COUNTRIES))
+        timed("10k keyed lookups", lambda: conn.execute(
+            f"SELECT population FROM hex_pops_r8 WHERE h3 IN ({placeholders})", probe).fetchall())
+        print("INTEGER")
+        timed("query_sqlite scan", lambda: pd.read_sql_query(scan.format(table="hex_pops_r8"), int_conn, params=COUNTRIES)
+              ["h3"].to_numpy().view(np.uint64))
+        timed("10k keyed lookups", lambda: int_conn.execute(
+            f"SELECT population FROM hex_pops_r8 WHERE h3 IN ({placeholders})", probe_int).fetchall())
+
+        conn.close()
+        int_conn.close()
+
+
+if __name__ == "__main__":
+    main()
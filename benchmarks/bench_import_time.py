@@ -0,0 +1,72 @@
+"""
+Startup budget for the CSV-only samplecells path: import it in a fresh interpreter
+with `python -X importtime`, report the slowest modules, and exit non-zero when
+the import exceeds the budget or pulls in a plotting/geo dependency.
+
+Usage:
+    python benchmarks/bench_import_time.py [--module samplecells] [--budget-ms 1000] [--repeat 5]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Only the plotting, ZIP and timezone-fallback code paths may load these.
+LAZY_MODULES = ("geopandas", "shapely", "folium", "matplotlib", "contextily", "timezonefinder", "pycountry")
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter and return {module name: (cumulative microseconds, depth)}.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(cumulative), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="samplecells")
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times[args.module][0])
+    total_ms = best[args.module][0] / 1000
+
+    direct = {name: us for name, (us, depth) in best.items() if depth == 1}
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {args.repeat}, budget {args.budget_ms:.0f} ms)")
+    for name, us in sorted(direct.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<32} {us / 1000:8.1f} ms")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    loaded = sorted(name for name in best if name.split(".")[0] in LAZY_MODULES)
+    if loaded:
+        failures.append(f"eagerly imported: {', '.join(loaded[:10])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
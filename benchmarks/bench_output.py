@@ -0,0 +1,61 @@
+"""
+Peak memory and time of writing a large selection to CSV: the whole DataFrame from
+get_top_centroids_by_strategy() versus streaming stream_top_centroids_by_strategy()
+chunks through output.write_chunks().
+
+Usage:
+    python benchmarks/bench_output.py [--db PATH] [--resolution 8] [--count 200000] [--urban-fraction 0.8]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import queries
+from output import write_chunks
+
+
+def measure(label, run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed:8.2f} s  peak {peak / 2**20:8.1f} MiB  {rows:,} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--resolution", type=int, default=8)
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--urban-fraction", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.db:
+        queries.DB_PATH = args.db
+    params = dict(total_count=args.count, resolution=args.resolution, urban_fraction=args.urban_fraction,
+                  seed=args.seed)
+
+    print(f"{args.count:,} hexes at r{args.resolution}, urban_fraction {args.urban_fraction}")
+    with tempfile.TemporaryDirectory() as directory:
+        def whole():
+            _, _, df = queries.get_top_centroids_by_strategy(**params)
+            df.to_csv(Path(directory) / "whole.csv", index=False)
+            return len(df)
+
+        def streamed():
+            _, chunks = queries.stream_top_centroids_by_strategy(**params)
+            return write_chunks(chunks, Path(directory) / "streamed.csv")
+
+        measure("whole DataFrame + to_csv", whole)
+        measure("streamed chunks", streamed)
+
+
+if __name__ == "__main__":
+    main()
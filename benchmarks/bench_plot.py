@@ -0,0 +1,65 @@
+"""
+Time of rendering H3 cells to a PNG without a display: one GeoPandas patch per
+cell (the old plot_cells path) versus h3raster.draw_cells' single PolyCollection.
+
+Usage:
+    python benchmarks/bench_plot.py [--resolution 8] [--rings 100 200] [--geopandas-max 20000]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import h3
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import h3raster
+
+
+def render_geopandas(cells, path):
+    import geopandas as gpd
+    from matplotlib.figure import Figure
+    from shapely.geometry import Polygon
+
+    polygons = [Polygon([(lng, lat) for lat, lng in h3.cell_to_boundary(cell)]) for cell in cells]
+    fig = Figure(figsize=(8, 8))
+    gpd.GeoDataFrame(geometry=polygons).plot(ax=fig.subplots())
+    fig.savefig(path, dpi=150)
+
+
+def timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--resolution", type=int, default=8)
+    parser.add_argument("--rings", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--geopandas-max", type=int, default=20_000,
+                        help="Skip the per-patch renderer above this many cells.")
+    args = parser.parse_args()
+
+    origin = h3.latlng_to_cell(48.85, 2.35, args.resolution)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        png = Path(directory) / "cells.png"
+        for k in args.rings:
+            cells = h3.grid_disk(origin, k)
+            population = rng.lognormal(3, 2, len(cells))
+            seconds = timed(lambda: h3raster.plot_cells_png(cells, png, population))
+            line = f"{len(cells):>9,} cells  PolyCollection {seconds:7.2f} s"
+            if len(cells) <= args.geopandas_max:
+                try:
+                    line += f"  GeoPandas {timed(lambda: render_geopandas(cells, png)):7.2f} s"
+                except ImportError:
+                    line += "  GeoPandas not installed"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
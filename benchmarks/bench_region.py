@@ -0,0 +1,66 @@
+"""
+Latency of population queries over regions: k-rings of growing radius around a
+point, read with queries.get_top_centroids_in_region from SQLite (temporary
+table joined on the integer h3 key) and from an in-memory ColumnStore.
+
+Usage:
+    python benchmarks/bench_region.py [--db PATH] [--resolution 8] [--lat 48.8566 --lng 2.3522] [--k 20 60 100]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import queries
+from columnstore import ColumnStore
+
+
+def timed(run, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--resolution", type=int, default=8)
+    parser.add_argument("--lat", type=float, default=48.8566)
+    parser.add_argument("--lng", type=float, default=2.3522)
+    parser.add_argument("--k", type=int, nargs="+", default=[20, 60, 100])
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--no-store", action="store_true", help="Only time SQLite.")
+    args = parser.parse_args()
+    if args.db:
+        queries.DB_PATH = args.db
+
+    store = None
+    if not args.no_store:
+        store = ColumnStore.from_sqlite(queries.DB_PATH, args.resolution)
+        start = time.perf_counter()
+        store.cell_rows(store.h3[:1])
+        print(f"ColumnStore of {len(store):,} cells, h3 index built in {time.perf_counter() - start:.2f} s")
+
+    region = dict(lat=args.lat, lng=args.lng, return_centroids=False)
+    for k in args.k:
+        for count in (args.count, None):
+            seconds, (_, summary, _) = timed(
+                lambda: queries.get_top_centroids_in_region(args.resolution, count, k=k, **region)
+            )
+            line = (f"k={k:<4} {summary['region_cells']:>8,} cells {summary['cells']:>8,} with data  "
+                    f"{'all' if count is None else f'top {count}':>8}  sqlite {seconds * 1000:8.1f} ms")
+            if store is not None:
+                seconds, _ = timed(
+                    lambda: queries.get_top_centroids_in_region(args.resolution, count, k=k, store=store, **region)
+                )
+                line += f"  store {seconds * 1000:8.1f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Time selection.select_rows() against the per-country filter/sort_values/sample loop
+it replaced, on a synthetic population table, and check both pick the same rows.
+Also times the weighted and stratified rural sampling modes.
+
+Usage:
+    python benchmarks/bench_selection.py [--count 5000000] [--total 5000] [--urban-fraction 0.8]
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from allocation import allocate
+from selection import RURAL_MODES, select_rows
+from queries import COUNTRIES
+
+
+def legacy_select(df, allocation, urban_fraction, total_count):
+    selected_rows = []
+    used_h3 = set()
+    for country, n in allocation.items():
+        country_df = df[df['country'] == country].sort_values(by='population', ascending=False)
+        urban_count = math.floor(n * urban_fraction)
+        rural_count = n - urban_count
+        chosen_rows = country_df.head(urban_count)
+        if rural_count > 0:
+            rural_pool = country_df.iloc[urban_count:]
+            if not rural_pool.empty:
+                rural_sample = rural_pool.sample(min(rural_count, len(rural_pool)))
+                chosen_rows = pd.concat([chosen_rows, rural_sample])
+        used_h3.update(chosen_rows['h3'])
+        selected_rows.append(chosen_rows)
+    final_df = pd.concat(selected_rows).copy()
+    if len(final_df) < total_count:
+        missing = total_count - len(final_df)
+        remaining_pool = df[~df['h3'].isin(used_h3)].sort_values(by='population', ascending=False)
+        if not remaining_pool.empty:
+            final_df = pd.concat([final_df, remaining_pool.head(missing)])
+    return final_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=5_000_000)
+    parser.add_argument("--total", type=int, default=5000)
+    parser.add_argument("--urban-fraction", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    df = pd.DataFrame({
+        "country": rng.choice(COUNTRIES, args.count),
+        "population": rng.lognormal(3, 2, args.count).round(),
+        "h3": rng.integers(0, 2**62, args.count, dtype=np.uint64),
+    }).sort_values("population", ascending=False, kind="stable", ignore_index=True)
+    totals = df.groupby("country")["population"].agg(["sum", "size"])
+    allocation = allocate(totals["sum"], args.total, capacity=totals["size"])
+
+    print(f"{args.count:,} rows, {len(allocation)} countries, {args.total:,} hexes, urban_fraction {args.urban_fraction}")
+    np.random.seed(args.seed)
+    start = time.perf_counter()
+    legacy = legacy_select(df, allocation, args.urban_fraction, args.total)
+    print(f"  legacy per-country loop {time.perf_counter() - start:10.3f} s")
+
+    np.random.seed(args.seed)
+    start = time.perf_counter()
+    grouped = df.iloc[select_rows(df, allocation, args.urban_fraction, args.total)]
+    print(f"  select_rows()           {time.perf_counter() - start:10.3f} s")
+
+    assert legacy.equals(grouped) and (legacy.index == grouped.index).all(), "selections differ"
+    print("  identical selections")
+
+    for mode in RURAL_MODES[1:]:
+        start = time.perf_counter()
+        select_rows(df, allocation, args.urban_fraction, args.total, np.random.RandomState(args.seed), mode)
+        print(f"  select_rows({mode}){'':<{11 - len(mode)}}{time.perf_counter() - start:10.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Latency of the query service: start it on a free port, then time /select requests
+from several client threads against the warm in-memory store.
+
+Usage:
+    python benchmarks/bench_service.py [--db PATH] [--resolution 8] [--count 5000] [--requests 200] [--clients 1]
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import service
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        body = response.read()
+    return time.perf_counter() - start, len(json.loads(body)["cells"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--resolution", type=int, default=8)
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--method", default="population")
+    parser.add_argument("--urban-fraction", type=float, default=1.0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    server = service.make_server(args.db, port=0, resolutions=[args.resolution])
+    print(f"warm-up load: {time.perf_counter() - start:.2f} s")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{server.server_address[1]}/select"
+    payload = {
+        "total_count": args.count,
+        "resolution": args.resolution,
+        "method": args.method,
+        "urban_fraction": args.urban_fraction,
+    }
+    post(url, payload)
+
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(lambda _: post(url, payload), range(args.requests)))
+    latencies = np.array([r[0] for r in results]) * 1000
+    server.shutdown()
+    server.server_close()
+
+    print(f"{args.requests} requests, {args.clients} clients, {results[0][1]:,} cells each")
+    for label, q in (("p50", 50), ("p90", 90), ("p99", 99)):
+        print(f"  {label}: {np.percentile(latencies, q):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
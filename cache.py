@@ -0,0 +1,122 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).parent / "data" / "cache"
+CACHE_FILE = "results.db"
+CACHE_MAX_BYTES = 512 * 2**20
+# Bump when the selection logic or the layout of cached results changes.
+CACHE_FORMAT = 2
+
+
+class ResultCache:
+    """
+    On-disk cache of selection results, one SQLite file under `directory`.
+
+    Entries are pickled results keyed by key(), a SHA-256 of the parameters that
+    produced them. Reads refresh an entry's last-used time, and every write
+    evicts the least recently used entries until the cache holds at most
+    max_bytes of results. Several processes may share a cache directory.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.path = self.directory / CACHE_FILE
+        self.max_bytes = int(max_bytes)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def key(**params):
+        """
+        Cache key for a set of JSON-serialisable parameters (order-insensitive).
+        """
+        payload = json.dumps({"format": CACHE_FORMAT, **params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                value = pickle.loads(row[0])
+            except Exception:
+                with conn:
+                    conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            with conn:
+                conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            return value
+        finally:
+            conn.close()
+
+    def put(self, key, value):
+        """
+        Store value under key and evict down to max_bytes.
+
+        Returns:
+        - False if the value alone is larger than the cache and was not stored.
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return False
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+                self._evict(conn)
+        finally:
+            conn.close()
+        return True
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT TOTAL(size) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        kept = 0
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_used DESC"):
+            kept += size
+            if kept > self.max_bytes:
+                stale.append((key,))
+        conn.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def stats(self):
+        """
+        Number of entries and their total size in bytes.
+        """
+        conn = self._connect()
+        try:
+            count, size = conn.execute("SELECT COUNT(*), TOTAL(size) FROM results").fetchone()
+        finally:
+            conn.close()
+        return count, int(size)
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM results")
+        finally:
+            conn.close()
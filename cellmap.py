@@ -0,0 +1,230 @@
+import json
+import math
+from pathlib import Path
+
+import h3
+import numpy as np
+
+import h3raster
+
+MAP_LAYER_CELLS = 20_000
+MAP_TILE_DEPTH = 4
+MAP_MIN_EDGE_PIXELS = 6
+MAP_COLORS = ("#440154", "#3b528b", "#21918c", "#5ec962", "#fde725")
+H3JS_URL = "https://unpkg.com/h3-js@4.1.0/dist/h3-js.umd.js"
+
+# Draws the level of detail matching the zoom on a canvas renderer. Levels too
+# large to inline are split into tile scripts next to the HTML file, loaded by
+# <script> tags (which also works for maps opened from file://) as tiles enter
+# the viewport.
+_MAP_SCRIPT = """
+document.addEventListener("DOMContentLoaded", function () {
+    var config = %(config)s;
+    var map = window[config.map];
+    var renderer = L.canvas({padding: 0.5});
+    var stops = config.colors.map(function (c) {
+        return [1, 3, 5].map(function (i) { return parseInt(c.substr(i, 2), 16); });
+    });
+
+    function color(value) {
+        var t = (Math.log10(1 + value) - config.vmin) / Math.max(config.vmax - config.vmin, 1e-9);
+        t = Math.min(Math.max(t, 0), 1) * (stops.length - 1);
+        var i = Math.min(Math.floor(t), stops.length - 2), f = t - i;
+        var rgb = [0, 1, 2].map(function (k) { return Math.round(stops[i][k] + f * (stops[i + 1][k] - stops[i][k])); });
+        return "rgb(" + rgb.join(",") + ")";
+    }
+
+    function draw(level, data) {
+        for (var i = 0; i < data.cells.length; i++) {
+            var fill = color(data.population[i] * level.scale);
+            L.polygon(h3.cellToBoundary(data.cells[i]), {
+                renderer: renderer, weight: 0.5, color: fill, fillColor: fill, fillOpacity: 0.6
+            }).bindTooltip(data.cells[i] + ": " + Math.round(data.population[i]).toLocaleString()).addTo(level.group);
+        }
+    }
+
+    var byTile = {};
+    config.levels.forEach(function (level) {
+        level.group = L.layerGroup();
+        level.requested = {};
+        if (level.data) {
+            draw(level, level.data);
+        }
+        (level.tiles || []).forEach(function (tile) { byTile[tile[0]] = level; });
+    });
+
+    window.H3MAP = {
+        tile: function (id, data) { draw(byTile[id], data); }
+    };
+
+    function update() {
+        var zoom = map.getZoom(), bounds = map.getBounds();
+        config.levels.forEach(function (level) {
+            if (zoom < level.minZoom || zoom >= level.maxZoom) {
+                map.removeLayer(level.group);
+                return;
+            }
+            level.group.addTo(map);
+            (level.tiles || []).forEach(function (tile) {
+                if (level.requested[tile[0]] || !bounds.intersects([[tile[1], tile[2]], [tile[3], tile[4]]])) {
+                    return;
+                }
+                level.requested[tile[0]] = true;
+                var script = document.createElement("script");
+                script.src = config.tileDir + "/" + tile[0] + ".js";
+                document.head.appendChild(script);
+            });
+        });
+    }
+
+    map.on("zoomend moveend", update);
+    update();
+});
+"""
+
+
+def min_zoom(resolution, min_edge_pixels=MAP_MIN_EDGE_PIXELS):
+    """
+    Lowest web-map zoom at which cells of a resolution have edges of at least min_edge_pixels.
+    """
+    metres_per_pixel_z0 = 156543.03
+    edge = h3.average_hexagon_edge_length(resolution, unit="m")
+    return max(0, math.ceil(math.log2(min_edge_pixels * metres_per_pixel_z0 / edge)))
+
+
+def lod_levels(cells, population=None, max_cells=MAP_LAYER_CELLS):
+    """
+    Aggregate cells to ever coarser parents until one level has at most max_cells cells.
+
+    Parameters:
+    - cells: H3 cells (uint64 or hex strings), all at one resolution.
+    - population: Optional population per cell; each cell counts 1 when omitted.
+    - max_cells: Size of the coarsest level.
+    Returns:
+    - Dict {resolution: (uint64 cells, float64 population)}, finest first. Parent
+      populations are the sums over their selected children.
+    """
+    cells = h3raster.cells_to_int(cells)
+    if not len(cells):
+        raise ValueError("No cells to map")
+    resolutions = np.unique(h3raster.cells_resolution(cells))
+    if len(resolutions) > 1:
+        raise ValueError(f"Cells must share one resolution, got {resolutions.tolist()}")
+    population = np.ones(len(cells)) if population is None else np.asarray(population, dtype=np.float64)
+
+    resolution = int(resolutions[0])
+    cells, inverse = np.unique(cells, return_inverse=True)
+    levels = {resolution: (cells, np.bincount(inverse, weights=population))}
+    while len(levels[resolution][0]) > max_cells and resolution > 0:
+        cells, population = levels[resolution]
+        parents, inverse = np.unique(h3raster.cells_to_parents(cells, resolution - 1), return_inverse=True)
+        resolution -= 1
+        levels[resolution] = (parents, np.bincount(inverse, weights=population))
+    return levels
+
+
+def _level_data(cells, population):
+    return {"cells": h3raster.cells_to_str(cells), "population": np.round(population, 1).tolist()}
+
+
+def _write_tiles(level, resolution, cells, population, tile_dir):
+    """
+    Split one level into tile scripts by parent cell and list them in
+    level['tiles'] as [id, south, west, north, east].
+    """
+    tile_resolution = max(0, resolution - MAP_TILE_DEPTH)
+    tiles = h3raster.cells_to_parents(cells, tile_resolution)
+    order = np.argsort(tiles, kind="stable")
+    tiles, cells, population = tiles[order], cells[order], population[order]
+    lats, lngs = h3raster.cells_to_latlngs(cells)
+    starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]])
+    # Cell centroids plus one edge length cover the hexagons' boundaries.
+    pad = 2 * h3.average_hexagon_edge_length(resolution, unit="km") / 111.0
+
+    index = []
+    for start, end in zip(starts, np.r_[starts[1:], len(tiles)]):
+        tile_id = f"r{resolution}_{int(tiles[start]):x}"
+        data = _level_data(cells[start:end], population[start:end])
+        (tile_dir / f"{tile_id}.js").write_text(f"H3MAP.tile({json.dumps(tile_id)}, {json.dumps(data)});")
+        index.append([
+            tile_id,
+            round(float(lats[start:end].min()) - pad, 5), round(float(lngs[start:end].min()) - pad, 5),
+            round(float(lats[start:end].max()) + pad, 5), round(float(lngs[start:end].max()) + pad, 5),
+        ])
+    level["tiles"] = index
+
+
+def cells_map(cells, population=None, path=None, max_layer_cells=MAP_LAYER_CELLS, tiles="OpenStreetMap"):
+    """
+    Build a Folium map of H3 cells that stays responsive for hundreds of thousands of cells.
+
+    Cells are drawn on a canvas, coloured by population on a log scale. The
+    selection is also aggregated to coarser parent resolutions (lod_levels),
+    and each zoom shows the finest level whose hexagons are still a few pixels
+    wide, so zoomed-out views draw a few thousand parents instead of every cell.
+    Colours show population per cell of the input resolution at every level, so
+    they stay comparable when zooming. Levels with more than max_layer_cells
+    cells are not inlined: they are written as tile scripts to a
+    '<name>_tiles' directory next to `path`, and only the tiles in view are
+    loaded. The view is fitted to the selection's bounds. Hexagon outlines are
+    computed in the browser by h3-js.
+
+    Parameters:
+    - cells: H3 cells (uint64 or hex strings), all at one resolution.
+    - population: Optional population per cell, used for colour and tooltips.
+    - path: HTML file to save the map to. Required when some level has to be tiled.
+    - max_layer_cells: Most cells inlined in one level.
+    - tiles: Folium base map.
+    Returns:
+    - folium.Map, saved to path when one is given.
+    """
+    import branca.colormap
+    import folium
+
+    levels = lod_levels(cells, population, max_layer_cells)
+    resolutions = sorted(levels)
+    finest = resolutions[-1]
+    path = None if path is None else Path(path)
+    tiled = [r for r in resolutions if len(levels[r][0]) > max_layer_cells]
+    if tiled and path is None:
+        raise ValueError(f"{len(levels[finest][0]):,} cells are more than one layer holds; pass a path for the tiles")
+
+    lats, lngs = h3raster.cells_to_latlngs(levels[resolutions[0]][0])
+    m = folium.Map(tiles=tiles, prefer_canvas=True)
+    m.fit_bounds([[float(lats.min()), float(lngs.min())], [float(lats.max()), float(lngs.max())]])
+    m.get_root().header.add_child(folium.JavascriptLink(H3JS_URL))
+
+    values = np.log10(1 + levels[finest][1])
+    config = {
+        "map": m.get_name(),
+        "colors": list(MAP_COLORS),
+        "vmin": float(values.min()),
+        "vmax": float(values.max()),
+        "tileDir": f"{path.stem}_tiles" if path is not None else None,
+        "levels": [],
+    }
+    if tiled:
+        tile_dir = path.with_name(config["tileDir"])
+        tile_dir.mkdir(parents=True, exist_ok=True)
+    for i, resolution in enumerate(resolutions):
+        level = {
+            "resolution": resolution,
+            "minZoom": 0 if i == 0 else min_zoom(resolution),
+            "maxZoom": 99 if resolution == finest else min_zoom(resolutions[i + 1]),
+            "scale": 7.0 ** (resolution - finest),
+        }
+        level_cells, level_population = levels[resolution]
+        if resolution in tiled:
+            _write_tiles(level, resolution, level_cells, level_population, tile_dir)
+        else:
+            level["data"] = _level_data(level_cells, level_population)
+        config["levels"].append(level)
+    m.get_root().script.add_child(folium.Element(_MAP_SCRIPT % {"config": json.dumps(config)}))
+
+    legend = branca.colormap.LinearColormap(list(MAP_COLORS), vmin=config["vmin"], vmax=config["vmax"])
+    legend.caption = f"log10(1 + population) per r{finest} cell"
+    legend.add_to(m)
+
+    if path is not None:
+        m.save(str(path))
+    return m
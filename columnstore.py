@@ -0,0 +1,289 @@
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import h3raster
+
+COLUMN_CHUNK_SIZE = 1_000_000
+SNAPSHOT_VERSION = 1
+SNAPSHOT_COLUMNS = ("h3", "population", "country_codes", "lat", "lng", "utc_offset")
+SNAPSHOT_MANIFEST = "manifest.json"
+
+
+def read_snapshot_manifest(directory):
+    """
+    Return the manifest of a snapshot directory as a dict, or None if there is no snapshot.
+    """
+    path = Path(directory) / SNAPSHOT_MANIFEST
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+class ColumnStore:
+    """
+    One resolution of the population database held in memory as compact columns.
+
+    Rows are sorted by country, then population descending, then h3, so a
+    country's top-N cells are the first N rows of its slice
+    [starts[i], starts[i + 1]) and a top-N query is index arithmetic rather than
+    a scan. Columns are uint64 h3, float32 population, lat, lng and utc_offset,
+    and an int16 code into the sorted `countries` array; about 26 bytes per cell.
+    Cells without a country are not kept.
+    """
+
+    def __init__(self, resolution, h3, population, country_codes, countries, lat, lng, utc_offset, totals=None,
+                 starts=None):
+        self.resolution = resolution
+        self.h3 = h3
+        self.population = population
+        self.country_codes = country_codes
+        self.countries = np.asarray(countries, dtype=object)
+        self.lat = lat
+        self.lng = lng
+        self.utc_offset = utc_offset
+        if starts is None:
+            starts = np.searchsorted(country_codes, np.arange(len(self.countries) + 1))
+        self.starts = np.asarray(starts, dtype=np.int64)
+        if totals is None:
+            totals = np.add.reduceat(population.astype(np.float64), self.starts[:-1]) if len(h3) else np.zeros(0)
+        self.totals = np.asarray(totals, dtype=np.float64)
+        self._positions = {country: i for i, country in enumerate(self.countries.tolist())}
+        self._h3_order = None
+
+    def __len__(self):
+        return len(self.h3)
+
+    @property
+    def nbytes(self):
+        columns = (self.h3, self.population, self.country_codes, self.lat, self.lng, self.utc_offset)
+        return sum(c.nbytes for c in columns)
+
+    @classmethod
+    def from_sqlite(cls, db_path, resolution, chunk_size=COLUMN_CHUNK_SIZE):
+        """
+        Load hex_pops_r<resolution> from the SQLite database.
+
+        The table is scanned once in chunks, country names are dictionary-encoded
+        per chunk and the rows are sorted in NumPy, so peak memory stays close to
+        the size of the columns themselves.
+
+        Parameters:
+        - db_path: Path of the combined population database.
+        - resolution: H3 resolution to load.
+        - chunk_size: Rows read per chunk.
+        Returns:
+        - ColumnStore for that resolution.
+        """
+        table = f"hex_pops_r{int(resolution)}"
+        conn = sqlite3.connect(db_path)
+        try:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if not exists:
+                raise ValueError(f"Unsupported resolution {resolution}: table '{table}' does not exist.")
+            columns = {r[1] for r in conn.execute(f"PRAGMA table_info('{table}')")}
+            select = ["h3", "population", "country", "lat", "lng"]
+            select.append("utc_offset" if "utc_offset" in columns else "NULL AS utc_offset")
+            query = f"SELECT {', '.join(select)} FROM {table} WHERE country IS NOT NULL"
+
+            names = {}
+            parts = {name: [] for name in ("h3", "population", "codes", "lat", "lng", "utc_offset")}
+            for chunk in pd.read_sql_query(query, conn, chunksize=chunk_size):
+                uniques, inverse = np.unique(chunk["country"].to_numpy(dtype=object), return_inverse=True)
+                mapping = np.array([names.setdefault(u, len(names)) for u in uniques.tolist()], dtype=np.int16)
+                parts["codes"].append(mapping[inverse])
+                parts["h3"].append(h3raster.cells_to_int(chunk["h3"].to_numpy()))
+                parts["population"].append(chunk["population"].to_numpy(dtype=np.float64))
+                parts["lat"].append(chunk["lat"].to_numpy(dtype=np.float32))
+                parts["lng"].append(chunk["lng"].to_numpy(dtype=np.float32))
+                parts["utc_offset"].append(chunk["utc_offset"].to_numpy(dtype=np.float32))
+        finally:
+            conn.close()
+
+        countries = np.array(sorted(names), dtype=object)
+        if parts["h3"]:
+            arrays = {name: np.concatenate(chunks) for name, chunks in parts.items()}
+        else:
+            arrays = {
+                "h3": np.empty(0, dtype=np.uint64), "population": np.empty(0), "codes": np.empty(0, dtype=np.int16),
+                "lat": np.empty(0, dtype=np.float32), "lng": np.empty(0, dtype=np.float32),
+                "utc_offset": np.empty(0, dtype=np.float32),
+            }
+        rank = np.empty(len(names), dtype=np.int16)
+        rank[[names[c] for c in countries.tolist()]] = np.arange(len(names), dtype=np.int16)
+        codes = rank[arrays["codes"]]
+
+        order = np.lexsort((arrays["h3"], -arrays["population"], codes))
+        codes = codes[order]
+        population = arrays["population"][order]
+        starts = np.searchsorted(codes, np.arange(len(countries)))
+        totals = np.add.reduceat(population, starts) if len(population) else np.zeros(0)
+        return cls(
+            resolution,
+            arrays["h3"][order],
+            population.astype(np.float32),
+            codes,
+            countries,
+            arrays["lat"][order],
+            arrays["lng"][order],
+            arrays["utc_offset"][order],
+            totals=totals,
+        )
+
+    def save(self, directory, **metadata):
+        """
+        Write the store as a snapshot: one .npy file per column plus manifest.json.
+
+        The snapshot is written next to `directory` and renamed into place, so
+        readers see either the old or the new snapshot and processes that already
+        memory-mapped the old files keep valid mappings.
+
+        Parameters:
+        - directory: Snapshot directory, e.g. data/populations/snapshot/r8.
+        - metadata: Extra JSON-serialisable entries for the manifest.
+        """
+        directory = Path(directory)
+        staging = directory.with_name(directory.name + ".tmp")
+        retired = directory.with_name(directory.name + ".old")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for name in SNAPSHOT_COLUMNS:
+            np.save(staging / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "resolution": int(self.resolution),
+            "rows": len(self),
+            "countries": self.countries.tolist(),
+            "starts": self.starts.tolist(),
+            "totals": self.totals.tolist(),
+            **metadata,
+        }
+        (staging / SNAPSHOT_MANIFEST).write_text(json.dumps(manifest, indent=1))
+
+        shutil.rmtree(retired, ignore_errors=True)
+        if directory.exists():
+            directory.rename(retired)
+        staging.rename(directory)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    @classmethod
+    def from_snapshot(cls, directory, mmap=True):
+        """
+        Open a snapshot written by save().
+
+        Parameters:
+        - directory: Snapshot directory.
+        - mmap: Memory-map the columns read-only (the default) instead of reading
+                them into memory. Only the pages a query touches are read.
+        Returns:
+        - ColumnStore over the snapshot's columns.
+        """
+        manifest = read_snapshot_manifest(directory)
+        if manifest is None:
+            raise ValueError(f"No snapshot in {directory}; run 'python populate_db.py snapshot' first.")
+        if manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {directory} has version {manifest['version']}, expected {SNAPSHOT_VERSION}")
+        columns = {
+            name: np.load(Path(directory) / f"{name}.npy", mmap_mode="r" if mmap else None)
+            for name in SNAPSHOT_COLUMNS
+        }
+        return cls(
+            manifest["resolution"],
+            columns["h3"],
+            columns["population"],
+            columns["country_codes"],
+            manifest["countries"],
+            columns["lat"],
+            columns["lng"],
+            columns["utc_offset"],
+            totals=manifest["totals"],
+            starts=manifest["starts"],
+        )
+
+    def country_totals(self, countries):
+        """
+        Total population and cell count per country, like queries.country_totals().
+        """
+        positions = sorted(self._positions[c] for c in set(countries) if c in self._positions)
+        positions = [p for p in positions if self.starts[p + 1] > self.starts[p]]
+        df = pd.DataFrame({
+            "country": self.countries[positions],
+            "population": self.totals[positions],
+            "cells": np.diff(self.starts)[positions],
+        })
+        return df.set_index("country")
+
+    def rows(self, countries, limits=None):
+        """
+        Row positions of each country's top cells, ordered by population descending then h3.
+
+        Parameters:
+        - countries: iso3 codes to read.
+        - limits: None, one int for every country, or a dict {country: limit} as in queries.query_sqlite().
+        Returns:
+        - int64 array of row positions.
+        """
+        ranges = []
+        for country in countries:
+            position = self._positions.get(country)
+            if position is None:
+                continue
+            limit = limits if limits is None or np.isscalar(limits) else limits.get(country)
+            start, end = self.starts[position], self.starts[position + 1]
+            if limit is not None:
+                end = min(end, start + max(int(limit), 0))
+            if end > start:
+                ranges.append(np.arange(start, end))
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(ranges)
+        return rows[np.lexsort((self.h3[rows], -self.population[rows]))]
+
+    def query(self, countries, limits=None):
+        """
+        Same rows as queries.query_sqlite() for the given countries and limits, read from memory.
+
+        Returns:
+        - DataFrame with country, population, h3 (uint64), utc_offset, lat and lng
+          columns. lat/lng carry float32 precision (well under a metre), rounded
+          to 6 decimals.
+        """
+        return self.frame(self.rows(countries, limits))
+
+    def cell_rows(self, cells):
+        """
+        Row positions of the given cells, skipping cells the store does not hold.
+
+        Looked up by binary search through an argsort of the h3 column, built on
+        first use and kept (8 bytes per row).
+
+        Parameters:
+        - cells: uint64 H3 cells.
+        Returns:
+        - int64 array of row positions, in the order of `cells`.
+        """
+        if not len(self.h3):
+            return np.empty(0, dtype=np.int64)
+        if self._h3_order is None:
+            self._h3_order = np.argsort(self.h3, kind="stable")
+        cells = np.asarray(cells, dtype=np.uint64)
+        found = np.searchsorted(self.h3, cells, sorter=self._h3_order)
+        rows = self._h3_order[np.minimum(found, len(self.h3) - 1)]
+        return rows[self.h3[rows] == cells].astype(np.int64)
+
+    def frame(self, rows):
+        """
+        DataFrame of the given row positions, in the layout of query().
+        """
+        return pd.DataFrame({
+            "country": self.countries[self.country_codes[rows]],
+            "population": self.population[rows].astype(np.float64),
+            "h3": self.h3[rows],
+            "utc_offset": self.utc_offset[rows].astype(np.float64),
+            "lat": self.lat[rows].astype(np.float64).round(6),
+            "lng": self.lng[rows].astype(np.float64).round(6),
+        })
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import shapely
+import h3
+from h3.api import numpy_int as h3_int
+import h3raster
+
+COUNTRY_CELLS_TABLE = "country_cells"
+COUNTRY_CELLS_RESOLUTION = 6
+
+
+def assign_countries(lats, lngs, world_gdf):
+    """
+    Return the iso3 code of the boundary containing each point, None where no boundary does.
+    Points inside overlapping boundaries take the first boundary in file order.
+    """
+    points = shapely.points(lngs, lats)
+    point_idx, poly_idx = world_gdf.sindex.query(points, predicate="within")
+    countries = np.full(len(points), None, dtype=object)
+    if len(point_idx):
+        order = np.lexsort((poly_idx, point_idx))
+        point_idx, poly_idx = point_idx[order], poly_idx[order]
+        first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+        countries[point_idx[first]] = world_gdf["iso3"].to_numpy(dtype=object)[poly_idx[first]]
+    return countries
+
+
+class CountryLookup:
+    """
+    Country assignment keyed by H3 cell.
+
+    Holds, for every country, the compacted set of cells lying entirely inside its
+    boundary. Any finer cell whose ancestor is in the set belongs to that country,
+    so assignment is a few vectorized parent computations and hash lookups. Only
+    cells near a border (no ancestor in the set) fall back to a point-in-polygon
+    test of their centroid, matching what assign_countries() does for every cell.
+    """
+
+    def __init__(self, cells, countries):
+        cells = h3raster.cells_to_int(cells)
+        self.cells = cells
+        self.countries = np.asarray(countries, dtype=object)
+        self.index = pd.Index(cells)
+        self.resolutions = sorted(set(h3raster.cells_resolution(cells).tolist()))
+
+    def __len__(self):
+        return len(self.cells)
+
+    @classmethod
+    def build(cls, world_gdf, resolution=COUNTRY_CELLS_RESOLUTION):
+        """
+        Polyfill every boundary with cells fully contained in it at `resolution` and compact them.
+
+        H3 children do not nest exactly inside their parent, so a descendant of a
+        cell touching the border can stick out of the boundary. Cells are therefore
+        only kept when their whole first ring is contained too.
+
+        Parameters:
+        - world_gdf: GeoDataFrame with geometry and iso3 columns in EPSG:4326.
+        - resolution: Resolution of the polyfill; finer means fewer border fallbacks
+                      but a longer build and a larger table.
+        """
+        cell_chunks = []
+        country_chunks = []
+        for geometry, iso3 in zip(world_gdf.geometry, world_gdf["iso3"]):
+            if geometry is None or geometry.is_empty or iso3 is None:
+                continue
+            shape = h3.geo_to_h3shape(geometry)
+            contained = set(h3.h3shape_to_cells_experimental(shape, resolution, contain="full"))
+            interior = [c for c in contained if contained.issuperset(h3.grid_disk(c, 1))]
+            if not interior:
+                continue
+            compacted = h3_int.compact_cells(h3raster.cells_to_int(interior))
+            cell_chunks.append(compacted)
+            country_chunks.append(np.full(len(compacted), iso3, dtype=object))
+
+        if not cell_chunks:
+            return cls(np.empty(0, dtype=np.uint64), np.empty(0, dtype=object))
+
+        cells = np.concatenate(cell_chunks).astype(np.uint64)
+        countries = np.concatenate(country_chunks)
+        _, first = np.unique(cells, return_index=True)
+        first.sort()
+        return cls(cells[first], countries[first])
+
+    def lookup(self, cells):
+        """
+        Return the country of each cell from the cell sets, None for cells that need
+        an exact test (borders, coastlines, cells coarser than the sets).
+        """
+        cells = h3raster.cells_to_int(cells)
+        result = np.full(len(cells), None, dtype=object)
+        if not len(cells) or not len(self.index):
+            return result
+
+        cell_res = h3raster.cells_resolution(cells)
+        unresolved = np.ones(len(cells), dtype=bool)
+        for resolution in self.resolutions:
+            candidates = np.flatnonzero(unresolved & (cell_res >= resolution))
+            if not len(candidates):
+                continue
+            parents = h3raster.cells_to_parents(cells[candidates], resolution)
+            positions = self.index.get_indexer(parents)
+            hit = positions >= 0
+            result[candidates[hit]] = self.countries[positions[hit]]
+            unresolved[candidates[hit]] = False
+        return result
+
+    def assign(self, cells, lats, lngs, world_gdf):
+        """
+        Assign countries by cell lookup, with an exact centroid-in-boundary test for the rest.
+        """
+        result = self.lookup(cells)
+        missing = np.flatnonzero(pd.isna(result))
+        if len(missing):
+            result[missing] = assign_countries(np.asarray(lats)[missing], np.asarray(lngs)[missing], world_gdf)
+        return result
+
+    def save(self, conn, table=COUNTRY_CELLS_TABLE):
+        """
+        Persist the cell sets to `table` in an open SQLite connection, replacing it.
+        """
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"CREATE TABLE {table} (h3 INTEGER PRIMARY KEY, country TEXT) WITHOUT ROWID")
+        conn.executemany(
+            f"INSERT INTO {table} VALUES (?, ?)",
+            zip(self.cells.view(np.int64).tolist(), self.countries.tolist()),
+        )
+        conn.commit()
+
+    @classmethod
+    def load(cls, conn, table=COUNTRY_CELLS_TABLE):
+        """
+        Load cell sets saved by save(), or return None if the table does not exist.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if not exists:
+            return None
+        df = pd.read_sql_query(f"SELECT h3, country FROM {table}", conn)
+        return cls(df["h3"].to_numpy(dtype=np.int64).view(np.uint64), df["country"].to_numpy(dtype=object))
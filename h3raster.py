@@ -1,14 +1,25 @@
 # TODO: error handling, function documentation, update README
 
+# geopandas, shapely, folium and matplotlib are imported inside the plotting and
+# ZIP functions that need them, so cell-only callers (samplecells without --plot)
+# start without loading them.
 import h3
-import geopandas
-import contextily as cx
-import matplotlib.pyplot as plt
-import folium
-from shapely import geometry
-from shapely.geometry import shape, mapping, Point 
+from h3.api import numpy_int as h3_int
+from h3.api import basic_int as h3_basic_int
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from pathlib import Path
 
+ZCTA_SHAPEFILE = "tl_2020_us_zcta510.shp"
+ZIP_LOOKUP_CHUNK_SIZE = 1_000_000
+CENTROID_CHUNK_SIZE = 1_000_000
+EXPORT_WORKERS = 2
+
+_zcta_stores = {}
+_zcta_lock = threading.Lock()
+_zip_coverage = {}
+
 # def plot_df(df, column=None, ax=None):
 #     "Plot based on the `geometry` column of a GeoPandas dataframe"
 #     df = df.copy()
@@ -28,7 +39,18 @@ from pathlib import Path
 #     cx.add_basemap(ax, crs=df.crs, source=cx.providers.CartoDB.Positron)
 
 
-def plot_df(df, map_location=None, zoom_start=11):
+def _finish_map(m, path=None, show=None):
+    """
+    Save a Folium map to path if given and open it in the browser when show is
+    True (or None and there is no path). Returns the map.
+    """
+    if path is not None:
+        m.save(str(path))
+    if show or (show is None and path is None):
+        m.show_in_browser()
+    return m
+
+def plot_df(df, map_location=None, zoom_start=11, path=None, show=None):
     """
     Plot a GeoDataFrame on a Folium map
 
@@ -40,7 +62,18 @@ def plot_df(df, map_location=None, zoom_start=11):
         Center of map.  If None, use centroid of all geometries.
     zoom_start: int
         Initial zoom level
+    path : Path or str, Optional
+        HTML file to save the map to
+    show : bool, Optional
+        Open the map in the browser (blocks until interrupted). Defaults to True
+        only when no path is given, so batch jobs that save maps never block.
+
+    Returns
+    _______
+    folium.Map
     """
+    import folium
+
     df = df.to_crs(epsg=4326)
 
     if map_location is None:
@@ -59,40 +92,304 @@ def plot_df(df, map_location=None, zoom_start=11):
         },
     ).add_to(m)
 
-    m.show_in_browser()
+    return _finish_map(m, path, show)
+
+def plot_shape(shape, map_location=None, zoom_start=11, path=None, show=None):
+    """Plot a shapely or H3 shape on a Folium map; see plot_df()."""
+    import geopandas
 
-def plot_shape(shape, map_location=None, zoom_start=11):
     df = geopandas.GeoDataFrame({'geometry': [shape]}, crs='EPSG:4326')
-    plot_df(df, map_location=map_location, zoom_start=zoom_start)
+    return plot_df(df, map_location=map_location, zoom_start=zoom_start, path=path, show=show)
 
-def plot_cells(cells, ax=None):
-    shape = h3.cells_to_h3shape(cells)
-    plot_shape(shape)
+def plot_cells(cells, ax=None, population=None, path=None, show=None):
+    """
+    Plot H3 cells: into a matplotlib axes when ax is given (see draw_cells),
+    otherwise as their merged outline on a Folium map (see plot_df).
+    """
+    if ax is not None:
+        return draw_cells(ax, cells, population)
+    return plot_shape(h3.cells_to_h3shape(cells), path=path, show=show)
+
+def cell_boundaries(cells):
+    """
+    Boundaries of H3 cells as one vertex array, ready for a matplotlib PolyCollection.
 
-def plot_shape_and_cells(shape, res=9):
-    fig, axs = plt.subplots(1,2, figsize=(10,5), sharex=True, sharey=True)
-    plot_shape(shape)
-    plot_cells(h3.h3shape_to_cells(shape, res), ax=axs[1])
+    Parameters:
+    - cells: Array-like of H3 cells as uint64 integers or hex strings.
+    Returns:
+    - float64 array of shape (n, k, 2) holding (lng, lat) vertices, where k is the
+      largest vertex count (6 for hexagons). Cells with fewer vertices
+      (pentagons) repeat their last vertex.
+    """
+    cells = cells_to_int(cells)
+    counts = np.empty(len(cells), dtype=np.int64)
+    vertices = []
+    for i, cell in enumerate(cells.tolist()):
+        boundary = h3_basic_int.cell_to_boundary(cell)
+        counts[i] = len(boundary)
+        vertices.extend(boundary)
+    if not len(cells):
+        return np.empty((0, 6, 2))
+    flat = np.asarray(vertices, dtype=np.float64)[:, ::-1]
+    starts = np.cumsum(counts) - counts
+    k = counts.max()
+    return flat[starts[:, None] + np.minimum(np.arange(k), counts[:, None] - 1)]
+
+def _set_lnglat_aspect(ax, lats):
+    if len(lats):
+        ax.set_aspect(1 / max(np.cos(np.radians(np.mean(lats))), 0.1))
+
+def draw_cells(ax, cells, population=None, cmap="viridis", edgecolor="face", linewidth=0.3, alpha=0.8):
+    """
+    Draw H3 cells into a matplotlib axes as a single PolyCollection.
+
+    One collection built from cell_boundaries() draws hundreds of thousands of
+    cells in about a second, instead of one patch per cell. With population the
+    cells are coloured by log10(1 + population). The default thin outline in the
+    fill colour keeps cells visible when they are smaller than a pixel.
+
+    Parameters:
+    - ax: matplotlib Axes (x = longitude, y = latitude).
+    - cells: H3 cells as uint64 integers or hex strings.
+    - population: Optional population per cell.
+    - cmap, edgecolor, linewidth, alpha: Styling of the collection.
+    Returns:
+    - The PolyCollection, e.g. for fig.colorbar().
+    """
+    from matplotlib.collections import PolyCollection
+
+    vertices = cell_boundaries(cells)
+    collection = PolyCollection(vertices, edgecolors=edgecolor, linewidths=linewidth, alpha=alpha)
+    if population is not None:
+        collection.set_array(np.log10(1 + np.asarray(population, dtype=np.float64)))
+        collection.set_cmap(cmap)
+    else:
+        collection.set_facecolor("tab:blue")
+    # Limits come straight from the vertex array; matplotlib's per-path extents are slow.
+    ax.add_collection(collection, autolim=False)
+    if len(vertices):
+        flat = vertices.reshape(-1, 2)
+        ax.update_datalim([flat.min(axis=0), flat.max(axis=0)])
+        ax.autoscale_view()
+    _set_lnglat_aspect(ax, vertices[:, 0, 1])
+    return collection
+
+def draw_shape(ax, shape, facecolor="tab:blue", edgecolor="tab:blue", alpha=0.4):
+    """
+    Draw a polygon or multipolygon (anything with __geo_interface__, e.g. an H3
+    shape or a shapely geometry) into a matplotlib axes.
+    """
+    from matplotlib.patches import PathPatch
+    from matplotlib.path import Path as MplPath
+
+    geo = shape.__geo_interface__
+    polygons = geo["coordinates"] if geo["type"] == "MultiPolygon" else [geo["coordinates"]]
+    rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon]
+    path = MplPath.make_compound_path(*(MplPath(ring, closed=True) for ring in rings))
+    patch = ax.add_patch(PathPatch(path, facecolor=facecolor, edgecolor=edgecolor, alpha=alpha))
+    ax.autoscale_view()
+    _set_lnglat_aspect(ax, np.concatenate([ring[:, 1] for ring in rings]))
+    return patch
+
+def _figure(show, **kwargs):
+    # Figures that are only saved skip pyplot, so no display or GUI backend is needed.
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.figure(**kwargs)
+    from matplotlib.figure import Figure
+    return Figure(**kwargs)
+
+def _finish_figure(fig, path=None, show=None, dpi=150):
+    if path is not None:
+        fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return fig
+
+def plot_cells_png(cells, path=None, population=None, title=None, figsize=(8, 8), dpi=150, show=False):
+    """
+    Render H3 cells to a static image (PNG, SVG, ... by the path suffix) without a display.
+
+    Parameters:
+    - cells: H3 cells as uint64 integers or hex strings.
+    - path: Output image; nothing is written when None.
+    - population: Optional population per cell, colours the cells and adds a colour bar.
+    - title: Optional axes title.
+    - figsize, dpi: Size and resolution of the image.
+    - show: Also show the figure through pyplot.
+    Returns:
+    - matplotlib Figure.
+    """
+    fig = _figure(show, figsize=figsize)
+    ax = fig.add_subplot()
+    collection = draw_cells(ax, cells, population)
+    if population is not None:
+        fig.colorbar(collection, ax=ax, shrink=0.7, label="log10(1 + population)")
+    if title:
+        ax.set_title(title)
+    ax.set_xlabel("longitude")
+    ax.set_ylabel("latitude")
+    return _finish_figure(fig, path, show, dpi)
+
+def plot_shape_and_cells(shape, res=9, path=None, show=None):
+    """
+    Draw a shape next to the H3 cells that cover it at resolution res.
+
+    Parameters:
+    - shape: H3 shape or shapely polygon in lat/lng.
+    - res: Resolution of the cells.
+    - path: Optional image file to save the figure to.
+    - show: Show the figure through pyplot; defaults to True only when no path is given.
+    Returns:
+    - matplotlib Figure with the shape on the left and its cells on the right.
+    """
+    show = path is None if show is None else show
+    fig = _figure(show, figsize=(10, 5))
+    axs = fig.subplots(1, 2, sharex=True, sharey=True)
+    draw_shape(axs[0], shape)
+    if not isinstance(shape, h3.H3Shape):
+        shape = h3.geo_to_h3shape(shape)
+    draw_cells(axs[1], h3.h3shape_to_cells(shape, res))
     fig.tight_layout()
+    return _finish_figure(fig, path, show)
+
+_export_executor = None
+_export_lock = threading.Lock()
 
-def folium_plot_cells(cells):
+def save_async(obj, path, **kwargs):
     """
-    Plot H3 cells on a Folium map.
+    Save a Folium map (HTML) or matplotlib figure (by suffix, e.g. PNG) on a
+    background thread, so report generation can go on while files are written.
+
     Parameters:
-    - cells: List of H3 cell IDs.
+    - obj: folium.Map or matplotlib Figure.
+    - path: Output file.
+    - kwargs: Passed to Figure.savefig().
+    Returns:
+    - concurrent.futures.Future resolving to path.
+    """
+    global _export_executor
+    with _export_lock:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="h3raster-export")
+
+    def save():
+        if hasattr(obj, "savefig"):
+            obj.savefig(path, **kwargs)
+        else:
+            obj.save(str(path))
+        return path
+
+    return _export_executor.submit(save)
+
+def folium_plot_cells(cells, population=None, path=None, show=None):
+    """
+    Plot H3 cells on a Folium map fitted to their bounds and coloured by population.
+
+    Drawn with cellmap.cells_map, which aggregates large selections to coarser
+    cells at low zoom and loads the finest cells in tiles as they come into view.
+    Parameters:
+    - cells: List of H3 cell IDs, all at one resolution.
+    - population: Optional population per cell.
+    - path: Optional HTML file to write the map to.
+    - show: Open the map in the browser; defaults to True only when no path is
+            given.
+    Returns:
+    - Folium map object with H3 cells plotted. Without a path, maps with more
+      cells than one layer holds are still written, with their tiles, to a new
+      temporary directory, since the tiles have to live next to the HTML.
+    """
+    from cellmap import MAP_LAYER_CELLS, cells_map
+
+    show = path is None if show is None else show
+    if path is None and len(cells) <= MAP_LAYER_CELLS:
+        m = cells_map(cells, population)
+        if show:
+            m.show_in_browser()
+        return m
+
+    import webbrowser
+
+    if path is None:
+        import tempfile
+        path = Path(tempfile.mkdtemp(prefix="h3map_")) / "cells.html"
+    m = cells_map(cells, population, path)
+    if show:
+        webbrowser.open(Path(path).resolve().as_uri())
+    return m
+
+def cells_to_int(cells):
+    """
+    Convert H3 cells given as hex strings or integers to a uint64 NumPy array.
+    Integer input is returned without copying where possible.
+    """
+    cells = np.asarray(cells)
+    if cells.dtype.kind in "iu":
+        return cells.astype(np.uint64, copy=False)
+    return np.fromiter((int(c, 16) for c in cells.tolist()), dtype=np.uint64, count=len(cells))
+
+def cells_to_str(cells):
+    """
+    Convert H3 cells given as uint64 integers (or hex strings) to a list of hex strings.
+    """
+    cells = np.asarray(cells)
+    if cells.dtype.kind not in "iu":
+        return [str(c) for c in cells.tolist()]
+    return [format(c, "x") for c in cells.astype(np.uint64, copy=False).tolist()]
+
+def cells_resolution(cells):
+    """
+    Return the H3 resolution of each cell as an int8 array, read from the index bits.
+    """
+    return ((cells_to_int(cells) >> np.uint64(52)) & np.uint64(0xF)).astype(np.int8)
+
+def cells_to_parents(cells, resolution):
+    """
+    Vectorized cell_to_parent on uint64 (or hex string) cells.
+
+    Sets the resolution field and marks every digit finer than `resolution` as
+    unused (all ones), which is exactly how H3 encodes the parent index.
+
+    Parameters:
+    - cells: Array-like of H3 cells, all at resolution >= `resolution`.
+    - resolution: Parent resolution (0-15).
     Returns:
-    - Folium map object with H3 cells plotted.
+    - uint64 array of parent cells.
     """
-    geojson = mapping(shape(h3.cells_to_geo(cells)))
-    m = folium.Map(location=[55.7, 12.5], zoom_start=11)
-    folium.GeoJson(geojson, 
-                   style_function=lambda x: {
-                       'fillColor': 'blue',
-                       'color': 'blue',
-                       'weight': 2,
-                       'fillOpacity': 0.4
-                   }).add_to(m)
-    m.show_in_browser()
+    cells = cells_to_int(cells)
+    if len(cells) and cells_resolution(cells).min() < resolution:
+        raise ValueError(f"Parent resolution {resolution} is finer than some of the cells.")
+    unused_digits = np.uint64((1 << (3 * (15 - resolution))) - 1)
+    res_mask = np.uint64(0xF << 52)
+    return (cells & ~res_mask) | np.uint64(resolution << 52) | unused_digits
+
+def _fill_latlngs(cells, lats, lngs):
+    flat = np.fromiter(
+        (v for c in cells.tolist() for v in h3_basic_int.cell_to_latlng(c)),
+        dtype=np.float64,
+        count=2 * len(cells),
+    )
+    lats[:] = flat[0::2]
+    lngs[:] = flat[1::2]
+
+def cells_to_latlngs(cells, chunk_size=CENTROID_CHUNK_SIZE):
+    """
+    Compute H3 cell centroids in bulk.
+
+    Parameters:
+    - cells: Array-like of H3 cells as uint64 integers or hex strings.
+    - chunk_size: Cells converted at a time, bounding the temporary Python lists.
+    Returns:
+    - Tuple of two float64 arrays (lats, lngs).
+    """
+    cells = cells_to_int(cells)
+    lats = np.empty(len(cells), dtype=np.float64)
+    lngs = np.empty(len(cells), dtype=np.float64)
+    for start in range(0, len(cells), chunk_size):
+        stop = min(start + chunk_size, len(cells))
+        _fill_latlngs(cells[start:stop], lats[start:stop], lngs[start:stop])
+    return lats, lngs
 
 def h3list_to_centroids(cells):
     """
@@ -102,60 +399,252 @@ def h3list_to_centroids(cells):
     Returns:
     - List of tuples containing latitude and longitude of each cell centroid.
     """
+    lats, lngs = cells_to_latlngs(cells)
+    return list(zip(lats.tolist(), lngs.tolist()))
 
-    return [h3.cell_to_latlng(cell) for cell in cells]
+class ZctaStore:
+    """
+    In-memory ZCTA polygons keyed by ZIP code with an STRtree over the geometries.
 
-def zips_to_cells(zip_codes, resolution=8, data_dir=None):
+    Built once per shapefile by get_zcta_store() and shared by all ZIP helpers,
+    so ZIP-to-geometry lookups are hash lookups and point-in-ZIP lookups are
+    spatial index queries instead of full shapefile reads and scans.
     """
-    Convert one or more ZIP codes to H3 cell IDs at a specified resolution.
+
+    def __init__(self, shp_path):
+        import geopandas
+        from shapely import STRtree
+
+        gdf = geopandas.read_file(shp_path).to_crs(epsg=4326)
+        self.path = Path(shp_path)
+        self.gdf = gdf.set_index("ZCTA5CE10")
+        self.geometries = self.gdf.geometry.to_numpy()
+        self.tree = STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.gdf)
+
+    def positions(self, zip_codes):
+        """
+        Return the row positions of the given ZIP codes in file order, skipping unknown ZIPs.
+        """
+        positions = self.gdf.index.get_indexer([str(z) for z in zip_codes])
+        return sorted(set(int(p) for p in positions if p >= 0))
+
+    def geometry(self, zip_code):
+        """
+        Return the polygon for a ZIP code, or None if it is not in the dataset.
+        """
+        positions = self.positions([zip_code])
+        if not positions:
+            return None
+        return self.geometries[positions[0]]
+
+    def zip_at(self, lat, lng):
+        """
+        Return the ZIP code whose polygon contains (lat, lng), or None.
+        """
+        from shapely.geometry import Point
+
+        hits = self.tree.query(Point(lng, lat), predicate="intersects")
+        if len(hits) == 0:
+            return None
+        return self.gdf.index[int(hits.min())]
+
+    def centroids(self):
+        """
+        Return (lat, lng) float64 arrays of polygon centroids in file order, computed once.
+        """
+        if not hasattr(self, "_centroids"):
+            import shapely
+
+            points = shapely.centroid(self.geometries)
+            self._centroids = (shapely.get_y(points), shapely.get_x(points))
+        return self._centroids
+
+    def query_points(self, lats, lngs):
+        """
+        Return the row position of the polygon containing each point, -1 where none does.
+
+        When a point lies on a shared boundary, the first polygon in file order wins,
+        matching zip_at().
+        """
+        import shapely
+
+        points = shapely.points(lngs, lats)
+        point_idx, tree_idx = self.tree.query(points, predicate="intersects")
+        positions = np.full(len(points), -1, dtype=np.int64)
+        if len(point_idx):
+            order = np.lexsort((tree_idx, point_idx))
+            point_idx, tree_idx = point_idx[order], tree_idx[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            positions[point_idx[first]] = tree_idx[first]
+        return positions
+
+
+def _zip_data_dir(data_dir=None):
+    if data_dir is None:
+        return Path(__file__).parent / "data" / "zips"
+    return Path(data_dir)
+
+def get_zcta_store(data_dir=None):
+    """
+    Return the shared ZctaStore for a ZIP data directory, loading it on first use.
+    Stores stay cached until clear_zcta_cache() is called.
+
+    Parameters:
+    - data_dir: Optional base directory for the shapefile. If not provided,
+                assumes data/zips/ in the same folder as this script.
+    Returns:
+    - ZctaStore for the shapefile.
+    """
+    shp_path = (_zip_data_dir(data_dir) / ZCTA_SHAPEFILE).resolve()
+
+    with _zcta_lock:
+        store = _zcta_stores.get(shp_path)
+        if store is None:
+            store = ZctaStore(shp_path)
+            _zcta_stores[shp_path] = store
+        return store
+
+def clear_zcta_cache(data_dir=None):
+    """
+    Drop cached ZCTA stores.
+
+    Parameters:
+    - data_dir: If provided, only evict the store for this directory; otherwise evict all.
+    """
+    with _zcta_lock:
+        if data_dir is None:
+            _zcta_stores.clear()
+        else:
+            _zcta_stores.pop((_zip_data_dir(data_dir) / ZCTA_SHAPEFILE).resolve(), None)
+
+def _zip_coverage_dir(resolution, data_dir=None, coverage_dir=None):
+    if coverage_dir is None:
+        coverage_dir = _zip_data_dir(data_dir) / "coverage"
+    return Path(coverage_dir) / f"r{resolution}"
+
+def build_zip_coverage(resolutions=(8,), data_dir=None, coverage_dir=None):
+    """
+    Precompute ZIP -> H3 coverage for the given resolutions and save it to disk.
+
+    Each resolution is stored as three .npy files: sorted ZIP codes, int64 offsets
+    (len(zips) + 1) and the compacted uint64 cells of every ZIP concatenated in the
+    same order. zips_to_cells() memory-maps these and uncompacts on lookup.
+
+    Parameters:
+    - resolutions: Iterable of H3 resolutions to build.
+    - data_dir: Optional base directory for the shapefile.
+    - coverage_dir: Optional output directory, defaults to data_dir/coverage.
+    """
+    store = get_zcta_store(data_dir)
+    order = np.argsort(store.gdf.index.to_numpy(dtype=str), kind="stable")
+    zips = store.gdf.index.to_numpy(dtype=str)[order]
+    geometries = store.geometries[order]
+
+    for resolution in resolutions:
+        chunks = [h3_int.compact_cells(h3_int.geo_to_cells(polygon, res=resolution)) for polygon in geometries]
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(c) for c in chunks])
+        cells = np.concatenate(chunks).astype(np.uint64) if chunks else np.empty(0, dtype=np.uint64)
+
+        out_dir = _zip_coverage_dir(resolution, data_dir, coverage_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        np.save(out_dir / "zips.npy", zips)
+        np.save(out_dir / "offsets.npy", offsets)
+        np.save(out_dir / "cells.npy", cells)
+
+        _zip_coverage.pop(out_dir.resolve(), None)
+
+def load_zip_coverage(resolution, data_dir=None, coverage_dir=None):
+    """
+    Return the memory-mapped (zips, offsets, cells) coverage for a resolution, or None if not built.
+    """
+    out_dir = _zip_coverage_dir(resolution, data_dir, coverage_dir).resolve()
+    coverage = _zip_coverage.get(out_dir)
+    if coverage is None:
+        if not (out_dir / "cells.npy").exists():
+            return None
+        coverage = tuple(np.load(out_dir / f"{name}.npy", mmap_mode="r") for name in ("zips", "offsets", "cells"))
+        _zip_coverage[out_dir] = coverage
+    return coverage
+
+def zips_to_cells_int(zip_codes, resolution=8, data_dir=None):
+    """
+    Convert one or more ZIP codes to unique uint64 H3 cells at a specified resolution.
+
+    Uses the precomputed coverage from build_zip_coverage() when it exists for
+    the resolution, otherwise polyfills the ZIP polygons. Cells are grouped by
+    ZIP in the order the ZIP codes are given; unknown ZIPs are skipped.
 
     Parameters:
     - zip_codes: A single ZIP code or a list of ZIP codes.
     - resolution: The H3 resolution (default is 8).
-    - data_dir: Optional base directory for the shapefile. If not provided,
-                assumes it lives in the same folder as this script.
+    - data_dir: Optional base directory for the shapefile.
 
     Returns:
-    - List of H3 cell IDs covering the areas of the ZIP codes.
+    - uint64 NumPy array of H3 cells covering the areas of the ZIP codes.
     """
     if isinstance(zip_codes, (str, int)):
         zip_codes = [str(zip_codes)]
     else:
-        zip_codes = [str(z) for z in zip_codes]
+        zip_codes = list(dict.fromkeys(str(z) for z in zip_codes))
 
-    if data_dir is None:
-        data_dir = Path(__file__).parent / "data" / "zips"
+    coverage = load_zip_coverage(resolution, data_dir)
+
+    if coverage is not None:
+        zips, offsets, compacted = coverage
+        positions = np.searchsorted(zips, zip_codes)
+        positions = [int(p) for p, z in zip(positions, zip_codes) if p < len(zips) and zips[p] == z]
+        if not positions:
+            raise ValueError("None of the provided ZIP codes were found in the dataset.")
+        cells = [h3_int.uncompact_cells(np.asarray(compacted[offsets[p]:offsets[p + 1]]), resolution) for p in positions]
     else:
-        data_dir = Path(data_dir)
+        store = get_zcta_store(data_dir)
+        positions = [int(p) for p in store.gdf.index.get_indexer(zip_codes) if p >= 0]
+        if not positions:
+            raise ValueError("None of the provided ZIP codes were found in the dataset.")
+        cells = [h3_int.geo_to_cells(polygon, resolution) for polygon in store.geometries[positions]]
 
-    shp_path = data_dir / "tl_2020_us_zcta510.shp"
+    cells = np.concatenate([np.asarray(c, dtype=np.uint64) for c in cells])
+    _, first = np.unique(cells, return_index=True)
+    return cells[np.sort(first)]
 
-    zcta = geopandas.read_file(shp_path)
-    zcta_filtered = zcta[zcta['ZCTA5CE10'].isin(zip_codes)]
+def zips_to_cells(zip_codes, resolution=8, data_dir=None):
+    """
+    Convert one or more ZIP codes to H3 cell IDs at a specified resolution.
 
-    if zcta_filtered.empty:
-        raise ValueError("None of the provided ZIP codes were found in the dataset.")
-    
-    cells = []
-    for polygon in zcta_filtered.geometry.values:
-        cells.append(h3.geo_to_cells(polygon, res=resolution))
+    Uses the precomputed coverage from build_zip_coverage() when it exists for
+    the resolution, otherwise polyfills the ZIP polygons.
 
-    flat_cells = [cell for sublist in cells for cell in sublist]
-    return list(dict.fromkeys(flat_cells))
+    Parameters:
+    - zip_codes: A single ZIP code or a list of ZIP codes.
+    - resolution: The H3 resolution (default is 8).
+    - data_dir: Optional base directory for the shapefile. If not provided,
+                assumes it lives in the same folder as this script.
 
-def zip_to_centroid(zip_code, resolution=8):
+    Returns:
+    - List of H3 cell IDs covering the areas of the ZIP codes, grouped by ZIP in the given order.
+    """
+    return cells_to_str(zips_to_cells_int(zip_codes, resolution, data_dir=data_dir))
+
+def zip_to_centroid(zip_code, resolution=8, data_dir=None):
     """
     Convert a ZIP code to its centroid coordinates at a specified H3 resolution.
     Parameters:
     - zip_code: A single ZIP code.
     - resolution: The H3 resolution (default is 8).
+    - data_dir: Optional base directory for the shapefile.
     Returns:
     - Tuple containing latitude and longitude of the ZIP code centroid.
     """
-    cells = zips_to_cells(zip_code, resolution)
+    cells = zips_to_cells(zip_code, resolution, data_dir=data_dir)
     if not cells:
         raise ValueError(f"ZIP code {zip_code} not found.")
-    
+
+    from shapely.geometry import shape
+
     geo = shape(h3.cells_to_geo(cells))
 
     return (geo.centroid.x, geo.centroid.y)
@@ -173,6 +662,65 @@ def latlng_to_cell(lat, lng, resolution=8):
 
     return h3.latlng_to_cell(lat, lng, resolution)
 
+def _geojson_polygons(geo):
+    """
+    Merge a GeoJSON geometry, Feature or FeatureCollection of polygons into one MultiPolygon dict.
+    """
+    kind = geo.get("type")
+    if kind == "FeatureCollection":
+        parts = [_geojson_polygons(feature) for feature in geo.get("features", [])]
+        return {"type": "MultiPolygon", "coordinates": [p for part in parts for p in part["coordinates"]]}
+    if kind == "Feature":
+        return _geojson_polygons(geo.get("geometry") or {})
+    if kind == "Polygon":
+        return {"type": "MultiPolygon", "coordinates": [geo["coordinates"]]}
+    if kind == "MultiPolygon":
+        return geo
+    raise ValueError(f"Expected a GeoJSON polygon, multipolygon, feature or feature collection, got '{kind}'")
+
+def region_cells(resolution, lat=None, lng=None, k=0, polygon=None, zip_codes=None, data_dir=None):
+    """
+    Turn a region into the set of H3 cells covering it at a resolution.
+
+    Exactly one region is given: a k-ring around (lat, lng), a polygon, or a set
+    of ZIP codes. Polygons and ZIPs are covered by the cells whose centres lie
+    inside them.
+
+    Parameters:
+    - resolution: The H3 resolution of the cells.
+    - lat, lng: Centre of a k-ring; k is its radius in cells (0 is the one cell).
+    - polygon: A shapely geometry, a GeoJSON dict (a geometry, Feature or
+               FeatureCollection of polygons) or anything else with
+               __geo_interface__ (lng, lat order), an h3 LatLngPoly, or a
+               sequence of (lat, lng) vertices.
+    - zip_codes: A single ZIP code or a list of ZIP codes (see zips_to_cells()).
+    - data_dir: Optional base directory for the ZIP shapefile.
+    Returns:
+    - Sorted uint64 array of unique cells.
+    """
+    given = [lat is not None or lng is not None, polygon is not None, zip_codes is not None]
+    if sum(given) != 1:
+        raise ValueError("Give exactly one region: lat and lng, polygon or zip_codes")
+
+    if given[0]:
+        if lat is None or lng is None:
+            raise ValueError("A k-ring needs both lat and lng")
+        if k < 0:
+            raise ValueError(f"k must be at least 0, got {k}")
+        cells = h3_int.grid_disk(h3_int.latlng_to_cell(lat, lng, resolution), int(k))
+    elif given[1]:
+        if isinstance(polygon, h3.H3Shape):
+            cells = h3_int.h3shape_to_cells(polygon, resolution)
+        elif isinstance(polygon, dict):
+            cells = h3_int.geo_to_cells(_geojson_polygons(polygon), resolution)
+        elif hasattr(polygon, "__geo_interface__"):
+            cells = h3_int.geo_to_cells(polygon, resolution)
+        else:
+            cells = h3_int.h3shape_to_cells(h3.LatLngPoly([tuple(p) for p in polygon]), resolution)
+    else:
+        cells = zips_to_cells_int(zip_codes, resolution, data_dir=data_dir)
+    return np.unique(np.asarray(cells, dtype=np.uint64))
+
 def latlng_to_zip_centroid(lat, lng, resolution=8, data_dir=None):
     """
     Convert latitude and longitude to the centroid of the ZIP code at a specified H3 resolution.
@@ -187,28 +735,60 @@ def latlng_to_zip_centroid(lat, lng, resolution=8, data_dir=None):
     Returns:
     - Dict containing (lat, lng) of the ZIP code centroid.
     """
-    if data_dir is None:
-        data_dir = Path(__file__).parent / "data" / "zips"
-    else:
-        data_dir = Path(data_dir)
-
-    shp_path = data_dir / "tl_2020_us_zcta510.shp"
+    zip_code = get_zcta_store(data_dir).zip_at(lat, lng)
 
-    zip_gdf = geopandas.read_file(shp_path)
-    zip_gdf = zip_gdf.to_crs(epsg=4326)
+    if zip_code is None:
+        raise ValueError(f"No ZIP code found for the coordinates ({lat}, {lng}).")
+    
+    return {zip_code: zip_to_centroid(zip_code, resolution=resolution, data_dir=data_dir)}
 
-    point = Point(lng, lat)
+def latlngs_to_zips(lats, lngs, return_centroids=False, data_dir=None, chunk_size=ZIP_LOOKUP_CHUNK_SIZE):
+    """
+    Resolve arrays of coordinates to the ZIP codes containing them in bulk.
 
-    match = zip_gdf[zip_gdf.intersects(point)]
+    Points are processed in chunks of chunk_size, so only one chunk of shapely
+    points and index hits is alive at a time regardless of the batch size.
 
-    if not match.empty:
-        zip_code = match.iloc[0]['ZCTA5CE10']
-    else:
-        raise ValueError(f"No ZIP code found for the coordinates ({lat}, {lng}).")
-    
-    return {zip_code: zip_to_centroid(zip_code, resolution=resolution)}
+    Parameters:
+    - lats: Array-like of latitudes.
+    - lngs: Array-like of longitudes, same length as lats.
+    - return_centroids: If True, also return the ZIP polygon centroids.
+    - data_dir: Optional base directory for the shapefile.
+    - chunk_size: Number of points queried against the spatial index at once.
 
-def plot_zip(zip_code, data_dir=None, zoom_start=11):
+    Returns:
+    - Object array of ZIP codes, None where a point is outside every ZIP.
+    - If return_centroids is True, a tuple (zips, centroid_lats, centroid_lngs)
+      with NaN centroids for unmatched points.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if lats.shape != lngs.shape:
+        raise ValueError("lats and lngs must have the same shape.")
+
+    store = get_zcta_store(data_dir)
+    zip_codes = store.gdf.index.to_numpy(dtype=object)
+
+    positions = np.empty(len(lats), dtype=np.int64)
+    for start in range(0, len(lats), chunk_size):
+        stop = start + chunk_size
+        positions[start:stop] = store.query_points(lats[start:stop], lngs[start:stop])
+
+    found = positions >= 0
+    zips = np.full(len(lats), None, dtype=object)
+    zips[found] = zip_codes[positions[found]]
+
+    if not return_centroids:
+        return zips
+
+    centroid_lats, centroid_lngs = store.centroids()
+    out_lats = np.full(len(lats), np.nan)
+    out_lngs = np.full(len(lats), np.nan)
+    out_lats[found] = centroid_lats[positions[found]]
+    out_lngs[found] = centroid_lngs[positions[found]]
+    return zips, out_lats, out_lngs
+
+def plot_zip(zip_code, data_dir=None, zoom_start=11, path=None, show=None):
     """
     Plot a single ZIP code polygon using plot_shape().
 
@@ -220,6 +800,8 @@ def plot_zip(zip_code, data_dir=None, zoom_start=11):
         Path to the shapefile with ZIP code geometries
     zoom_start : int, Optional
         Initial zoom level for the folium map
+    path, show : Optional
+        Save and/or open the map; see plot_df()
 
     Returns
     _______
@@ -227,23 +809,10 @@ def plot_zip(zip_code, data_dir=None, zoom_start=11):
         Folium map centered on the requested ZIP code
     """
 
-    if data_dir is None:
-        data_dir = Path(__file__).parent / "data" / "zips"
-    else:
-        data_dir = Path(data_dir)
-
-    shp_path = data_dir / "tl_2020_us_zcta510.shp"
-
-    gdf = geopandas.read_file(shp_path)
-
-    row = gdf.loc[gdf["ZCTA5CE10"] == str(zip_code)]
-
-    if row.empty:
-        raise ValueError(f"ZIP code {zip_code} not found in {shp_path}")
-
-    shape = row.iloc[0].geometry
-
-    plot_shape(shape, zoom_start=zoom_start)
-
+    store = get_zcta_store(data_dir)
+    shape = store.geometry(zip_code)
 
+    if shape is None:
+        raise ValueError(f"ZIP code {zip_code} not found in {store.path}")
 
+    return plot_shape(shape, zoom_start=zoom_start, path=path, show=show)
\ No newline at end of file
@@ -0,0 +1,155 @@
+import importlib.util
+import json
+from pathlib import Path
+
+import h3
+
+OUTPUT_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".ndjson": "geojsonseq",
+    ".geojsonl": "geojsonseq",
+    ".geojsons": "geojsonseq",
+}
+GEOMETRIES = ("point", "polygon")
+
+
+def output_format(path, fmt=None):
+    """
+    Output format for a path: `fmt` if given, else inferred from the file suffix (see OUTPUT_FORMATS).
+    Raises ValueError for unknown formats and for Parquet without pyarrow.
+    """
+    if fmt is None:
+        fmt = OUTPUT_FORMATS.get(Path(path).suffix.lower())
+        if fmt is None:
+            raise ValueError(f"Cannot tell the output format of '{path}', expected one of {sorted(OUTPUT_FORMATS)}")
+    if fmt not in OUTPUT_FORMATS.values():
+        raise ValueError(f"Unknown output format '{fmt}', expected one of {sorted(set(OUTPUT_FORMATS.values()))}")
+    if fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("Parquet output needs pyarrow; write CSV or NDJSON instead")
+    return fmt
+
+
+class CSVWriter:
+    """
+    Append DataFrame chunks to one CSV file, with the header taken from the first chunk.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "w", newline="")
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self._file, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Append DataFrame chunks to one Parquet file, one row group per chunk. Needs pyarrow.
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Parquet output needs pyarrow; write CSV or NDJSON instead")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = Path(path)
+        self._writer = None
+
+    def write(self, df):
+        table = self._pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class GeoJSONSeqWriter:
+    """
+    Write DataFrame chunks as newline-delimited GeoJSON: one Feature per row.
+
+    Geometry is the cell centroid ('point', from lat/lng) or the hexagon
+    ('polygon', from the h3 column). Every other column becomes a property;
+    missing values are written as null.
+    """
+
+    def __init__(self, path, geometry="point"):
+        if geometry not in GEOMETRIES:
+            raise ValueError(f"Unknown geometry '{geometry}', expected one of {GEOMETRIES}")
+        self.path = Path(path)
+        self.geometry = geometry
+        self._file = open(self.path, "w")
+
+    def _geometries(self, df):
+        if self.geometry == "point":
+            return ({"type": "Point", "coordinates": [lng, lat]}
+                    for lat, lng in zip(df["lat"].tolist(), df["lng"].tolist()))
+        rings = []
+        for cell in df["h3"].tolist():
+            ring = [[lng, lat] for lat, lng in h3.cell_to_boundary(cell)]
+            rings.append({"type": "Polygon", "coordinates": [ring + ring[:1]]})
+        return rings
+
+    def write(self, df):
+        properties = df.astype(object).where(df.notna(), None)
+        lines = [
+            json.dumps({"type": "Feature", "geometry": geometry, "properties": row})
+            for geometry, row in zip(self._geometries(df), properties.to_dict("records"))
+        ]
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+def open_writer(path, fmt=None, geometry="point"):
+    """
+    Open a chunk writer for path.
+
+    Parameters:
+    - path: Output file.
+    - fmt: 'csv', 'parquet' or 'geojsonseq'; inferred from the suffix when None.
+    - geometry: Feature geometry for 'geojsonseq', 'point' or 'polygon'.
+    Returns:
+    - Writer with write(df) and close().
+    """
+    fmt = output_format(path, fmt)
+    if fmt == "csv":
+        return CSVWriter(path)
+    if fmt == "parquet":
+        return ParquetWriter(path)
+    return GeoJSONSeqWriter(path, geometry)
+
+
+def write_chunks(chunks, path, fmt=None, geometry="point"):
+    """
+    Stream an iterable of DataFrames to one file, holding only one chunk in memory.
+
+    Parameters:
+    - chunks: Iterable of DataFrames with the same columns, e.g. the iterator of
+              queries.stream_top_centroids_by_strategy().
+    - path, fmt, geometry: See open_writer().
+    Returns:
+    - Number of rows written.
+    """
+    writer = open_writer(path, fmt, geometry)
+    rows = 0
+    try:
+        for df in chunks:
+            writer.write(df)
+            rows += len(df)
+    finally:
+        writer.close()
+    return rows
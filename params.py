@@ -0,0 +1,68 @@
+SELECT_PARAMS = {
+    "total_count": int,
+    "resolution": int,
+    "method": str,
+    "min_per_country": int,
+    "max_per_country": int,
+    "threshold": float,
+    "urban_fraction": float,
+    "seed": int,
+    "rural_mode": str,
+    "fixed_country": str,
+    "fixed_count": int,
+    "countries": list,
+}
+
+REGION_PARAMS = {
+    "resolution": int,
+    "count": int,
+    "lat": float,
+    "lng": float,
+    "k": int,
+    "polygon": dict,
+    "zip_codes": list,
+}
+
+
+def _parse_params(payload, spec, required):
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    unknown = set(payload) - set(spec)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+    for name in required:
+        if payload.get(name) is None:
+            raise ValueError(f"Missing parameter '{name}'")
+    params = {}
+    for name, value in payload.items():
+        if value is None:
+            # null leaves an optional parameter at its default (countries: all of them).
+            continue
+        if spec[name] is list:
+            if not isinstance(value, list):
+                raise ValueError(f"'{name}' must be a list")
+            params[name] = [str(v) for v in value]
+        elif spec[name] is dict:
+            if not isinstance(value, dict):
+                raise ValueError(f"'{name}' must be a JSON object")
+            params[name] = value
+        else:
+            try:
+                params[name] = spec[name](value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for '{name}': {value!r}")
+    return params
+
+
+def parse_select(payload):
+    """
+    Validate a /select request body into keyword arguments for get_top_centroids_by_strategy.
+    """
+    return _parse_params(payload, SELECT_PARAMS, ("total_count", "resolution"))
+
+
+def parse_region(payload):
+    """
+    Validate a /region request body into keyword arguments for get_top_centroids_in_region.
+    """
+    return _parse_params(payload, REGION_PARAMS, ("resolution",))
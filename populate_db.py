@@ -1,141 +1,493 @@
+import argparse
+import hashlib
+import json
 import sqlite3
+import sys
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely.geometry import Point
 import h3raster
+from columnstore import ColumnStore, read_snapshot_manifest
+from country_lookup import CountryLookup, COUNTRY_CELLS_TABLE, COUNTRY_CELLS_RESOLUTION, assign_countries
+from timezones import exact_cells_to_timezones
 from pathlib import Path
-import h3
 
-def insert_global_data_r6(data_dir=None):
-    """Insert global population data with country codes into a SQLite database.
+KONTUR_RELEASE = "20231101"
+DB_REL = f"populations/kontur_population_{KONTUR_RELEASE}_COMBINED.db"
+WORLD_SHP_REL = "world-administrative-boundaries/world-administrative-boundaries.shp"
+INGEST_BATCH_SIZE = 500_000
+# build_pyramid group-sums its pending partial sums once they pass this many rows.
+PYRAMID_REDUCE_ROWS = 10_000_000
+SNAPSHOT_REL = "populations/snapshot"
+MANIFEST_TABLE = "build_manifest"
+CHECKSUM_TABLE = "file_checksums"
+
+COUNTRY_STATS_TABLE = "country_stats"
+TABLE_VERSIONS_TABLE = "table_versions"
+STATS_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+STATS_TOP_FRACTIONS = (0.001, 0.01, 0.1, 0.5)
+
+HEX_COLUMNS = ["h3", "population", "country", "lat", "lng", "tz_name", "utc_offset"]
+SCHEMA_VERSION = 3
+
+def bump_table_version(conn, table):
+    """
+    Give a hex table a new random version stamp. Called by every writer of hex
+    tables and country_stats, inside the caller's transaction; result caches key
+    on the stamp (see queries.data_version), so a rewrite invalidates them.
+    """
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS_TABLE} (hex_table TEXT PRIMARY KEY, version TEXT, updated_at TEXT)"
+    )
+    conn.execute(
+        f"INSERT OR REPLACE INTO {TABLE_VERSIONS_TABLE} VALUES (?, ?, ?)",
+        (table, uuid.uuid4().hex, datetime.now(timezone.utc).isoformat()),
+    )
+
+def create_hex_table(conn, table, integer_h3=True):
+    """
+    (Re)create a hex population table.
+
+    With integer_h3 the h3 column holds the cell's 64-bit index as a signed
+    INTEGER (H3 indexes never set the top bit, so the value is unchanged) and is
+    the primary key of a WITHOUT ROWID table. A `<table>_hex` view exposes the
+    same rows with h3 as the usual hex string for existing consumers.
 
     Parameters:
-    - data_dir: Optional base directory for the data. If not provided,
-                assumes it lives in the same folder as this script.
+    - conn: Open sqlite3 connection.
+    - table: Table name, e.g. 'hex_pops_r8'.
+    - integer_h3: Store h3 as INTEGER (default) instead of TEXT.
     """
-    if data_dir is None:
-        data_dir = Path(__file__).parent / "data"
+    conn.execute(f"DROP VIEW IF EXISTS {table}_hex")
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    h3_type = "INTEGER" if integer_h3 else "TEXT"
+    conn.execute(
+        f"CREATE TABLE {table} (h3 {h3_type} PRIMARY KEY, population REAL, country TEXT, lat REAL, lng REAL, "
+        "tz_name TEXT, utc_offset REAL) WITHOUT ROWID"
+    )
+    if integer_h3:
+        conn.execute(
+            f"CREATE VIEW {table}_hex AS "
+            f"SELECT printf('%x', h3) AS h3, population, country, lat, lng, tz_name, utc_offset FROM {table}"
+        )
+    bump_table_version(conn, table)
+
+def append_hex_rows(conn, table, df, integer_h3=True):
+    """
+    Insert the HEX_COLUMNS of a DataFrame into a table made by create_hex_table().
+    tz_name and utc_offset are looked up from the cells when df lacks them.
+    The caller owns the transaction.
+    """
+    cells = h3raster.cells_to_int(df["h3"].to_numpy())
+    h3_values = cells.view(np.int64).tolist() if integer_h3 else h3raster.cells_to_str(cells)
+    if "tz_name" in df:
+        tz_names, utc_offsets = df["tz_name"].to_numpy(dtype=object), df["utc_offset"].to_numpy(dtype=np.float64)
     else:
-        data_dir = Path(data_dir)
+        tz_names, utc_offsets = exact_cells_to_timezones(cells)
+    country = df["country"].astype(object).where(df["country"].notna(), None)
+    rows = zip(
+        h3_values,
+        df["population"].tolist(),
+        country.tolist(),
+        df["lat"].tolist(),
+        df["lng"].tolist(),
+        tz_names.tolist(),
+        [None if np.isnan(o) else o for o in utc_offsets.tolist()],
+    )
+    conn.executemany(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    bump_table_version(conn, table)
 
-    pop_gpkg_path = data_dir / "populations" / "kontur_population_20231101_r6.gpkg"
-    world_shp_path = data_dir / "world-administrative-boundaries" / "world-administrative-boundaries.shp"
-    db_path = data_dir / "populations" / "kontur_population_20231101_COMBINED.db"
+def write_hex_table(conn, table, df, integer_h3=True):
+    """
+    Replace a hex population table with the contents of df.
+    Cells matched to more than one country polygon keep the first match.
+    """
+    df = df.drop_duplicates(subset="h3")
+    create_hex_table(conn, table, integer_h3=integer_h3)
+    append_hex_rows(conn, table, df, integer_h3=integer_h3)
+    conn.commit()
 
-    pop_gdf = gpd.read_file(pop_gpkg_path, layer="population")
+def convert_table_to_integer_h3(table, data_dir=None, db_rel=DB_REL):
+    """
+    Rewrite an existing TEXT-keyed hex table in place with INTEGER h3 keys,
+    adding the timezone columns if the table predates them.
 
-    def get_lat_lng(h3_cell):
-        return h3raster.h3list_to_centroids([h3_cell])[0]
+    Parameters:
+    - table: Table to convert, e.g. 'hex_pops_r8'.
+    - data_dir: Optional base directory for the data.
+    - db_rel: Database path relative to data_dir.
+    """
+    conn = sqlite3.connect(_data_dir(data_dir) / db_rel)
+
+    existing = {r[1] for r in conn.execute(f"PRAGMA table_info('{table}')")}
+    columns = [c for c in HEX_COLUMNS if c in existing]
+    df = pd.read_sql_query(f"SELECT {', '.join(columns)} FROM {table}", conn)
+    write_hex_table(conn, table, df, integer_h3=True)
+    index_hex_table(conn, table)
+    conn.execute("VACUUM")
+    conn.close()
 
-    pop_gdf["lat_lng"] = pop_gdf["h3"].apply(get_lat_lng)
-    pop_gdf["lat"] = pop_gdf["lat_lng"].apply(lambda x: x[0])
-    pop_gdf["lng"] = pop_gdf["lat_lng"].apply(lambda x: x[1])
-    pop_gdf.drop(columns=["lat_lng"], inplace=True)
+def _data_dir(data_dir=None):
+    return Path(__file__).parent / "data" if data_dir is None else Path(data_dir)
 
-    world_gdf = gpd.read_file(world_shp_path)
+def _ensure_manifest(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} ("
+        "stage TEXT PRIMARY KEY, checksum TEXT, outputs TEXT, last_batch INTEGER, completed INTEGER, updated_at TEXT)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHECKSUM_TABLE} (path TEXT PRIMARY KEY, stamp TEXT, checksum TEXT)"
+    )
 
-    pop_gdf["geometry"] = pop_gdf.apply(lambda row: Point(row["lng"], row["lat"]), axis=1)
-    pop_gdf = pop_gdf.set_geometry("geometry")
-    pop_gdf.crs = world_gdf.crs
+def get_stage(conn, stage):
+    """
+    Return the manifest row of a build stage as a dict, or None if the stage never ran.
+    """
+    _ensure_manifest(conn)
+    row = conn.execute(
+        f"SELECT checksum, outputs, last_batch, completed, updated_at FROM {MANIFEST_TABLE} WHERE stage = ?", (stage,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "checksum": row[0],
+        "outputs": json.loads(row[1]),
+        "last_batch": row[2],
+        "completed": bool(row[3]),
+        "updated_at": row[4],
+    }
+
+def _stage_owners(conn, stage, outputs):
+    """
+    Other stages that list one of `outputs` as their output table, as {stage: [tables]}.
+    """
+    _ensure_manifest(conn)
+    owners = {}
+    for other, other_outputs in conn.execute(
+        f"SELECT stage, outputs FROM {MANIFEST_TABLE} WHERE stage != ?", (stage,)
+    ).fetchall():
+        shared = sorted(set(json.loads(other_outputs)) & set(outputs))
+        if shared:
+            owners[other] = shared
+    return owners
+
+def _set_stage(conn, stage, checksum, outputs, last_batch=-1, completed=False, force=False):
+    """
+    Upsert a manifest row. Runs inside the caller's transaction.
 
-    pop_with_country = gpd.sjoin(pop_gdf, world_gdf[["geometry", "iso3"]], how="left", predicate="within")
-    pop_with_country = pop_with_country.rename(columns={"iso3": "country"})
-    pop_with_country = pop_with_country.drop(columns=["index_right"])
+    A stage may not take over a table another stage produced: that raises
+    ValueError, unless force is set, in which case the other stage is dropped
+    since the table it produced is being overwritten.
+    """
+    owners = _stage_owners(conn, stage, outputs)
+    if owners and not force:
+        taken = "; ".join(f"{', '.join(tables)} by '{other}'" for other, tables in owners.items())
+        raise ValueError(f"Stage '{stage}' would overwrite tables built by other stages ({taken}); use --force")
+    for other in owners:
+        conn.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE stage = ?", (other,))
+    conn.execute(
+        f"INSERT INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(stage) DO UPDATE SET checksum = excluded.checksum, outputs = excluded.outputs, "
+        "last_batch = excluded.last_batch, completed = excluded.completed, updated_at = excluded.updated_at",
+        (stage, checksum, json.dumps(sorted(outputs)), last_batch, int(completed),
+         datetime.now(timezone.utc).isoformat()),
+    )
 
-    conn = sqlite3.connect(db_path)
-    pop_with_country.drop(columns=["geometry"], inplace=True)
-    pop_with_country.to_sql("hex_pops_r6", conn, if_exists="replace", index=False)
+def file_checksum(conn, path):
+    """
+    SHA-256 of a file, cached in the database by (size, mtime) so unchanged
+    multi-GB sources are not re-hashed on every run. Shapefiles include their
+    .dbf/.shx sidecars.
+    """
+    path = Path(path).resolve()
+    parts = [path] + [path.with_suffix(ext) for ext in (".dbf", ".shx", ".prj") if path.suffix == ".shp"]
+    parts = [p for p in parts if p.exists()]
+    stamp = ";".join(f"{p.name}:{p.stat().st_size}:{p.stat().st_mtime_ns}" for p in parts)
+
+    _ensure_manifest(conn)
+    row = conn.execute(f"SELECT stamp, checksum FROM {CHECKSUM_TABLE} WHERE path = ?", (str(path),)).fetchone()
+    if row is not None and row[0] == stamp:
+        return row[1]
+
+    digest = hashlib.sha256()
+    for part in parts:
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                digest.update(block)
+    checksum = digest.hexdigest()
+    with conn:
+        conn.execute(f"INSERT OR REPLACE INTO {CHECKSUM_TABLE} VALUES (?, ?, ?)", (str(path), stamp, checksum))
+    return checksum
+
+def _stage_checksum(**inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def hex_tables(conn):
+    """Names of the hex_pops_r<N> tables in the database, finest first."""
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'hex_pops_r[0-9]*'"
+    )]
+    return sorted(names, key=lambda n: -int(n.rsplit("_r", 1)[1]))
+
+def kontur_gpkg_path(resolution, data_dir=None):
+    """Path of the global Kontur population GeoPackage for a resolution."""
+    return _data_dir(data_dir) / "populations" / f"kontur_population_{KONTUR_RELEASE}_r{resolution}.gpkg"
+
+def load_world_boundaries(data_dir=None, world_shp_rel=WORLD_SHP_REL):
+    """
+    Read the world administrative boundaries once and build their spatial index.
 
-    conn.commit()
-    conn.close()
+    Returns:
+    - GeoDataFrame with geometry and iso3 columns whose sindex is already built.
+    """
+    world_gdf = gpd.read_file(_data_dir(data_dir) / world_shp_rel)[["geometry", "iso3"]]
+    world_gdf.sindex
+    return world_gdf
 
-def insert_global_data_r4(data_dir=None):
-    """Insert global population data with country codes into a SQLite database.
+def build_country_lookup(data_dir=None, resolution=COUNTRY_CELLS_RESOLUTION):
+    """
+    Build the H3 country cell sets from the world boundaries and store them in the database.
 
     Parameters:
-    - data_dir: Optional base directory for the data. If not provided,
-                assumes it lives in the same folder as this script.
+    - data_dir: Optional base directory for the data.
+    - resolution: Polyfill resolution of the cell sets.
+
+    Returns:
+    - The CountryLookup that was saved.
     """
-    if data_dir is None:
-        data_dir = Path(__file__).parent / "data"
-    else:
-        data_dir = Path(data_dir)
+    lookup = CountryLookup.build(load_world_boundaries(data_dir), resolution=resolution)
+    conn = sqlite3.connect(_data_dir(data_dir) / DB_REL)
+    lookup.save(conn)
+    conn.close()
+    print(f"Wrote {len(lookup):,} compacted country cells to '{COUNTRY_CELLS_TABLE}'")
+    return lookup
 
-    pop_gpkg_path = data_dir / "populations" / "kontur_population_20231101_r4.gpkg"
-    world_shp_path = data_dir / "world-administrative-boundaries" / "world-administrative-boundaries.shp"
-    db_path = data_dir / "populations" / "kontur_population_20231101_COMBINED.db"
+def load_country_lookup(data_dir=None, build=True):
+    """
+    Load the stored CountryLookup, building it first if it is missing and build is True.
+    """
+    conn = sqlite3.connect(_data_dir(data_dir) / DB_REL)
+    lookup = CountryLookup.load(conn)
+    conn.close()
+    if lookup is None and build:
+        lookup = build_country_lookup(data_dir)
+    return lookup
 
-    pop_gdf = gpd.read_file(pop_gpkg_path, layer="population")
+def ensure_country_lookup(data_dir=None, force=False):
+    """
+    Rebuild the stored CountryLookup only when the boundary shapefile changed.
 
-    def get_lat_lng(h3_cell):
-        return h3raster.h3list_to_centroids([h3_cell])[0]
+    Returns:
+    - Checksum identifying the boundaries the stored lookup was built from.
+    """
+    conn = sqlite3.connect(_data_dir(data_dir) / DB_REL)
+    checksum = _stage_checksum(
+        world=file_checksum(conn, _data_dir(data_dir) / WORLD_SHP_REL),
+        resolution=COUNTRY_CELLS_RESOLUTION,
+    )
+    state = get_stage(conn, "country_cells")
+    fresh = state is not None and state["completed"] and state["checksum"] == checksum
+    if force or not fresh or not _table_exists(conn, COUNTRY_CELLS_TABLE):
+        build_country_lookup(data_dir)
+        with conn:
+            _set_stage(conn, "country_cells", checksum, [COUNTRY_CELLS_TABLE], completed=True, force=force)
+    conn.close()
+    return checksum
 
-    pop_gdf["lat_lng"] = pop_gdf["h3"].apply(get_lat_lng)
-    pop_gdf["lat"] = pop_gdf["lat_lng"].apply(lambda x: x[0])
-    pop_gdf["lng"] = pop_gdf["lat_lng"].apply(lambda x: x[1])
-    pop_gdf.drop(columns=["lat_lng"], inplace=True)
+def batch_ranges(gpkg_path, batch_size=INGEST_BATCH_SIZE):
+    """
+    Split the GeoPackage population layer into [start, stop) fid ranges of batch_size rows.
+    """
+    conn = sqlite3.connect(gpkg_path)
+    lo, hi = conn.execute("SELECT MIN(fid), MAX(fid) FROM population").fetchone()
+    conn.close()
+    if lo is None:
+        return []
+    return [(start, min(start + batch_size, hi + 1)) for start in range(lo, hi + 1, batch_size)]
 
-    world_gdf = gpd.read_file(world_shp_path)
+def read_batch(gpkg_path, fid_range):
+    """
+    Read h3 and population for one fid range straight from the GeoPackage's SQLite table,
+    skipping the hexagon geometries.
+    """
+    conn = sqlite3.connect(gpkg_path)
+    batch = pd.read_sql_query(
+        "SELECT h3, population FROM population WHERE fid >= ? AND fid < ? ORDER BY fid",
+        conn,
+        params=fid_range,
+    )
+    conn.close()
+    return batch
 
-    pop_gdf["geometry"] = pop_gdf.apply(lambda row: Point(row["lng"], row["lat"]), axis=1)
-    pop_gdf = pop_gdf.set_geometry("geometry")
-    pop_gdf.crs = world_gdf.crs
+def _countries_for(cells, lats, lngs, world_gdf, lookup=None):
+    if lookup is None:
+        return assign_countries(lats, lngs, world_gdf)
+    return lookup.assign(cells, lats, lngs, world_gdf)
 
-    pop_with_country = gpd.sjoin(pop_gdf, world_gdf[["geometry", "iso3"]], how="left", predicate="within")
-    pop_with_country = pop_with_country.rename(columns={"iso3": "country"})
-    pop_with_country = pop_with_country.drop(columns=["index_right"])
+def process_batch(batch, world_gdf, lookup=None):
+    """
+    Attach centroid lat/lng, country and timezone to a batch of h3/population rows.
+    With a CountryLookup, only cells near borders are tested against the polygons.
 
-    conn = sqlite3.connect(db_path)
-    pop_with_country.drop(columns=["geometry"], inplace=True)
-    pop_with_country.to_sql("hex_pops_r4", conn, if_exists="replace", index=False)
+    Returns:
+    - DataFrame with HEX_COLUMNS and h3 as uint64.
+    """
+    cells = h3raster.cells_to_int(batch["h3"].to_numpy())
+    lats, lngs = h3raster.cells_to_latlngs(cells)
+    tz_names, utc_offsets = exact_cells_to_timezones(cells)
+    return pd.DataFrame({
+        "h3": cells,
+        "population": batch["population"].to_numpy(dtype=np.float64),
+        "country": _countries_for(cells, lats, lngs, world_gdf, lookup),
+        "lat": lats,
+        "lng": lngs,
+        "tz_name": tz_names,
+        "utc_offset": utc_offsets,
+    })
+
+_worker_world_gdf = None
+_worker_lookup = None
+
+def _init_ingest_worker(data_dir, country_cells):
+    global _worker_world_gdf, _worker_lookup
+    _worker_world_gdf = load_world_boundaries(data_dir)
+    _worker_lookup = load_country_lookup(data_dir, build=False) if country_cells else None
+
+def _ingest_shard(gpkg_path, fid_range):
+    return process_batch(read_batch(gpkg_path, fid_range), _worker_world_gdf, _worker_lookup)
+
+def iter_processed_batches(gpkg_path, fid_ranges, data_dir=None, workers=1, country_cells=True):
+    """
+    Yield process_batch() results for each fid range, in fid order.
 
-    conn.commit()
-    conn.close()
+    With workers > 1 the shards are computed in a process pool, each worker loading
+    the boundaries once. At most 2 * workers shards are in flight so finished
+    results cannot pile up ahead of the writer, and yielding in submission order
+    keeps the output identical for any worker count.
+    """
+    if workers <= 1:
+        world_gdf = load_world_boundaries(data_dir)
+        lookup = load_country_lookup(data_dir, build=False) if country_cells else None
+        for fid_range in fid_ranges:
+            yield process_batch(read_batch(gpkg_path, fid_range), world_gdf, lookup)
+        return
+
+    initargs = (data_dir, country_cells)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_ingest_worker, initargs=initargs) as executor:
+        pending = deque()
+        for fid_range in fid_ranges:
+            pending.append(executor.submit(_ingest_shard, gpkg_path, fid_range))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def ingest(resolution, data_dir=None, gpkg_path=None, table=None, batch_size=INGEST_BATCH_SIZE, integer_h3=True,
+           workers=1, country_cells=True, resume=True, force=False):
+    """
+    Stream a Kontur population GeoPackage into the combined SQLite database.
 
-def insert_global_data_r8(data_dir=None):
-    """Insert global population data with country codes into a SQLite database in chunks."""
-    if data_dir is None:
-        data_dir = Path(__file__).parent / "data"
-    else:
-        data_dir = Path(data_dir)
+    The GeoPackage is read in fid-range batches of batch_size rows; each batch gets
+    vectorized centroids and a country from the prebuilt boundary index and is
+    appended in its own transaction, so peak memory follows batch_size rather than
+    the size of the file.
 
-    pop_gpkg_path = data_dir / "populations" / "kontur_population_20231101_r8.gpkg"
-    world_shp_path = data_dir / "world-administrative-boundaries" / "world-administrative-boundaries.shp"
-    db_path = data_dir / "populations" / "kontur_population_20231101_COMBINED.db"
+    Progress is tracked in the build manifest: the stage is keyed by a checksum of
+    the source file, the country boundaries and the parameters, and every batch
+    commits together with its index. A finished stage with unchanged inputs is
+    skipped and an interrupted one resumes after its last committed batch.
 
-    pop_gdf = gpd.read_file(pop_gpkg_path, layer="population")
+    Parameters:
+    - resolution: H3 resolution of the source file.
+    - data_dir: Optional base directory for the data.
+    - gpkg_path: Source GeoPackage, defaults to kontur_gpkg_path(resolution).
+    - table: Output table, defaults to hex_pops_r<resolution>.
+    - batch_size: Rows per batch.
+    - integer_h3: Store h3 as INTEGER keys (see create_hex_table).
+    - workers: Processes computing centroids and countries; this process stays the
+               single SQLite writer. Output does not depend on the worker count.
+    - country_cells: Assign countries through the stored CountryLookup (built on
+                     first use) instead of testing every centroid against the polygons.
+    - resume: Continue an interrupted run with the same inputs instead of restarting.
+    - force: Rebuild even if the manifest says the table is up to date, and
+             overwrite the table if another stage (e.g. aggregate) built it.
+
+    Returns:
+    - Number of rows written by this call.
+    """
+    gpkg_path = kontur_gpkg_path(resolution, data_dir) if gpkg_path is None else Path(gpkg_path)
+    table = f"hex_pops_r{resolution}" if table is None else table
+    stage = f"ingest:{table}"
 
-    def get_lat_lng(h3_cell):
-        return h3raster.h3list_to_centroids([h3_cell])[0]
+    conn = sqlite3.connect(_data_dir(data_dir) / DB_REL)
+    if country_cells:
+        boundaries = ensure_country_lookup(data_dir)
+    else:
+        boundaries = file_checksum(conn, _data_dir(data_dir) / WORLD_SHP_REL)
+    checksum = _stage_checksum(
+        schema=SCHEMA_VERSION,
+        source=file_checksum(conn, gpkg_path),
+        boundaries=boundaries,
+        batch_size=batch_size,
+        integer_h3=integer_h3,
+        country_cells=country_cells,
+    )
 
-    pop_gdf["lat"], pop_gdf["lng"] = zip(*pop_gdf["h3"].map(get_lat_lng))
+    state = get_stage(conn, stage)
+    same_inputs = state is not None and state["checksum"] == checksum and _table_exists(conn, table)
+    if same_inputs and state["completed"] and not force:
+        conn.close()
+        print(f"'{table}' is up to date, skipping")
+        return 0
 
-    world_gdf = gpd.read_file(world_shp_path)
+    start = 0
+    if same_inputs and resume and not force:
+        start = state["last_batch"] + 1
+        print(f"Resuming '{table}' at batch {start}")
+    else:
+        try:
+            _set_stage(conn, stage, checksum, [table], force=force)
+        except ValueError:
+            conn.close()
+            raise
+        create_hex_table(conn, table, integer_h3=integer_h3)
+        conn.commit()
+
+    written = 0
+    fid_ranges = batch_ranges(gpkg_path, batch_size)
+    batches = iter_processed_batches(gpkg_path, fid_ranges[start:], data_dir, workers, country_cells)
+    for batch_index, rows in enumerate(batches, start):
+        with conn:
+            append_hex_rows(conn, table, rows, integer_h3=integer_h3)
+            _set_stage(conn, stage, checksum, [table], last_batch=batch_index)
+        written += len(rows)
+
+    index_hex_table(conn, table)
+    update_country_stats(conn, table)
+    with conn:
+        _set_stage(conn, stage, checksum, [table], last_batch=len(fid_ranges) - 1, completed=True)
+    conn.close()
+    print(f"Wrote {written:,} r{resolution} cells to '{table}'")
+    return written
 
-    pop_gdf = gpd.GeoDataFrame(
-        pop_gdf,
-        geometry=[Point(xy) for xy in zip(pop_gdf["lng"], pop_gdf["lat"])],
-        crs=world_gdf.crs
-    )
-    pop_with_country = gpd.sjoin(
-        pop_gdf,
-        world_gdf[["geometry", "iso3"]],
-        how="left",
-        predicate="within"
-    ).rename(columns={"iso3": "country"}).drop(columns=["index_right"])
+def insert_global_data_r6(data_dir=None, integer_h3=True, workers=1):
+    """Insert global r6 population data with country codes. See ingest()."""
+    return ingest(6, data_dir=data_dir, integer_h3=integer_h3, workers=workers)
 
-    conn = sqlite3.connect(db_path)
-    pop_with_country.drop(columns=["geometry"], inplace=True)
-    pop_with_country.to_sql(
-        "hex_pops_r8", conn,
-        if_exists="replace",
-        index=False,
-        chunksize=5000,
-        method="multi"
-    )
+def insert_global_data_r4(data_dir=None, integer_h3=True, workers=1):
+    """Insert global r4 population data with country codes. See ingest()."""
+    return ingest(4, data_dir=data_dir, integer_h3=integer_h3, workers=workers)
 
-    conn.commit()
-    conn.close()
+def insert_global_data_r8(data_dir=None, integer_h3=True, workers=1):
+    """Insert global r8 population data with country codes. See ingest()."""
+    return ingest(8, data_dir=data_dir, integer_h3=integer_h3, workers=workers)
 
 def insert_by_country_data_r8(data_dir=None):
     """
@@ -181,87 +533,463 @@ def insert_by_country_data_r8(data_dir=None):
     conn.commit()
     conn.close()
 
-def aggregate_r8_to_r5_with_country_latlng(
-    data_dir=None,
-    db_rel="populations/kontur_population_20231101_COMBINED.db",
-    table_in="hex_pops_r8",
-    table_out="hex_pops_r5",
-    world_shp_rel="world-administrative-boundaries/world-administrative-boundaries.shp",
-    chunksize=1_000_000
-):
+def _reduce_partials(partials):
+    merged = pd.concat(partials, ignore_index=True)
+    return merged.groupby(["h3", "country"], sort=False, as_index=False)["population"].sum()
+
+def _dominant_country(partials):
+    """
+    Collapse (h3, country, population) sums into one row per cell: total population
+    and the country holding the most of it. Unassigned population ("") only wins
+    when no country has any.
+    """
+    sums = _reduce_partials(partials)
+    totals = sums.groupby("h3", sort=True)["population"].sum()
+    sums["assigned"] = sums["country"] != ""
+    dominant = (
+        sums.sort_values(["h3", "assigned", "population"], ascending=[True, False, False], kind="stable")
+        .drop_duplicates("h3")
+        .set_index("h3")["country"]
+    )
+    return pd.DataFrame({
+        "h3": totals.index.to_numpy(dtype=np.uint64),
+        "population": totals.to_numpy(),
+        "country": dominant.reindex(totals.index).replace("", None).to_numpy(dtype=object),
+    })
+
+def index_hex_table(conn, table):
     """
-    Aggregate res-8 populations to res-5 by summing children -> parents,
-    attach centroid lat/lng , assign country via spatial join.
+    Add the secondary index used by query_sqlite: (country, population DESC, h3) covers
+    its per-country, population-ordered reads without touching the table rows.
+    """
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_country_population ON {table}(country, population DESC, h3)"
+    )
+    conn.commit()
 
-    Input  (SQLite): table_in(h3 TEXT, population REAL, country TEXT, lat REAL, lng REAL)
-    Output (SQLite): table_out(h3 TEXT, population REAL, country TEXT, lat REAL, lng REAL)
+def _country_summary(country, population):
     """
+    Summary row for one country from its cell populations sorted in descending order.
+    """
+    count = len(population)
+    cumulative = np.cumsum(population)
+    total = float(cumulative[-1])
+    quantiles = np.quantile(population, STATS_QUANTILES)
+    top_counts = np.maximum(np.ceil(np.asarray(STATS_TOP_FRACTIONS) * count).astype(np.int64), 1)
+    top_shares = cumulative[top_counts - 1] / total if total else np.zeros(len(top_counts))
+    return (
+        country,
+        total,
+        count,
+        float(population[0]),
+        json.dumps(dict(zip(map(str, STATS_QUANTILES), quantiles.tolist()))),
+        json.dumps(dict(zip(map(str, STATS_TOP_FRACTIONS), top_shares.tolist()))),
+    )
 
-    data_dir = Path(__file__).parent / "data" if data_dir is None else Path(data_dir)
-    db_path = data_dir / db_rel
-    world_shp_path = data_dir / world_shp_rel
+def update_country_stats(conn, table, chunksize=1_000_000):
+    """
+    Recompute the per-country summary of a hex table into the country_stats table.
 
-    def get_lat_lng(h3_cell):
-        return h3raster.h3list_to_centroids([h3_cell])[0]
+    One row per (table, country) holds the total population, the cell count, the
+    most populous cell, quantiles of cell population (STATS_QUANTILES) and the
+    share of the country's population living in its top STATS_TOP_FRACTIONS of
+    cells. Allocation in queries.py reads these rows instead of aggregating the
+    cell-level table. Rows are read in index order (country, population DESC), so
+    only one country's populations are held in memory at a time.
 
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+    Parameters:
+    - conn: Open SQLite connection.
+    - table: Hex table to summarise, e.g. 'hex_pops_r8'.
+    - chunksize: Rows read per chunk.
+
+    Returns:
+    - Number of countries summarised.
+    """
+    first = conn.execute(f"SELECT h3 FROM {table} LIMIT 1").fetchone()
+    resolution = int(h3raster.cells_resolution([first[0]])[0]) if first is not None else None
+
+    rows = []
+    current, parts = None, []
+    query = f"SELECT country, population FROM {table} WHERE country IS NOT NULL ORDER BY country, population DESC"
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+        countries = chunk["country"].to_numpy(dtype=object)
+        population = chunk["population"].to_numpy(dtype=np.float64)
+        bounds = np.r_[np.flatnonzero(np.r_[True, countries[1:] != countries[:-1]]), len(countries)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if countries[start] != current:
+                if current is not None:
+                    rows.append(_country_summary(current, np.concatenate(parts)))
+                current, parts = countries[start], []
+            parts.append(population[start:end])
+    if current is not None:
+        rows.append(_country_summary(current, np.concatenate(parts)))
+
+    with conn:
+        conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {COUNTRY_STATS_TABLE} (
+                hex_table TEXT NOT NULL,
+                resolution INTEGER,
+                country TEXT NOT NULL,
+                total_population REAL,
+                cell_count INTEGER,
+                max_population REAL,
+                quantiles TEXT,
+                top_shares TEXT,
+                PRIMARY KEY (hex_table, country)
+            ) WITHOUT ROWID"""
+        )
+        conn.execute(f"DELETE FROM {COUNTRY_STATS_TABLE} WHERE hex_table = ?", (table,))
+        conn.executemany(
+            f"INSERT INTO {COUNTRY_STATS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(table, resolution) + row for row in rows],
+        )
+        bump_table_version(conn, table)
+    return len(rows)
+
+def build_pyramid(
+    data_dir=None,
+    db_rel=DB_REL,
+    table_in="hex_pops_r8",
+    resolutions=None,
+    table_out="hex_pops_r{resolution}",
+    chunksize=1_000_000,
+    integer_h3=True,
+    force=False
+):
+    """
+    Aggregate the finest population table into every coarser resolution in one streaming pass.
+
+    Each chunk of table_in is mapped to its parents at every target resolution with
+    integer bit operations and reduced with a pandas group-sum per (parent, country);
+    the partial sums are collected per resolution and group-summed again only
+    when they pass PYRAMID_REDUCE_ROWS rows and twice the size of the last
+    reduction, so the cost stays linear in the number of chunks. table_in is
+    read once and never held in memory. A coarse cell's country is the one holding
+    most of its children's population, so no spatial join is needed. Timezones are
+    looked up for each coarse cell's own centroid.
+
+    Parameters:
+    - data_dir: Optional base directory for the data.
+    - db_rel: Database path relative to data_dir.
+    - table_in: Finest table, e.g. 'hex_pops_r8'.
+    - resolutions: Target resolutions, default every resolution coarser than table_in
+                   except those whose table a completed ingest stage loaded.
+    - table_out: Output table name, formatted with the resolution.
+    - chunksize: Rows of table_in read per chunk.
+    - integer_h3: Store h3 as INTEGER keys (see create_hex_table).
+    - force: Rebuild even if the manifest says the outputs match the current table_in,
+             and overwrite output tables that other stages (e.g. an ingest) built.
+
+    Returns:
+    - Dict {resolution: number of cells written}, empty if the stage was skipped.
+    """
+    conn = sqlite3.connect(_data_dir(data_dir) / db_rel)
 
-    cur.execute(f"PRAGMA table_info('{table_in}')")
-    cols = {r[1] for r in cur.fetchall()}
-    required = {"h3", "population"}
-    missing = required - cols
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info('{table_in}')")}
+    missing = {"h3", "population", "country"} - cols
     if missing:
         conn.close()
         raise ValueError(f"{table_in} missing columns: {missing}")
 
-    # aggregation
-    parent_sums = {}
-    for chunk in pd.read_sql_query(
-        f"SELECT h3, population FROM {table_in}",
-        conn,
-        chunksize=chunksize
-    ):
-        # map each r8 cell to its r5 parent
-        chunk["h3_r5"] = chunk["h3"].map(lambda h: h3.cell_to_parent(h, 5))
-        summed = chunk.groupby("h3_r5", as_index=True)["population"].sum()
-        for parent, s in summed.items():
-            parent_sums[parent] = parent_sums.get(parent, 0.0) + float(s)
-
-    # build r5 df
-    parents = pd.DataFrame(
-        {"h3": list(parent_sums.keys()), "population": list(parent_sums.values())}
-    )
+    first = conn.execute(f"SELECT h3 FROM {table_in} LIMIT 1").fetchone()
+    if first is None:
+        conn.close()
+        raise ValueError(f"{table_in} is empty")
+    finest = int(h3raster.cells_resolution([first[0]])[0])
+    if resolutions is None:
+        # Tables loaded by a finished ingest stage are kept, not rebuilt from table_in.
+        resolutions = []
+        for r in range(finest - 1, -1, -1):
+            ingested = get_stage(conn, f"ingest:{table_out.format(resolution=r)}")
+            if ingested is not None and ingested["completed"]:
+                print(f"Keeping ingested '{table_out.format(resolution=r)}'")
+            else:
+                resolutions.append(r)
+    resolutions = sorted(set(resolutions), reverse=True)
+    if any(r >= finest or r < 0 for r in resolutions):
+        conn.close()
+        raise ValueError(f"Target resolutions must be between 0 and {finest - 1}")
 
-    # centroid lat/lng
-    parents["lat"], parents["lng"] = zip(*parents["h3"].map(get_lat_lng))
+    source = get_stage(conn, f"ingest:{table_in}")
+    if source is not None and source["completed"]:
+        source_version = source["checksum"]
+    else:
+        source_version = conn.execute(f"SELECT COUNT(*), TOTAL(population) FROM {table_in}").fetchone()
+    stage = f"aggregate:{table_in}"
+    checksum = _stage_checksum(
+        schema=SCHEMA_VERSION, source=source_version, resolutions=resolutions, table_out=table_out, integer_h3=integer_h3
+    )
+    state = get_stage(conn, stage)
+    outputs = [table_out.format(resolution=r) for r in resolutions]
+    outputs_exist = all(_table_exists(conn, table) for table in outputs)
+    if not force and state is not None and state["completed"] and state["checksum"] == checksum and outputs_exist:
+        conn.close()
+        print(f"Pyramid from '{table_in}' is up to date, skipping")
+        return {}
+    try:
+        with conn:
+            _set_stage(conn, stage, checksum, outputs, force=force)
+    except ValueError:
+        conn.close()
+        raise
+
+    accumulators = {r: [] for r in resolutions}
+    pending_rows = dict.fromkeys(resolutions, 0)
+    reduced_rows = dict.fromkeys(resolutions, 0)
+    for chunk in pd.read_sql_query(f"SELECT h3, population, country FROM {table_in}", conn, chunksize=chunksize):
+        cells = h3raster.cells_to_int(chunk["h3"].to_numpy())
+        population = chunk["population"].to_numpy(dtype=np.float64)
+        country = chunk["country"].fillna("").to_numpy(dtype=object)
+        for resolution in resolutions:
+            partial = pd.DataFrame({
+                "h3": h3raster.cells_to_parents(cells, resolution),
+                "country": country,
+                "population": population,
+            })
+            accumulators[resolution].append(partial)
+            pending_rows[resolution] += len(partial)
+            if pending_rows[resolution] > max(PYRAMID_REDUCE_ROWS, 2 * reduced_rows[resolution]):
+                accumulators[resolution] = [_reduce_partials(accumulators[resolution])]
+                pending_rows[resolution] = reduced_rows[resolution] = len(accumulators[resolution][0])
+
+    written = {}
+    for resolution in resolutions:
+        parents = _dominant_country(accumulators.pop(resolution))
+        parents["lat"], parents["lng"] = h3raster.cells_to_latlngs(parents["h3"].to_numpy())
+
+        table = table_out.format(resolution=resolution)
+        write_hex_table(conn, table, parents, integer_h3=integer_h3)
+        index_hex_table(conn, table)
+        update_country_stats(conn, table)
+        written[resolution] = len(parents)
+        print(f"Wrote {len(parents):,} r{resolution} cells to '{table}'")
+
+    with conn:
+        _set_stage(conn, stage, checksum, outputs, completed=True)
+    conn.close()
+    return written
 
-    # assign country via spatial join
-    world_gdf = gpd.read_file(world_shp_path)
-    parents_gdf = gpd.GeoDataFrame(
-        parents,
-        geometry=[Point(xy) for xy in zip(parents["lng"], parents["lat"])],
-        crs=world_gdf.crs
+def aggregate_r8_to_r5_with_country_latlng(
+    data_dir=None,
+    db_rel=DB_REL,
+    table_in="hex_pops_r8",
+    table_out="hex_pops_r5",
+    chunksize=1_000_000,
+    integer_h3=True
+):
+    """
+    Aggregate res-8 populations to res-5. Kept for existing callers; see build_pyramid().
+    """
+    written = build_pyramid(
+        data_dir=data_dir,
+        db_rel=db_rel,
+        table_in=table_in,
+        resolutions=[5],
+        table_out=table_out,
+        chunksize=chunksize,
+        integer_h3=integer_h3,
     )
-    joined = gpd.sjoin(
-        parents_gdf,
-        world_gdf[["geometry", "iso3"]],
-        how="left",
-        predicate="within"
-    ).rename(columns={"iso3": "country"}).drop(columns=["index_right"])
-
-    # write to sqlite
-    cur.execute(f"DROP TABLE IF EXISTS {table_out}")
+    return written.get(5, 0)
+
+def index_all(data_dir=None, db_rel=DB_REL):
+    """
+    Create the query index and country_stats rows for every hex table and refresh
+    the planner statistics.
+    """
+    conn = sqlite3.connect(_data_dir(data_dir) / db_rel)
+    for table in hex_tables(conn):
+        index_hex_table(conn, table)
+        update_country_stats(conn, table)
+    conn.execute("ANALYZE")
     conn.commit()
+    conn.close()
 
-    joined[["h3", "population", "country", "lat", "lng"]].to_sql(
-        table_out, conn, if_exists="replace", index=False
-    )
-    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_out}_h3 ON {table_out}(h3)")
-    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_out}_country ON {table_out}(country)")
+def _table_version(conn, table):
+    """
+    Identify the current contents of a hex table: the checksum of the completed
+    build stage that wrote it, or its row count and total population otherwise.
+    """
+    _ensure_manifest(conn)
+    for checksum, outputs in conn.execute(f"SELECT checksum, outputs FROM {MANIFEST_TABLE} WHERE completed"):
+        if table in json.loads(outputs):
+            return checksum
+    count, total = conn.execute(f"SELECT COUNT(*), TOTAL(population) FROM {table}").fetchone()
+    return f"{count}:{total!r}"
+
+def snapshot_dir(resolution, data_dir=None, snapshot_rel=SNAPSHOT_REL):
+    """Directory of the columnar snapshot of one resolution."""
+    return _data_dir(data_dir) / snapshot_rel / f"r{resolution}"
+
+def export_snapshot(resolutions=None, data_dir=None, db_rel=DB_REL, snapshot_rel=SNAPSHOT_REL, force=False):
+    """
+    Export hex tables as memory-mappable columnar snapshots.
+
+    Each resolution is written to <snapshot_rel>/r<N>/ as one .npy file per column
+    (h3, population, country_codes, lat, lng, utc_offset) sorted by country and
+    population descending, plus a manifest.json with the country list, each
+    country's row offsets and population totals (see columnstore.ColumnStore).
+    The manifest records which version of the table it was exported from, so
+    snapshots of unchanged tables are skipped.
+
+    Parameters:
+    - resolutions: Resolutions to export, default every hex table in the database.
+    - data_dir: Optional base directory for the data.
+    - db_rel: Database path relative to data_dir.
+    - snapshot_rel: Snapshot root relative to data_dir.
+    - force: Export even if the snapshot is up to date.
+
+    Returns:
+    - Dict {resolution: number of cells written}.
+    """
+    db_path = _data_dir(data_dir) / db_rel
+    conn = sqlite3.connect(db_path)
+    tables = {int(t.rsplit("_r", 1)[1]): t for t in hex_tables(conn)}
+    if resolutions is None:
+        resolutions = sorted(tables, reverse=True)
+    missing = [r for r in resolutions if r not in tables]
+    if missing:
+        conn.close()
+        raise ValueError(f"No hex table for resolutions {missing}")
+    versions = {r: _table_version(conn, tables[r]) for r in resolutions}
     conn.commit()
     conn.close()
 
-    print(f"Wrote {len(joined):,} r5 cells with population, country, lat, lng to '{table_out}'")
+    written = {}
+    for resolution in resolutions:
+        directory = snapshot_dir(resolution, data_dir, snapshot_rel)
+        manifest = read_snapshot_manifest(directory)
+        if not force and manifest is not None and manifest.get("source") == versions[resolution]:
+            print(f"Snapshot of '{tables[resolution]}' is up to date, skipping")
+            continue
+        store = ColumnStore.from_sqlite(db_path, resolution)
+        store.save(
+            directory,
+            table=tables[resolution],
+            source=versions[resolution],
+            exported_at=datetime.now(timezone.utc).isoformat(),
+        )
+        written[resolution] = len(store)
+        print(f"Wrote {len(store):,} r{resolution} cells to {directory}")
+    return written
+
+def verify(data_dir=None, db_rel=DB_REL, tolerance=1e-6):
+    """
+    Check the database and print a per-table summary.
 
-aggregate_r8_to_r5_with_country_latlng()
\ No newline at end of file
+    Flags failed SQLite integrity checks, build stages left unfinished, tables
+    missing their query index, country_stats rows that disagree with their table,
+    snapshots exported from an older version of their table, and pyramid levels
+    whose total population differs from the table they were aggregated from.
+
+    Returns:
+    - List of problem descriptions; empty when everything checks out.
+    """
+    conn = sqlite3.connect(_data_dir(data_dir) / db_rel)
+    problems = []
+
+    result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    if result != "ok":
+        problems.append(f"quick_check: {result}")
+
+    _ensure_manifest(conn)
+    for stage, completed in conn.execute(f"SELECT stage, completed FROM {MANIFEST_TABLE}"):
+        if not completed:
+            problems.append(f"stage '{stage}' did not finish")
+
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    totals = {}
+    for table in hex_tables(conn):
+        count, total, unassigned = conn.execute(
+            f"SELECT COUNT(*), TOTAL(population), SUM(country IS NULL) FROM {table}"
+        ).fetchone()
+        totals[table] = total
+        print(f"{table}: {count:,} cells, population {total:,.0f}, {unassigned or 0:,} without country")
+        if f"idx_{table}_country_population" not in indexes:
+            problems.append(f"{table} has no country/population index")
+
+        summarised = None
+        if _table_exists(conn, COUNTRY_STATS_TABLE):
+            summarised = conn.execute(
+                f"SELECT SUM(cell_count) FROM {COUNTRY_STATS_TABLE} WHERE hex_table = ?", (table,)
+            ).fetchone()[0]
+        assigned = count - (unassigned or 0)
+        if assigned and summarised is None:
+            problems.append(f"{table} has no country_stats rows")
+        elif assigned and summarised != assigned:
+            problems.append(f"{table} country_stats cover {summarised:,} cells, table has {assigned:,}")
+
+        manifest = read_snapshot_manifest(snapshot_dir(int(table.rsplit("_r", 1)[1]), data_dir))
+        if manifest is not None and manifest.get("source") != _table_version(conn, table):
+            problems.append(f"snapshot of {table} is stale")
+
+    aggregates = conn.execute(f"SELECT stage, outputs FROM {MANIFEST_TABLE} WHERE stage GLOB 'aggregate:*'").fetchall()
+    for stage, outputs in aggregates:
+        table_in = stage.split(":", 1)[1]
+        if table_in not in totals:
+            continue
+        for table in json.loads(outputs):
+            total = totals.get(table)
+            if total is not None and abs(total - totals[table_in]) > tolerance * max(abs(totals[table_in]), 1.0):
+                problems.append(f"{table} population {total:,.0f} != {table_in} population {totals[table_in]:,.0f}")
+
+    conn.close()
+    for problem in problems:
+        print(f"PROBLEM: {problem}")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and maintain the H3 population database.")
+    parser.add_argument("--data-dir", default=None, help="Base data directory (default: ./data).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Load Kontur GeoPackages into hex_pops_r<N> tables.")
+    ingest_parser.add_argument("resolutions", type=int, nargs="+", help="Resolutions to ingest, e.g. 8 6 4.")
+    ingest_parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1).")
+    ingest_parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Rows per batch.")
+    ingest_parser.add_argument("--text-h3", action="store_true", help="Store h3 as TEXT instead of INTEGER.")
+    ingest_parser.add_argument("--no-country-cells", action="store_true",
+                               help="Assign countries by point-in-polygon for every cell.")
+    ingest_parser.add_argument("--no-resume", action="store_true", help="Restart interrupted runs from scratch.")
+    ingest_parser.add_argument("--force", action="store_true",
+                               help="Rebuild even if inputs are unchanged, replacing tables built by aggregate.")
+
+    aggregate_parser = commands.add_parser("aggregate", help="Build coarser resolutions from the finest table.")
+    aggregate_parser.add_argument("--table-in", default="hex_pops_r8", help="Finest table (default: hex_pops_r8).")
+    aggregate_parser.add_argument("--resolutions", type=int, nargs="+", default=None,
+                                  help="Target resolutions (default: all coarser ones not loaded by ingest).")
+    aggregate_parser.add_argument("--force", action="store_true",
+                                  help="Rebuild even if inputs are unchanged, replacing tables built by ingest.")
+
+    commands.add_parser("index", help="Create query indexes, country_stats and planner statistics.")
+    snapshot_parser = commands.add_parser("snapshot", help="Export hex tables as memory-mapped column snapshots.")
+    snapshot_parser.add_argument("resolutions", type=int, nargs="*", help="Resolutions to export (default: all).")
+    snapshot_parser.add_argument("--force", action="store_true", help="Export even if snapshots are up to date.")
+
+    commands.add_parser("verify", help="Check integrity, build stages and pyramid totals.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        for resolution in args.resolutions:
+            ingest(
+                resolution,
+                data_dir=args.data_dir,
+                batch_size=args.batch_size,
+                integer_h3=not args.text_h3,
+                workers=args.workers,
+                country_cells=not args.no_country_cells,
+                resume=not args.no_resume,
+                force=args.force,
+            )
+    elif args.command == "aggregate":
+        build_pyramid(data_dir=args.data_dir, table_in=args.table_in, resolutions=args.resolutions, force=args.force)
+    elif args.command == "index":
+        index_all(data_dir=args.data_dir)
+    elif args.command == "snapshot":
+        export_snapshot(args.resolutions or None, data_dir=args.data_dir, force=args.force)
+    elif args.command == "verify":
+        if verify(data_dir=args.data_dir):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,305 @@
 # TODO: error handling, function documentation
 
+import json
 import sqlite3
 import pandas as pd
 import h3raster
 import math
 import numpy as np
 import os
-from datetime import datetime
-import pycountry
-import pytz
-from timezonefinder import TimezoneFinder
+from allocation import allocate
+from columnstore import ColumnStore, read_snapshot_manifest
+from selection import descending_order, select_rows
 
 
-def query_sqlite(resolution):
+COUNTRY_STATS_TABLE = "country_stats"
+
+TABLE_VERSIONS_TABLE = "table_versions"
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "data", "populations", "kontur_population_20231101_COMBINED.db")
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "data", "populations", "snapshot")
+
+BACKENDS = ("sqlite", "snapshot")
+
+SELECTION_COLUMNS = ['country', 'h3', 'lat', 'lng', 'population', 'utc_offset']
+
+_snapshots = {}
+
+COUNTRIES = ('GBR', 'ITA', 'DEU', 'ESP', 'USA', 'DNK', 'FRA', 'PRT',
+             'AUS', 'AUT', 'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'EST', 'FIN',
+             'GRC', 'HUN', 'IRL', 'LVA', 'LTU', 'LUX', 'MLT', 'NLD', 'POL',
+             'ROU', 'SVK', 'SVN', 'SWE')
+
+def _hex_table(conn, resolution):
+    table = f"hex_pops_r{int(resolution)}"
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if not exists:
+        raise ValueError(f"Unsupported resolution {resolution}: table '{table}' does not exist.")
+    return table
+
+def _country_limits(countries, limits):
+    """
+    Normalise `limits` to a list of (country, limit) pairs, with None meaning unlimited.
+    """
+    if limits is None or isinstance(limits, (int, np.integer)):
+        return [(c, None if limits is None else int(limits)) for c in countries]
+    pairs = []
+    for c in countries:
+        n = limits.get(c)
+        pairs.append((c, None if n is None else int(n)))
+    return pairs
+
+def query_sqlite(resolution, countries=COUNTRIES, limits=None):
     """
     Query the SQLite database for population data at the specified H3 resolution.
+
+    Filtering, ordering and per-country top-N all run inside SQLite: a
+    ROW_NUMBER() window partitioned by country is computed over the covering
+    (country, population DESC, h3) index, and only rows within each country's
+    limit are joined back to the table and returned.
+
     Parameters:
-    - resolution: The H3 resolution (4, 5, 6, or 8).
+    - resolution: The H3 resolution. Any resolution with a hex_pops_r<resolution>
+                  table is supported (populate_db.build_pyramid writes 0-7 from r8).
+    - countries: iso3 codes to read (default: COUNTRIES).
+    - limits: Maximum rows per country, either one int for every country or a
+              dict {country: limit}. None (the default, or as a dict value, or
+              for countries missing from the dict) returns all rows.
     Returns:
-    - DataFrame containing country, population, and h3 columns.
+    - DataFrame containing country, population, and h3 columns, plus the
+      precomputed utc_offset column when the table has one, ordered by
+      population descending (ties by h3). Tables written with integer keys
+      come back with h3 as a uint64 column (no copy); TEXT tables keep hex strings.
     """
+    countries = list(countries)
+    pairs = [(c, n) for c, n in _country_limits(countries, limits) if n is None or n > 0]
+    if not pairs:
+        pairs = [(None, 0)]
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        table = _hex_table(conn, resolution)
+        has_offset = any(r[1] == "utc_offset" for r in conn.execute(f"PRAGMA table_info('{table}')"))
+
+        query = f"""
+        WITH limits(country, n) AS (VALUES {', '.join(['(?, ?)'] * len(pairs))}),
+        ranked AS (
+            SELECT country, population, h3,
+                   ROW_NUMBER() OVER (PARTITION BY country ORDER BY population DESC, h3) AS rn
+            FROM {table}
+            WHERE country IN (SELECT country FROM limits)
+        )
+        SELECT r.country, r.population, r.h3{', t.utc_offset' if has_offset else ''}
+        FROM ranked r
+        JOIN limits l ON l.country = r.country
+        {f'JOIN {table} t ON t.h3 = r.h3' if has_offset else ''}
+        WHERE l.n IS NULL OR r.rn <= l.n
+        ORDER BY r.population DESC, r.h3
+        """
+        params = [v for pair in pairs for v in pair]
+        df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+    if df["h3"].dtype == np.int64:
+        df["h3"] = df["h3"].to_numpy().view(np.uint64)
 
-    base_dir = os.path.dirname(__file__)
-    db_path = os.path.join(base_dir, "data", "populations", "kontur_population_20231101_COMBINED.db")
+    return df
+
+def query_cells_sqlite(resolution, cells, limit=None):
+    """
+    Read the rows of a set of cells from the SQLite database.
 
-    conn = sqlite3.connect(db_path)
+    The cells are loaded into a temporary WITHOUT ROWID table keyed like the hex
+    table and joined to it on its h3 primary key, with the cell set as the outer
+    loop, so the cost is one index lookup per region cell however large the
+    table is. Totals are aggregated inside SQLite, so with a limit only the top
+    rows are returned to Python.
 
-    query_r4 = """
-    SELECT country, population, h3 FROM hex_pops_r4
-    WHERE country IN ('GBR', 'ITA', 'DEU', 'ESP', 'USA', 'DNK', 'FRA', 'PRT',
-                    'AUS', 'AUT', 'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'EST', 'FIN',
-                    'GRC', 'HUN', 'IRL', 'LVA', 'LTU', 'LUX', 'MLT', 'NLD', 'POL',
-                    'ROU', 'SVK', 'SVN', 'SWE')
-    ORDER BY population DESC
+    Parameters:
+    - resolution: The H3 resolution.
+    - cells: H3 cells (uint64 or hex strings) at that resolution.
+    - limit: Most rows to return (default: all).
+    Returns:
+    - Tuple (count, population, df): the number of cells found with a country,
+      their total population, and a DataFrame in the layout of query_sqlite()
+      with the top `limit` of them by population descending (ties by h3).
     """
+    cells = h3raster.cells_to_int(cells)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        table = _hex_table(conn, resolution)
+        columns = {r[1]: r[2].upper() for r in conn.execute(f"PRAGMA table_info('{table}')")}
+        integer = columns.get("h3") == "INTEGER"
+        conn.execute(f"CREATE TEMP TABLE region (h3 {'INTEGER' if integer else 'TEXT'} PRIMARY KEY) WITHOUT ROWID")
+        keys = cells.view(np.int64).tolist() if integer else h3raster.cells_to_str(cells)
+        try:
+            # One statement parsing a JSON array is several times faster than executemany.
+            conn.execute("INSERT OR IGNORE INTO temp.region SELECT value FROM json_each(?)", (json.dumps(keys),))
+        except sqlite3.OperationalError:
+            conn.executemany("INSERT OR IGNORE INTO temp.region VALUES (?)", ((key,) for key in keys))
+
+        joined = f"""
+        FROM temp.region r
+        CROSS JOIN {table} t ON t.h3 = r.h3
+        WHERE t.country IS NOT NULL
+        """
+        count, population = conn.execute(f"SELECT COUNT(*), TOTAL(t.population) {joined}").fetchone()
+        query = f"""
+        SELECT t.country, t.population, t.h3{', t.utc_offset' if 'utc_offset' in columns else ''}
+        {joined}
+        ORDER BY t.population DESC, t.h3
+        {'' if limit is None else 'LIMIT ?'}
+        """
+        df = pd.read_sql_query(query, conn, params=None if limit is None else [int(limit)])
+    finally:
+        conn.close()
+
+    if df["h3"].dtype == np.int64:
+        df["h3"] = df["h3"].to_numpy().view(np.uint64)
+
+    return count, population, df
+
+def _has_country_stats(conn, table):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (COUNTRY_STATS_TABLE,)).fetchone()
+    if not exists:
+        return False
+    return conn.execute(f"SELECT 1 FROM {COUNTRY_STATS_TABLE} WHERE hex_table = ? LIMIT 1", (table,)).fetchone() is not None
+
+def country_totals(resolution, countries=COUNTRIES):
+    """
+    Total population and cell count per country.
+
+    Read from the country_stats rows that populate_db maintains for every hex
+    table, so no cell-level data is touched; databases built without them fall
+    back to a GROUP BY over the table.
 
-    query_r5 = """
-    SELECT country, population, h3 FROM hex_pops_r5
-    WHERE country IN ('GBR', 'ITA', 'DEU', 'ESP', 'USA', 'DNK', 'FRA', 'PRT',
-                    'AUS', 'AUT', 'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'EST', 'FIN',
-                    'GRC', 'HUN', 'IRL', 'LVA', 'LTU', 'LUX', 'MLT', 'NLD', 'POL',
-                    'ROU', 'SVK', 'SVN', 'SWE')
-    ORDER BY population DESC
+    Parameters:
+    - resolution: The H3 resolution.
+    - countries: iso3 codes to include (default: COUNTRIES).
+    Returns:
+    - DataFrame indexed by country with 'population' and 'cells' columns, for
+      countries that have at least one cell.
     """
-    
-    query_r6 = """
-    SELECT country, population, h3 FROM hex_pops_r6
-    WHERE country IN ('GBR', 'ITA', 'DEU', 'ESP', 'USA', 'DNK', 'FRA', 'PRT',
-                    'AUS', 'AUT', 'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'EST', 'FIN',
-                    'GRC', 'HUN', 'IRL', 'LVA', 'LTU', 'LUX', 'MLT', 'NLD', 'POL',
-                    'ROU', 'SVK', 'SVN', 'SWE')
-    ORDER BY population DESC
-    """
-    query_r8 = """
-    SELECT country, population, h3 FROM hex_pops_r8
-    WHERE country IN ('GBR', 'ITA', 'DEU', 'ESP', 'USA', 'DNK', 'FRA', 'PRT',
-                    'AUS', 'AUT', 'BEL', 'BGR', 'HRV', 'CYP', 'CZE', 'EST', 'FIN',
-                    'GRC', 'HUN', 'IRL', 'LVA', 'LTU', 'LUX', 'MLT', 'NLD', 'POL',
-                    'ROU', 'SVK', 'SVN', 'SWE')
-    ORDER BY population DESC
-    """
-    if resolution == 4:
-        df =  pd.read_sql_query(query_r4, conn)
-    elif resolution == 5:
-        df =  pd.read_sql_query(query_r5, conn)
-    elif resolution == 6:
-        df =  pd.read_sql_query(query_r6, conn)
-    elif resolution == 8:
-        df =  pd.read_sql_query(query_r8, conn)
-    else:
-        raise ValueError("Unsupported resolution. Only 4, 5, 6, and 8 are currently supported.")
-    conn.close()
+    countries = list(countries)
+    placeholders = ', '.join('?' * len(countries))
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        table = _hex_table(conn, resolution)
+        if _has_country_stats(conn, table):
+            query = f"""
+            SELECT country, total_population AS population, cell_count AS cells FROM {COUNTRY_STATS_TABLE}
+            WHERE hex_table = ? AND country IN ({placeholders})
+            ORDER BY country
+            """
+            params = [table] + countries
+        else:
+            query = f"""
+            SELECT country, SUM(population) AS population, COUNT(*) AS cells FROM {table}
+            WHERE country IN ({placeholders})
+            GROUP BY country
+            ORDER BY country
+            """
+            params = countries
+        df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    return df.set_index("country")
+
+def load_snapshot(resolution):
+    """
+    Open the columnar snapshot of a resolution (written by `populate_db.py snapshot`).
 
-    return df
+    Columns are memory-mapped, so opening is instant and only the pages a query
+    touches are read. The store is cached and reopened when the snapshot is re-exported.
+
+    Parameters:
+    - resolution: The H3 resolution.
+    Returns:
+    - columnstore.ColumnStore backed by the snapshot files.
+    """
+    directory = os.path.join(SNAPSHOT_DIR, f"r{int(resolution)}")
+    manifest = os.path.join(directory, "manifest.json")
+    stamp = os.stat(manifest).st_mtime_ns if os.path.exists(manifest) else None
+    cached = _snapshots.get(directory)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, ColumnStore.from_snapshot(directory))
+        _snapshots[directory] = cached
+    return cached[1]
+
+def data_version(resolution, backend='sqlite'):
+    """
+    Stamp identifying the data a selection at this resolution reads.
+
+    For SQLite it is the version populate_db gives a hex table whenever it writes
+    the table or its country_stats rows; databases without version stamps fall
+    back to the file's modification time and size. For snapshots it is the
+    source version and export time from the snapshot manifest.
+
+    Parameters:
+    - resolution: The H3 resolution.
+    - backend: 'sqlite' or 'snapshot'.
+    Returns:
+    - Version string; it changes whenever the data behind the selection does.
+    """
+    if backend == 'snapshot':
+        manifest = read_snapshot_manifest(os.path.join(SNAPSHOT_DIR, f"r{int(resolution)}"))
+        if manifest is None:
+            raise ValueError(f"No snapshot for resolution {resolution}; run 'python populate_db.py snapshot' first.")
+        return f"snapshot:{manifest.get('source')}:{manifest.get('exported_at')}"
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        table = _hex_table(conn, resolution)
+        row = None
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TABLE_VERSIONS_TABLE,)).fetchone()
+        if exists:
+            row = conn.execute(f"SELECT version FROM {TABLE_VERSIONS_TABLE} WHERE hex_table = ?", (table,)).fetchone()
+    finally:
+        conn.close()
+    if row is not None:
+        return f"{table}:{row[0]}"
+    stat = os.stat(DB_PATH)
+    return f"file:{stat.st_mtime_ns}:{stat.st_size}"
+
+def _store_for(resolution, backend, store=None):
+    if store is not None:
+        return store
+    if backend == 'sqlite':
+        return None
+    if backend == 'snapshot':
+        return load_snapshot(resolution)
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
 
 def append_timezone(df):
     """
     Appends a timezone column with a utc offset float to a pandas dataframe using a the lat, lng columns.
 
+    Points are resolved in bulk through timezones.latlngs_to_timezones, which
+    looks up each distinct coarse H3 cell once and caches it across calls.
+
     Parameters:
     - 'df': a pandas dataframe with 'lat' and 'lng' columns
 
     Returns:
     - the same pandas dataframe with a 'utc_offset' column containing the lat, lng pair's utc offset
     """
-    tf = TimezoneFinder()
-
-    WINTER_DATE = datetime(2024, 1, 1)
-
-    def get_standard_utc_offset(lat, lng):
-        tz_name = tf.timezone_at(lat=lat, lng=lng)
-        if tz_name:
-            tz = pytz.timezone(tz_name)
-            offset_seconds = tz.utcoffset(WINTER_DATE).total_seconds()
-            return offset_seconds / 3600
-        return None
+    # timezonefinder is only loaded for tables built without a utc_offset column.
+    from timezones import latlngs_to_timezones
 
-    df["utc_offset"] = df.apply(lambda row: get_standard_utc_offset(row["lat"], row["lng"]), axis=1)
+    _, offsets = latlngs_to_timezones(df["lat"].to_numpy(), df["lng"].to_numpy())
+    df["utc_offset"] = offsets
 
     return df
 
+def _ensure_timezone(df):
+    if "utc_offset" in df:
+        return df
+    return append_timezone(df)
+
 def iso3_to_iso2(df):
     """
     Convert iso3 country codes to their corresponding iso2 formats in a pandas dataframe with a 'country' column.
@@ -110,6 +310,8 @@ def iso3_to_iso2(df):
     Returns:
     - a pandas dataframe
     """
+    import pycountry
+
     def iso3_to_iso2(iso3):
         try:
             return pycountry.countries.get(alpha_3=iso3).alpha_2
@@ -120,34 +322,42 @@ def iso3_to_iso2(df):
 
     return df
 
-def get_top_centroids(count, resolution, plot=False):
+def get_top_centroids(count, resolution, plot=False, backend='sqlite'):
     """
     Get the top populated hexes and their centroids.
     Parameters:
     - count: Number of top populated hexes to retrieve.
     - resolution: The H3 resolution (6 or 8).
     - plot: If True, plot the hexes on a Folium map (default is False).
+    - backend: 'sqlite' (default) or 'snapshot' to read the memory-mapped column snapshot.
     Returns:
     - List of tuples containing latitude and longitude of the top count populated hexes.
     - Dictionary with country counts.
     - DataFrame with columns ['country', 'h3', 'lat', 'lng', 'population', 'utc_offset'] of selected hexes.
     """
 
-    df = query_sqlite(resolution)
+    # The global top `count` is contained in every country's own top `count`.
+    store = _store_for(resolution, backend)
+    df = query_sqlite(resolution, limits=count) if store is None else store.query(COUNTRIES, limits=count)
 
-    top_count = df.sort_values(by='population', ascending=False).head(count)
+    top_count = df.head(count).copy()
     h3_list = top_count['h3'].tolist()
 
     country_counts_dict = top_count['country'].value_counts().to_dict()
 
-    top_count['lat'], top_count['lng'] = zip(*h3raster.h3list_to_centroids(h3_list))
+    if 'lat' in top_count:
+        lats, lngs = top_count['lat'].to_numpy(), top_count['lng'].to_numpy()
+    else:
+        lats, lngs = h3raster.cells_to_latlngs(h3_list)
+        top_count['lat'], top_count['lng'] = lats, lngs
 
-    top_count = iso3_to_iso2(append_timezone(top_count))
+    top_count = iso3_to_iso2(_ensure_timezone(top_count))
+    top_count['h3'] = h3_list = h3raster.cells_to_str(h3_list)
 
     if plot:
-        h3raster.folium_plot_cells(h3_list)
+        h3raster.folium_plot_cells(h3_list, top_count['population'].to_numpy())
 
-    return h3raster.h3list_to_centroids(h3_list), country_counts_dict, top_count[['country', 'h3', 'lat', 'lng', 'population']]
+    return list(zip(lats.tolist(), lngs.tolist())), country_counts_dict, top_count[['country', 'h3', 'lat', 'lng', 'population']]
 
 def get_top_centroids_US_EUR_choose_count(US_count, EUR_count, resolution, plot=False):
     """
@@ -163,7 +373,8 @@ def get_top_centroids_US_EUR_choose_count(US_count, EUR_count, resolution, plot=
     - DataFrame with columns ['country', 'h3', 'lat', 'lng', 'population', 'utc_offset'] of selected hexes.
     """
 
-    df = query_sqlite(resolution)
+    limits = {c: US_count if c == 'US' else EUR_count for c in COUNTRIES}
+    df = query_sqlite(resolution, limits=limits)
 
     us_df = df[df['country'] == 'US'].nlargest(US_count, 'population')
     eur_df = df[df['country'] != 'US'].nlargest(EUR_count, 'population')
@@ -174,22 +385,32 @@ def get_top_centroids_US_EUR_choose_count(US_count, EUR_count, resolution, plot=
 
     country_counts_dict = combined_df['country'].value_counts().to_dict()
 
-    combined_df['lat'], combined_df['lng'] = zip(*h3raster.h3list_to_centroids(combined_df['h3'].tolist()))
+    lats, lngs = h3raster.cells_to_latlngs(h3_list)
+    combined_df['lat'], combined_df['lng'] = lats, lngs
 
-    combined_df = iso3_to_iso2(append_timezone(combined_df))
+    combined_df = iso3_to_iso2(_ensure_timezone(combined_df))
+    combined_df['h3'] = h3_list = h3raster.cells_to_str(h3_list)
 
     if plot:
-        h3raster.folium_plot_cells(h3_list)
+        h3raster.folium_plot_cells(h3_list, combined_df['population'].to_numpy())
 
-    return h3raster.h3list_to_centroids(h3_list), country_counts_dict, combined_df[['country', 'h3', 'lat', 'lng', 'population', 'utc_offset']]
+    return list(zip(lats.tolist(), lngs.tolist())), country_counts_dict, combined_df[['country', 'h3', 'lat', 'lng', 'population', 'utc_offset']]
 
 def get_top_centroids_by_strategy(total_count, resolution, method='population', 
                                    min_per_country=0, threshold=None, 
                                    urban_fraction=1.0, plot=False,
-                                   fixed_country=None, fixed_count=None):
+                                   fixed_country=None, fixed_count=None,
+                                   countries=COUNTRIES, store=None, backend='sqlite',
+                                   max_per_country=None, seed=None, rural_mode='uniform', cache=None,
+                                   return_centroids=True):
     """
     Select top populated hexes from each country using different allocation strategies.
 
+    Counts per country come from allocation.allocate(): largest remainders of the
+    weights, with minimum, maximum and fixed counts held exactly and no country
+    given more hexes than it has cells; the excess goes to the other countries
+    by weight.
+
     Parameters:
     - total_count: Total number of hexes to select.
     - resolution: The H3 resolution (4, 5, 6, or 8).
@@ -199,25 +420,157 @@ def get_top_centroids_by_strategy(total_count, resolution, method='population',
         'sqrt'       - proportional to sqrt of country population
         'log'        - proportional to log of country population
         'threshold'  - only countries above given threshold in population are considered
-    - min_per_country: Minimum hexes per country (default=1).
+    - min_per_country: Minimum hexes per country (default=0).
+    - max_per_country: Optional maximum hexes per country.
     - threshold: Population threshold (used only if method='threshold').
     - urban_fraction: Fraction of selection per country from top-population hexes (0.0 to 1.0).
                       Remaining fraction is random within that country. (default=1.0)
+    - seed: Optional seed for the random part. The same seed gives the same hexes;
+            with rural_mode='uniform' they are the ones np.random.seed(seed) followed
+            by an unseeded call gives. Without a seed the global np.random state is used.
+    - rural_mode: How the random part is drawn (see selection.sample_rural):
+        'uniform'    - every remaining hex equally likely (default)
+        'weighted'   - proportional to hex population, without replacement
+        'stratified' - evenly across the population deciles of the remaining hexes
     - plot: If True, plot the hexes on a Folium map. (default = False)
     - fixed_country: If provided, this country will receive a fixed number of hexes.
     - fixed_count: Number of hexes to allocate to fixed_country. Must be provided if fixed_country is set.
+    - countries: iso3 codes to select from (default: COUNTRIES).
+    - store: Optional columnstore.ColumnStore for this resolution to read from
+             instead of SQLite (as the query service does).
+    - backend: 'sqlite' (default) or 'snapshot' to read the memory-mapped column
+               snapshot of this resolution. Ignored when store is given.
+    - cache: Optional cache.ResultCache. Deterministic selections (urban_fraction
+             of 1 or a seed given) are looked up there by their parameters and
+             data_version(), and stored after computing them. Not used with `store`.
+    - return_centroids: Build the list of (lat, lon) tuples; with False the first
+                        item of the result is None (the DataFrame has lat/lng too).
 
     Returns:
     - Tuple:
-        1. List of (lat, lon) tuples of selected hexes.
-        2. Dictionary {country: count_of_hexes}.
+        1. List of (lat, lon) tuples of selected hexes, or None.
+        2. Dictionary {country: count_of_hexes}, including countries outside the
+           allocation that backfilled a shortfall (see _backfill).
         3. DataFrame with columns ['country', 'h3', 'lat', 'lng', 'population', 'utc_offset] of selected hexes.
     """
 
 
-    df = query_sqlite(resolution)
+    key = None
+    if cache is not None and store is None:
+        key = strategy_cache_key(
+            cache, total_count, resolution, method, min_per_country, threshold, urban_fraction,
+            fixed_country=fixed_country, fixed_count=fixed_count, countries=countries, backend=backend,
+            max_per_country=max_per_country, seed=seed, rural_mode=rural_mode,
+        )
+    if key is not None:
+        result = cache.get(key)
+        if result is None:
+            result = get_top_centroids_by_strategy(
+                total_count, resolution, method, min_per_country, threshold, urban_fraction,
+                fixed_country=fixed_country, fixed_count=fixed_count, countries=countries, backend=backend,
+                max_per_country=max_per_country, seed=seed, rural_mode=rural_mode,
+            )
+            cache.put(key, result)
+        if plot:
+            h3raster.folium_plot_cells(result[2]['h3'].tolist(), result[2]['population'].to_numpy())
+        return result if return_centroids else (None,) + tuple(result[1:])
+
+    store = _store_for(resolution, backend, store)
+    pool, allocation = _strategy_allocation(
+        total_count, resolution, method, min_per_country, max_per_country, threshold, fixed_country, fixed_count,
+        countries, store,
+    )
+    query = (lambda c, l: query_sqlite(resolution, c, l)) if store is None else store.query
+    backfill = _backfill(query, pool, allocation, total_count, max_per_country)
+    limits = _selection_limits(allocation, urban_fraction)
+    df = query(list(limits), limits)
+
+    random_state = None if seed is None else np.random.RandomState(seed)
+    selected = df.iloc[select_rows(df, allocation, urban_fraction, None, random_state, rural_mode)]
+    if len(backfill):
+        selected = pd.concat([selected, backfill], ignore_index=True) if len(selected) else backfill
+    final_df = _finish_selection(selected.copy())
+    allocation = _with_backfill(allocation, backfill)
+
+    if plot:
+        h3raster.folium_plot_cells(final_df['h3'].tolist(), final_df['population'].to_numpy())
+
+    centroids = list(zip(final_df['lat'].tolist(), final_df['lng'].tolist())) if return_centroids else None
+    return centroids, allocation.to_dict(), final_df
+
+def strategy_cache_key(cache, total_count, resolution, method='population', min_per_country=0, threshold=None,
+                       urban_fraction=1.0, fixed_country=None, fixed_count=None, countries=COUNTRIES,
+                       backend='sqlite', max_per_country=None, seed=None, rural_mode='uniform'):
+    """
+    Key under which get_top_centroids_by_strategy caches a selection in `cache`,
+    or None for selections that are never cached (a random part without a seed).
+    The key includes data_version(), so rebuilding the table changes it.
+    """
+    if urban_fraction < 1 and seed is None:
+        return None
+    return cache.key(
+        data=data_version(resolution, backend), total_count=total_count, resolution=resolution, method=method,
+        min_per_country=min_per_country, max_per_country=max_per_country, threshold=threshold,
+        urban_fraction=urban_fraction, fixed_country=fixed_country, fixed_count=fixed_count,
+        countries=list(countries), seed=seed, rural_mode=rural_mode,
+    )
+
+def stream_top_centroids_by_strategy(total_count, resolution, method='population', min_per_country=0,
+                                     threshold=None, urban_fraction=1.0, fixed_country=None, fixed_count=None,
+                                     countries=COUNTRIES, store=None, backend='sqlite', max_per_country=None,
+                                     seed=None, rural_mode='uniform'):
+    """
+    Same selection as get_top_centroids_by_strategy, produced one country at a time.
+
+    The allocation is computed up front; the cells are then read and selected
+    per country as the returned iterator is consumed, so peak memory follows
+    the largest single country rather than the whole selection. Hexes needed to
+    backfill a shortfall come last. With the same seed the selected hexes match
+    get_top_centroids_by_strategy.
+
+    Parameters:
+    - Same as get_top_centroids_by_strategy.
+
+    Returns:
+    - Tuple:
+        1. Dictionary {country: count_of_hexes}.
+        2. Iterator of DataFrames with columns ['country', 'h3', 'lat', 'lng', 'population', 'utc_offset'].
+    """
+    store = _store_for(resolution, backend, store)
+    pool, allocation = _strategy_allocation(
+        total_count, resolution, method, min_per_country, max_per_country, threshold, fixed_country, fixed_count,
+        countries, store,
+    )
+    query = (lambda c, l: query_sqlite(resolution, c, l)) if store is None else store.query
+    backfill = _backfill(query, pool, allocation, total_count, max_per_country)
+    limits = _selection_limits(allocation, urban_fraction)
+    random_state = None if seed is None else np.random.RandomState(seed)
+
+    def chunks():
+        for country, n in allocation.items():
+            if n <= 0:
+                continue
+            df = query([country], {country: limits[country]})
+            rows = df.iloc[select_rows(df, {country: n}, urban_fraction, None, random_state, rural_mode)]
+            yield _finish_selection(rows.copy())
+
+        if len(backfill):
+            yield _finish_selection(backfill.copy())
+
+    return _with_backfill(allocation, backfill).to_dict(), chunks()
+
+def _strategy_allocation(total_count, resolution, method, min_per_country, max_per_country, threshold, fixed_country,
+                         fixed_count, countries, store):
+    """
+    Candidate countries and per-country counts of a strategy selection.
+    """
+    if store is not None and store.resolution != resolution:
+        raise ValueError(f"Store holds resolution {store.resolution}, not {resolution}")
+
+    totals = country_totals(resolution, countries) if store is None else store.country_totals(countries)
+    pool = totals.index.tolist()
 
-    country_pop = df.groupby('country')['population'].sum()
+    country_pop = totals['population']
     countries = country_pop.index.tolist()
 
     if method == 'population':
@@ -237,59 +590,131 @@ def get_top_centroids_by_strategy(total_count, resolution, method='population',
     else:
         raise ValueError(f"Unknown method '{method}'")
 
+    fixed = None
     if fixed_country and fixed_count is not None:
         if fixed_country not in countries:
             raise ValueError(f"{fixed_country} not found in data")
-        remaining_total = total_count - fixed_count
-        other_weights = weights.drop(fixed_country)
-        allocation = (other_weights / other_weights.sum() * remaining_total).apply(math.floor)
-        allocation = allocation.apply(lambda x: max(min_per_country, x))
-        while allocation.sum() < remaining_total:
-            extra_country = ((other_weights / other_weights.sum() * remaining_total) - allocation).idxmax()
-            allocation.loc[extra_country] += 1
-        allocation[fixed_country] = fixed_count
-    else:
-        allocation = (weights / weights.sum() * total_count).apply(math.floor)
-        allocation = allocation.apply(lambda x: max(min_per_country, x))
-        while allocation.sum() < total_count:
-            extra_country = ((weights / weights.sum() * total_count) - allocation).idxmax()
-            allocation.loc[extra_country] += 1
-
+        fixed = {fixed_country: fixed_count}
 
-    selected_rows = []
-    used_h3 = set()
+    allocation = allocate(weights, total_count, minimum=min_per_country, maximum=max_per_country,
+                          capacity=totals['cells'], fixed=fixed)
+    if fixed:
+        # The fixed country is listed last, as it always has been.
+        allocation = pd.concat([allocation.drop(fixed_country), allocation[[fixed_country]]])
+    return pool, allocation
 
-    for country, n in allocation.items():
-        country_df = df[df['country'] == country].sort_values(by='population', ascending=False)
-        urban_count = math.floor(n * urban_fraction)
-        rural_count = n - urban_count
-
-        chosen_rows = country_df.head(urban_count)
-        if rural_count > 0:
-            rural_pool = country_df.iloc[urban_count:]
-            if not rural_pool.empty:
-                rural_sample = rural_pool.sample(min(rural_count, len(rural_pool)))
-                chosen_rows = pd.concat([chosen_rows, rural_sample])
-
-        used_h3.update(chosen_rows['h3'])
-        selected_rows.append(chosen_rows)
+def _selection_limits(allocation, urban_fraction):
+    """
+    Rows to read per allocated country: its urban head, or its whole pool when
+    part of it is sampled at random.
+    """
+    limits = {}
+    for c, n in allocation.items():
+        n = int(n)
+        if n > 0:
+            limits[c] = None if n - math.floor(n * urban_fraction) > 0 else n
+    return limits
+
+def _backfill(query, pool, allocation, total_count, max_per_country):
+    """
+    Most populous cells of the countries left out of the allocation, filling
+    what the allocation falls short of total_count.
+
+    allocate() already fills every allocated country up to its capacity or
+    maximum before falling short, and a fixed country keeps its count, so only
+    countries without an allocation (e.g. below the threshold) can make up the
+    rest, each up to max_per_country. Their cells are untouched by the random
+    part of the selection, so the backfill is known before any cell is selected.
+    """
+    shortfall = int(total_count) - int(allocation.sum())
+    spare = [c for c in pool if c not in allocation.index]
+    if shortfall <= 0 or not spare:
+        return pd.DataFrame()
+    limit = shortfall if max_per_country is None else min(shortfall, int(max_per_country))
+    df = query(spare, limit)
+    return df.iloc[descending_order(df['population'].to_numpy())[:shortfall]]
+
+def _with_backfill(allocation, backfill):
+    """
+    The allocation plus the backfilled countries' counts, so it matches the selected rows.
+    """
+    if not len(backfill):
+        return allocation
+    return pd.concat([allocation, backfill['country'].value_counts(sort=False).astype(allocation.dtype)])
 
-    final_df = pd.concat(selected_rows).copy()
+def _finish_selection(df):
+    """
+    Add lat/lng and utc_offset where the source lacks them and format h3 as hex strings.
+    """
+    if 'lat' not in df:
+        df['lat'], df['lng'] = h3raster.cells_to_latlngs(df['h3'].to_numpy())
+    df = _ensure_timezone(df)
+    df['h3'] = h3raster.cells_to_str(df['h3'].to_numpy())
+    return df[SELECTION_COLUMNS]
+
+def get_top_centroids_in_region(resolution, count=None, lat=None, lng=None, k=0, polygon=None, zip_codes=None,
+                                cells=None, plot=False, store=None, backend='sqlite', data_dir=None,
+                                return_centroids=True):
+    """
+    Select the most populated hexes inside a region instead of by country.
 
-    if len(final_df) < total_count:
-        missing = total_count - len(final_df)
-        remaining_pool = df[~df['h3'].isin(used_h3)].sort_values(by='population', ascending=False)
-        if not remaining_pool.empty:
-            extra_rows = remaining_pool.head(missing)
-            final_df = pd.concat([final_df, extra_rows])
+    The region is turned into its cells at `resolution` (h3raster.region_cells)
+    and those are looked up by their integer keys: joined to the hex table on
+    its primary key in SQLite (query_cells_sqlite), or by binary search in a
+    ColumnStore. Only cells with population data and a country are returned.
 
-    final_df['lat'], final_df['lng'] = zip(*h3raster.h3list_to_centroids(final_df['h3'].tolist()))
-    h3_list = final_df['h3'].tolist()
+    Parameters:
+    - resolution: The H3 resolution of the population table to read.
+    - count: Number of hexes to return, most populated first; None returns all.
+    - lat, lng, k: A k-ring of radius k cells around a point.
+    - polygon: A polygon region, see h3raster.region_cells().
+    - zip_codes: One or more ZIP codes.
+    - cells: The region's cells at `resolution`, instead of one of the regions above.
+    - plot: If True, plot the hexes on a Folium map. (default = False)
+    - store: Optional columnstore.ColumnStore for this resolution to read from instead of SQLite.
+    - backend: 'sqlite' (default) or 'snapshot'. Ignored when store is given.
+    - data_dir: Optional base directory for the ZIP shapefile.
+    - return_centroids: Build the list of (lat, lon) tuples; with False the first item of the result is None.
 
-    final_df = append_timezone(final_df)
+    Returns:
+    - Tuple:
+        1. List of (lat, lon) tuples of selected hexes, or None.
+        2. Dictionary with 'region_cells' (cells in the region), 'cells' and
+           'population' (cells with data and their total population),
+           'selected_cells' and 'selected_population' (the returned hexes) and
+           'countries' ({country: count_of_hexes} of the returned hexes).
+        3. DataFrame with columns ['country', 'h3', 'lat', 'lng', 'population', 'utc_offset'] of selected hexes.
+    """
+    if count is not None and count < 0:
+        raise ValueError(f"count must be at least 0, got {count}")
+    if cells is None:
+        cells = h3raster.region_cells(resolution, lat, lng, k, polygon, zip_codes, data_dir=data_dir)
+    elif lat is not None or lng is not None or polygon is not None or zip_codes is not None:
+        raise ValueError("Give either cells or a region, not both")
+    else:
+        cells = np.unique(h3raster.cells_to_int(cells))
+        if len(cells) and (h3raster.cells_resolution(cells) != resolution).any():
+            raise ValueError(f"Region cells must be at resolution {resolution}")
+
+    store = _store_for(resolution, backend, store)
+    if store is not None and store.resolution != resolution:
+        raise ValueError(f"Store holds resolution {store.resolution}, not {resolution}")
+    if store is None:
+        found, population, df = query_cells_sqlite(resolution, cells, count)
+    else:
+        rows = store.cell_rows(cells)
+        found, population = len(rows), float(store.population[rows].sum(dtype=np.float64))
+        rows = rows[np.lexsort((store.h3[rows], -store.population[rows]))][:count]
+        df = store.frame(rows)
 
+    summary = {'region_cells': len(cells), 'cells': int(found), 'population': float(population)}
+    final_df = _finish_selection(df)
+    summary['selected_cells'] = len(final_df)
+    summary['selected_population'] = float(final_df['population'].sum())
+    summary['countries'] = final_df['country'].value_counts().to_dict()
 
     if plot:
-        h3raster.folium_plot_cells(h3_list)
+        h3raster.folium_plot_cells(final_df['h3'].tolist(), final_df['population'].to_numpy())
 
-    return h3raster.h3list_to_centroids(h3_list), allocation.to_dict(), final_df[['country', 'h3', 'lat', 'lng', 'population', 'utc_offset']]
\ No newline at end of file
+    centroids = list(zip(final_df['lat'].tolist(), final_df['lng'].tolist())) if return_centroids else None
+    return centroids, summary, final_df
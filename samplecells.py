@@ -1,17 +1,58 @@
 import argparse
+import itertools
+import json
 import math
 import pandas as pd
 import numpy as np
 import h3raster
-from queries import get_top_centroids_by_strategy
+from cache import CACHE_DIR, ResultCache
+from queries import (
+    get_top_centroids_by_strategy, get_top_centroids_in_region, stream_top_centroids_by_strategy, strategy_cache_key,
+)
+
+def region(args):
+    """
+    Select the top total_count hexes (all of them when it is 0) of a --near, --polygon or --zips region.
+    """
+    polygon = None
+    if args.polygon:
+        with open(args.polygon) as f:
+            polygon = json.load(f)
+    lat, lng = args.near if args.near else (None, None)
+    _, summary, df = get_top_centroids_in_region(
+        args.resolution, args.total_count or None, lat=lat, lng=lng, k=args.k, polygon=polygon,
+        zip_codes=args.zips, backend=args.backend, plot=args.plot and not args.map, return_centroids=False,
+    )
+
+    print(f"\nRegion: {summary['region_cells']:,} cells, {summary['cells']:,} with population data, "
+          f"population {summary['population']:,.0f}")
+    print(f"Selected: {summary['selected_cells']:,} hexes, population {summary['selected_population']:,.0f}")
+    print("\nPreview of DataFrame:")
+    print(df.head())
+
+    output = args.output or args.output_csv
+    if output:
+        from output import output_format, write_chunks
+
+        fmt = output_format(args.output) if args.output else "csv"
+        write_chunks([df], output, fmt, args.geometry)
+        print(f"\nWrote {len(df):,} hexes to {output}")
+    if args.map:
+        h3raster.folium_plot_cells(df["h3"].tolist(), df["population"].to_numpy(), args.map)
+        print(f"\nMap saved to {args.map}")
+    if args.png:
+        h3raster.plot_cells_png(df["h3"].tolist(), args.png, df["population"].to_numpy())
+        print(f"\nImage saved to {args.png}")
 
 def main():
     parser = argparse.ArgumentParser(
         description="Select top populated H3 hexes by allocation strategy."
     )
 
-    parser.add_argument("total_count", type=int, help="Total number of hexes to select.")
-    parser.add_argument("resolution", type=int, help="H3 resolution (e.g., 6 or 8).")
+    parser.add_argument(
+        "total_count", type=int, nargs="?", help="Total number of hexes to select (0 with a region: all of its hexes)."
+    )
+    parser.add_argument("resolution", type=int, nargs="?", help="H3 resolution (e.g., 6 or 8).")
 
     parser.add_argument(
         "--method",
@@ -25,6 +66,12 @@ def main():
         default=0,
         help="Minimum hexes per country (default: 0)."
     )
+    parser.add_argument(
+        "--max-per-country",
+        type=int,
+        default=None,
+        help="Maximum hexes per country (default: no limit)."
+    )
     parser.add_argument(
         "--threshold",
         type=int,
@@ -37,11 +84,37 @@ def main():
         default=1.0,
         help="Fraction from top-pop hexes (default: 1.0)."
     )
+    parser.add_argument(
+        "--rural-mode",
+        choices=["uniform", "weighted", "stratified"],
+        default="uniform",
+        help="How the non-urban hexes are sampled: uniformly, weighted by population, "
+             "or evenly across population deciles (default: uniform)."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed, makes the non-urban sample reproducible."
+    )
     parser.add_argument(
         "--plot",
         action="store_true",
         help="If set, plot the selected hexes on a Folium map."
     )
+    parser.add_argument(
+        "--map",
+        type=str,
+        default=None,
+        help="Write the selected hexes to this HTML map (coloured by population, level of detail "
+             "by zoom) instead of opening a browser."
+    )
+    parser.add_argument(
+        "--png",
+        type=str,
+        default=None,
+        help="Render the selected hexes to this PNG file, coloured by population; needs no display."
+    )
     parser.add_argument(
         "--fixed-country",
         type=str,
@@ -54,6 +127,29 @@ def main():
         default=None,
         help="Number of hexes to assign to fixed_country."
     )
+    parser.add_argument(
+        "--backend",
+        choices=["sqlite", "snapshot"],
+        default="sqlite",
+        help="Read from the SQLite database or its memory-mapped snapshot (default: sqlite)."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always recompute instead of reusing a cached result."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=str(CACHE_DIR),
+        help=f"Directory of the result cache (default: {CACHE_DIR})."
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=float,
+        default=512,
+        help="Maximum size of the result cache; least recently used results are evicted (default: 512)."
+    )
     parser.add_argument(
         "--output-csv",
         type=str,
@@ -61,30 +157,183 @@ def main():
         help="File path to save the output DataFrame as CSV."
     )
 
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Stream the selection, one country at a time, to a .csv, .parquet (needs pyarrow) "
+             "or newline-delimited GeoJSON (.ndjson, .geojsonl) file."
+    )
+    parser.add_argument(
+        "--geometry",
+        choices=["point", "polygon"],
+        default="point",
+        help="Feature geometry of GeoJSON output: cell centroid or hexagon (default: point)."
+    )
+    parser.add_argument(
+        "--near",
+        type=float,
+        nargs=2,
+        metavar=("LAT", "LNG"),
+        default=None,
+        help="Select from the k-ring around this point instead of by country (see --k)."
+    )
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=10,
+        help="Radius of the --near region in cells (default: 10)."
+    )
+    parser.add_argument(
+        "--polygon",
+        type=str,
+        default=None,
+        help="Select from the cells inside the polygons of this GeoJSON file instead of by country."
+    )
+    parser.add_argument(
+        "--zips",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Select from the cells of these ZIP codes instead of by country."
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=str,
+        default=None,
+        help="Run every parameter set in a JSON, CSV or YAML file; the other options are their defaults."
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="scenarios",
+        help="Directory for the per-scenario outputs and summary.csv (default: scenarios)."
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Per-scenario output format; parquet is partitioned by country and needs pyarrow (default: csv)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes running scenarios in parallel (default: number of CPUs)."
+    )
+    parser.add_argument(
+        "--scenario-png",
+        action="store_true",
+        help="Also render each scenario's hexes to <name>.png in the output directory."
+    )
+
     args = parser.parse_args()
 
-    centroids, allocation, df = get_top_centroids_by_strategy(
+    if args.output and args.output_csv:
+        parser.error("give only one of --output and --output-csv")
+    if args.scenarios:
+        from batch import SUMMARY_FILE, load_scenarios, run_scenarios
+
+        defaults = {
+            "total_count": args.total_count,
+            "resolution": args.resolution,
+            "method": args.method,
+            "min_per_country": args.min_per_country,
+            "max_per_country": args.max_per_country,
+            "threshold": args.threshold,
+            "urban_fraction": args.urban_fraction,
+            "fixed_country": args.fixed_country,
+            "fixed_count": args.fixed_count,
+            "seed": args.seed,
+            "rural_mode": args.rural_mode,
+        }
+        scenarios = load_scenarios(args.scenarios, {k: v for k, v in defaults.items() if v is not None})
+        summary = run_scenarios(
+            scenarios, args.output_dir, args.workers, args.backend, args.output_format, png=args.scenario_png
+        )
+        print(summary.reindex(columns=["name", "cells", "population", "seconds", "error"]).to_string(index=False))
+        print(f"\nWrote {len(summary):,} scenarios and {SUMMARY_FILE} to {args.output_dir}")
+        return
+
+    if args.total_count is None or args.resolution is None:
+        parser.error("total_count and resolution are required unless --scenarios is given")
+    if sum(x is not None for x in (args.near, args.polygon, args.zips)) > 1:
+        parser.error("give only one of --near, --polygon and --zips")
+    if args.near or args.polygon or args.zips:
+        region(args)
+        return
+    params = dict(
         total_count=args.total_count,
         resolution=args.resolution,
         method=args.method,
         min_per_country=args.min_per_country,
+        max_per_country=args.max_per_country,
         threshold=args.threshold,
         urban_fraction=args.urban_fraction,
-        plot=args.plot,
+        seed=args.seed,
+        rural_mode=args.rural_mode,
         fixed_country=args.fixed_country,
-        fixed_count=args.fixed_count
+        fixed_count=args.fixed_count,
+        backend=args.backend,
     )
 
+    output = args.output or args.output_csv
+    cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_size_mb * 2**20)
+    if output:
+        from output import output_format, write_chunks
+
+        fmt = output_format(args.output) if args.output else "csv"
+        key = None if cache is None else strategy_cache_key(cache, **params)
+        cached = None if key is None else cache.get(key)
+        if cached is not None:
+            _, allocation, df = cached
+            chunks = iter([df])
+        else:
+            # Stream to the file country by country instead of building the whole selection in memory.
+            allocation, chunks = stream_top_centroids_by_strategy(**params)
+    else:
+        _, allocation, df = get_top_centroids_by_strategy(
+            **params, plot=args.plot and not args.map, cache=cache, return_centroids=False
+        )
+
     print("\nAllocation by country:")
     for country, count in allocation.items():
         print(f"{country}: {count}")
 
+    if output:
+        first = next(chunks, None)
+        if first is not None:
+            print("\nPreview of DataFrame:")
+            print(first.head())
+            chunks = itertools.chain([first], chunks)
+        plotted = ([], [])
+
+        def keep_cells(chunks):
+            for chunk in chunks:
+                plotted[0].extend(chunk["h3"].tolist())
+                plotted[1].extend(chunk["population"].tolist())
+                yield chunk
+
+        if args.plot or args.map or args.png:
+            chunks = keep_cells(chunks)
+        written = write_chunks(chunks, output, fmt, args.geometry)
+        print(f"\nWrote {written:,} hexes to {output}")
+        if args.plot or args.map:
+            h3raster.folium_plot_cells(plotted[0], plotted[1], args.map)
+        if args.png:
+            h3raster.plot_cells_png(plotted[0], args.png, plotted[1])
+            print(f"\nImage saved to {args.png}")
+        return
+
     print("\nPreview of DataFrame:")
     print(df.head())
 
-    if args.output_csv:
-        df.to_csv(args.output_csv, index=False)
-        print(f"\nDataFrame saved to {args.output_csv}")
+    if args.map:
+        h3raster.folium_plot_cells(df["h3"].tolist(), df["population"].to_numpy(), args.map)
+        print(f"\nMap saved to {args.map}")
+    if args.png:
+        h3raster.plot_cells_png(df["h3"].tolist(), args.png, df["population"].to_numpy())
+        print(f"\nImage saved to {args.png}")
 
 if __name__ == "__main__":
     main()
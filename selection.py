@@ -0,0 +1,157 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+RURAL_MODES = ("uniform", "weighted", "stratified")
+RURAL_STRATA = 10
+
+
+def descending_order(values):
+    """
+    Positions that sort `values` in descending order, NaNs last.
+
+    Reproduces DataFrame.sort_values(ascending=False) with its default quicksort,
+    including the order it leaves tied values in, so selections match the ones
+    made with per-country sort_values() calls.
+    """
+    values = np.asarray(values)
+    mask = pd.isna(values)
+    positions = np.arange(len(values))
+    valid = positions[~mask][::-1]
+    order = valid[values[valid].argsort(kind="quicksort")][::-1]
+    return np.concatenate([order, positions[mask]])
+
+
+def country_groups(countries):
+    """
+    Group rows by country with one stable sort.
+
+    Parameters:
+    - countries: Array of country codes, one per row (None/NaN allowed).
+    Returns:
+    - Tuple (order, starts, positions): `order` lists row positions grouped by
+      country, each group in original row order; group i is
+      order[starts[i]:starts[i + 1]] and positions maps a country to i.
+    """
+    codes, uniques = pd.factorize(np.asarray(countries, dtype=object))
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return order, starts, {country: i for i, country in enumerate(uniques.tolist())}
+
+
+def sample_rural(rows, population, k, mode="uniform", random_state=None):
+    """
+    Draw k of `rows` without replacement.
+
+    Modes:
+    - 'uniform': every row equally likely, via random_state.choice(len(rows), k,
+      replace=False) exactly as DataFrame.sample draws.
+    - 'weighted': probability proportional to population, by Efraimidis-Spirakis
+      keys log(u) / population; the k largest keys are the sample, returned in
+      draw order. Zero-population rows are only drawn, uniformly, once every
+      populated row has been taken.
+    - 'stratified': rows (sorted by population, descending) are split into
+      RURAL_STRATA equal-size population deciles, each gets its whole share of k
+      and the leftover draws go to strata picked with probability proportional
+      to their fractional share; each stratum is then sampled uniformly.
+
+    Parameters:
+    - rows: Row positions, sorted by population descending for 'stratified'.
+    - population: Population of each entry of rows.
+    - k: Sample size, at most len(rows).
+    - mode: One of RURAL_MODES.
+    - random_state: np.random, a RandomState or a Generator; defaults to np.random.
+    Returns:
+    - Array of k row positions.
+    """
+    random_state = np.random if random_state is None else random_state
+    if mode == "uniform":
+        return rows[random_state.choice(len(rows), k, replace=False)]
+
+    if mode == "weighted":
+        population = np.asarray(population, dtype=np.float64)
+        populated = np.flatnonzero(population > 0)
+        with np.errstate(divide="ignore"):
+            keys = np.log(random_state.random(len(populated))) / population[populated]
+        if k < len(populated):
+            top = np.argpartition(-keys, k - 1)[:k]
+            return rows[populated[top[np.argsort(-keys[top], kind="stable")]]]
+        drawn = populated[np.argsort(-keys, kind="stable")]
+        empty = np.flatnonzero(~(population > 0))
+        rest = empty[random_state.choice(len(empty), k - len(drawn), replace=False)]
+        return rows[np.concatenate([drawn, rest])]
+
+    if mode == "stratified":
+        bounds = np.linspace(0, len(rows), RURAL_STRATA + 1).round().astype(np.int64)
+        sizes = np.diff(bounds)
+        quotas = k * sizes / max(len(rows), 1)
+        counts = np.floor(quotas).astype(np.int64)
+        extra = k - int(counts.sum())
+        if extra > 0:
+            remainders = quotas - counts
+            counts[random_state.choice(RURAL_STRATA, extra, replace=False, p=remainders / remainders.sum())] += 1
+        picks = [
+            bounds[i] + random_state.choice(sizes[i], counts[i], replace=False)
+            for i in range(RURAL_STRATA) if counts[i]
+        ]
+        return rows[np.concatenate(picks)] if picks else rows[:0]
+
+    raise ValueError(f"Unknown rural_mode '{mode}', expected one of {RURAL_MODES}")
+
+
+def select_rows(df, allocation, urban_fraction=1.0, total_count=None, random_state=None, rural_mode="uniform"):
+    """
+    Pick each country's allocated hexes from a population table in one grouped pass.
+
+    The table is grouped by country once (country_groups); every country then
+    takes its top floor(n * urban_fraction) rows by population and samples the
+    rest without replacement from the remaining rows of its group (sample_rural),
+    all by index arithmetic on NumPy arrays. If fewer than total_count rows were
+    chosen, the most populous unchosen rows of the whole table fill the gap.
+
+    In 'uniform' mode and with the same random state this returns the same rows,
+    in the same order, as filtering df per country, sort_values, head and
+    DataFrame.sample did.
+
+    Parameters:
+    - df: DataFrame with 'country' and 'population' columns.
+    - allocation: pd.Series or dict {country: count}, in the order countries are taken.
+    - urban_fraction: Share of each country's count taken from its top rows.
+    - total_count: Backfill target; None disables backfill.
+    - random_state: np.random, a RandomState or a Generator; defaults to the
+                    global np.random state.
+    - rural_mode: How the rural share is sampled, one of RURAL_MODES.
+    Returns:
+    - int64 array of row positions into df.
+    """
+    if rural_mode not in RURAL_MODES:
+        raise ValueError(f"Unknown rural_mode '{rural_mode}', expected one of {RURAL_MODES}")
+    population = df['population'].to_numpy()
+    order, starts, positions = country_groups(df['country'].to_numpy(dtype=object))
+
+    chosen = []
+    for country, n in dict(allocation).items():
+        group = positions.get(country)
+        rows = order[starts[group]:starts[group + 1]] if group is not None else np.empty(0, dtype=np.int64)
+        rows = rows[descending_order(population[rows])]
+
+        urban_count = math.floor(n * urban_fraction)
+        rural_count = n - urban_count
+        chosen.append(rows[:urban_count])
+        if rural_count > 0:
+            pool = rows[urban_count:]
+            if len(pool):
+                k = min(rural_count, len(pool))
+                chosen.append(sample_rural(pool, population[pool], k, rural_mode, random_state))
+
+    selected = np.concatenate(chosen).astype(np.int64) if chosen else np.empty(0, dtype=np.int64)
+
+    if total_count is not None and len(selected) < total_count:
+        remaining = np.ones(len(df), dtype=bool)
+        remaining[selected] = False
+        rest = np.flatnonzero(remaining)
+        if len(rest):
+            extra = rest[descending_order(population[rest])][:total_count - len(selected)]
+            selected = np.concatenate([selected, extra])
+    return selected
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import queries
+from columnstore import ColumnStore, SNAPSHOT_MANIFEST
+from params import parse_region, parse_select
+
+
+def file_stamp(path):
+    """Modification time and size of a file, used to detect rebuilds; None if it is missing."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class StoreCache:
+    """
+    Warm ColumnStores per resolution, read from the SQLite database or, with
+    backend='snapshot', memory-mapped from the snapshots under snapshot_dir.
+
+    A resolution is loaded on its first request (or up front with preload()).
+    When the database file (or snapshot manifest) changes, the next request
+    starts a reload in a background thread and keeps being served from the old
+    store until the new one is swapped in, so a rebuild never stalls requests. A failed reload (for
+    example while populate_db is halfway through rewriting a table) keeps the
+    old store and is retried on a later request.
+    """
+
+    def __init__(self, db_path, backend="sqlite", snapshot_dir=None):
+        if backend not in queries.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {queries.BACKENDS}")
+        self.db_path = str(db_path)
+        self.backend = backend
+        self.snapshot_dir = queries.SNAPSHOT_DIR if snapshot_dir is None else str(snapshot_dir)
+        self._stores = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def _loading_lock(self, resolution):
+        with self._lock:
+            return self._loading.setdefault(resolution, threading.Lock())
+
+    def _snapshot(self, resolution):
+        return os.path.join(self.snapshot_dir, f"r{int(resolution)}")
+
+    def _stamp(self, resolution):
+        if self.backend == "snapshot":
+            return file_stamp(os.path.join(self._snapshot(resolution), SNAPSHOT_MANIFEST))
+        return file_stamp(self.db_path)
+
+    def _load(self, resolution, stamp):
+        if self.backend == "snapshot":
+            store = ColumnStore.from_snapshot(self._snapshot(resolution))
+        else:
+            store = ColumnStore.from_sqlite(self.db_path, resolution)
+        with self._lock:
+            self._stores[resolution] = (stamp, store)
+        print(f"Loaded r{resolution}: {len(store):,} cells, {store.nbytes / 2**20:,.1f} MiB")
+        return store
+
+    def _reload(self, resolution, stamp, lock):
+        try:
+            self._load(resolution, stamp)
+        except Exception as e:
+            print(f"Reload of r{resolution} failed, serving the previous data: {e}")
+        finally:
+            lock.release()
+
+    def get(self, resolution):
+        """
+        Return the ColumnStore for a resolution, loading it on first use.
+        """
+        stamp = self._stamp(resolution)
+        with self._lock:
+            entry = self._stores.get(resolution)
+
+        if entry is None:
+            with self._loading_lock(resolution):
+                with self._lock:
+                    entry = self._stores.get(resolution)
+                if entry is None:
+                    return self._load(resolution, stamp)
+
+        if entry[0] != stamp:
+            lock = self._loading_lock(resolution)
+            if lock.acquire(blocking=False):
+                threading.Thread(target=self._reload, args=(resolution, stamp, lock), daemon=True).start()
+        return entry[1]
+
+    def preload(self, resolutions):
+        for resolution in resolutions:
+            self.get(resolution)
+
+    def loaded(self):
+        with self._lock:
+            return {resolution: len(store) for resolution, (_, store) in sorted(self._stores.items())}
+
+
+class SelectionHandler(BaseHTTPRequestHandler):
+    """
+    GET /health reports the loaded resolutions; POST /select takes a JSON object of
+    get_top_centroids_by_strategy parameters and returns the allocation and cells.
+    POST /region takes get_top_centroids_in_region parameters (a k-ring, a GeoJSON
+    polygon or ZIP codes) and returns the region's population totals and cells.
+    """
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        cache = self.server.cache
+        self._send(200, {"status": "ok", "backend": cache.backend, "db": cache.db_path, "resolutions": cache.loaded()})
+
+    def do_POST(self):
+        if self.path not in ("/select", "/region"):
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/region":
+                params = parse_region(payload)
+                store = self.server.cache.get(params["resolution"])
+                _, summary, df = queries.get_top_centroids_in_region(**params, store=store, return_centroids=False)
+            else:
+                params = parse_select(payload)
+                store = self.server.cache.get(params["resolution"])
+                _, allocation, df = queries.get_top_centroids_by_strategy(**params, store=store)
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+
+        if self.path == "/region":
+            summary["countries"] = {country: int(count) for country, count in summary["countries"].items()}
+            body = f'{{"summary": {json.dumps(summary)}, "cells": {df.to_json(orient="records")}}}'
+        else:
+            allocation = {country: int(count) for country, count in allocation.items()}
+            body = f'{{"allocation": {json.dumps(allocation)}, "cells": {df.to_json(orient="records")}}}'
+        self._send_raw(200, body.encode())
+
+    def _send(self, status, payload):
+        self._send_raw(status, json.dumps(payload).encode())
+
+    def _send_raw(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class SelectionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache, verbose=False):
+        super().__init__(address, SelectionHandler)
+        self.cache = cache
+        self.verbose = verbose
+
+
+def make_server(db_path=None, host="127.0.0.1", port=8765, resolutions=(), verbose=False, backend="sqlite",
+                snapshot_dir=None):
+    """
+    Create a threaded HTTP server answering selections from warm in-memory stores.
+
+    Parameters:
+    - db_path: Combined population database, defaults to queries.DB_PATH.
+    - host, port: Address to bind; port 0 picks a free port.
+    - resolutions: Resolutions to load before serving; others load on first request.
+    - verbose: Log every request.
+    - backend: 'sqlite' to load tables from the database, 'snapshot' to memory-map
+               the snapshots exported by `populate_db.py snapshot` (near-instant start).
+    - snapshot_dir: Snapshot root, defaults to queries.SNAPSHOT_DIR.
+    Returns:
+    - SelectionServer; call serve_forever() to run it.
+    """
+    cache = StoreCache(queries.DB_PATH if db_path is None else db_path, backend, snapshot_dir)
+    cache.preload(resolutions)
+    return SelectionServer((host, port), cache, verbose=verbose)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve hex selections over HTTP from warm in-memory tables.")
+    parser.add_argument("--db", default=None, help="Population database (default: queries.DB_PATH).")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765).")
+    parser.add_argument("--resolutions", type=int, nargs="*", default=[],
+                        help="Resolutions to load at startup, e.g. 6 8.")
+    parser.add_argument("--backend", choices=["sqlite", "snapshot"], default="sqlite",
+                        help="Load tables from SQLite or memory-map their snapshots (default: sqlite).")
+    parser.add_argument("--snapshot-dir", default=None, help="Snapshot root (default: queries.SNAPSHOT_DIR).")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args(argv)
+
+    server = make_server(
+        args.db, args.host, args.port, args.resolutions, args.verbose, args.backend, args.snapshot_dir
+    )
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pytz
+import shapely
+from h3.api import basic_int as h3_basic_int
+from timezonefinder import TimezoneFinder
+
+import h3raster
+
+TZ_LOOKUP_RESOLUTION = 6
+TZ_CACHE_SIZE = 1_000_000
+WINTER_DATE = datetime(2024, 1, 1)
+
+_finder = None
+
+
+def _timezone_finder():
+    global _finder
+    if _finder is None:
+        _finder = TimezoneFinder()
+    return _finder
+
+
+@lru_cache(maxsize=None)
+def standard_utc_offset(tz_name):
+    """
+    Standard (winter) UTC offset of a timezone in hours, or None for a missing name.
+    """
+    if not tz_name:
+        return None
+    return pytz.timezone(tz_name).utcoffset(WINTER_DATE).total_seconds() / 3600
+
+
+@lru_cache(maxsize=TZ_CACHE_SIZE)
+def cell_timezone(cell):
+    """
+    Timezone name at the centroid of an integer H3 cell, or None over open sea. Cached per cell.
+    """
+    lat, lng = h3_basic_int.cell_to_latlng(cell)
+    return _timezone_finder().timezone_at(lat=lat, lng=lng)
+
+
+@lru_cache(maxsize=None)
+def _zone_geometry(tz_name):
+    """
+    Prepared shapely MultiPolygon of a timezone, loaded once per zone.
+    """
+    polygons = _timezone_finder().get_geometry(tz_name=tz_name, coords_as_pairs=True)
+    geometry = shapely.MultiPolygon([(rings[0], rings[1:]) for rings in polygons])
+    shapely.prepare(geometry)
+    return geometry
+
+
+def cells_to_timezones(cells, lookup_resolution=TZ_LOOKUP_RESOLUTION):
+    """
+    Look up timezone names and standard UTC offsets for many H3 cells.
+
+    Cells finer than lookup_resolution share the timezone of their parent at that
+    resolution, so each distinct parent is resolved once (and cached across
+    calls). This trades exactness within a few km of timezone borders for speed;
+    exact_cells_to_timezones() resolves every cell at its own centroid.
+
+    Parameters:
+    - cells: Array-like of H3 cells as uint64 integers or hex strings.
+    - lookup_resolution: Resolution at which timezones are resolved.
+    Returns:
+    - Tuple (tz_names object array with None over sea, utc_offsets float64 array with NaN).
+    """
+    cells = h3raster.cells_to_int(cells)
+    if not len(cells):
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.float64)
+
+    keys = cells.copy()
+    coarse = h3raster.cells_resolution(cells) > lookup_resolution
+    keys[coarse] = h3raster.cells_to_parents(cells[coarse], lookup_resolution)
+
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    unique_names = np.array([cell_timezone(k) for k in unique_keys.tolist()], dtype=object)
+    unique_offsets = np.array([standard_utc_offset(n) for n in unique_names.tolist()], dtype=np.float64)
+    return unique_names[inverse], unique_offsets[inverse]
+
+
+def exact_cells_to_timezones(cells, parent_resolution=TZ_LOOKUP_RESOLUTION):
+    """
+    Timezone names and standard UTC offsets at the centroid of each H3 cell, as
+    stored in the hex tables.
+
+    Each cell first takes the timezone of its parent at parent_resolution (one
+    cached lookup per parent, as in cells_to_timezones()). All centroids are then
+    tested against the polygons of that zone in one vectorized call, and only
+    the cells that fall outside it, near a border, are looked up one by one,
+    without caching.
+
+    Parameters:
+    - cells: Array-like of H3 cells as uint64 integers or hex strings.
+    - parent_resolution: Resolution at which the candidate zone is resolved.
+    Returns:
+    - Tuple (tz_names object array with None over sea, utc_offsets float64 array with NaN).
+    """
+    cells = h3raster.cells_to_int(cells)
+    if not len(cells):
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.float64)
+
+    names, _ = cells_to_timezones(cells, parent_resolution)
+    lats, lngs = h3raster.cells_to_latlngs(cells)
+    outside = np.ones(len(cells), dtype=bool)
+    for tz_name in set(names.tolist()) - {None}:
+        members = np.flatnonzero(names == tz_name)
+        outside[members] = ~shapely.contains_xy(_zone_geometry(tz_name), lngs[members], lats[members])
+
+    finder = _timezone_finder()
+    names[outside] = [
+        finder.timezone_at(lat=lat, lng=lng) for lat, lng in zip(lats[outside].tolist(), lngs[outside].tolist())
+    ]
+    offsets = np.array([standard_utc_offset(n) for n in names.tolist()], dtype=np.float64)
+    return names, offsets
+
+
+def latlngs_to_timezones(lats, lngs, lookup_resolution=TZ_LOOKUP_RESOLUTION):
+    """
+    Timezone names and standard UTC offsets for arbitrary points, deduplicated by
+    the H3 cell at lookup_resolution that contains each point.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    cells = np.fromiter(
+        (h3_basic_int.latlng_to_cell(lat, lng, lookup_resolution) for lat, lng in zip(lats.tolist(), lngs.tolist())),
+        dtype=np.uint64,
+        count=len(lats),
+    )
+    return cells_to_timezones(cells, lookup_resolution)